@@ -1,12 +1,17 @@
 # -*- coding: utf-8 -*-
 
+from queue import Empty, Queue
 from threading import Thread
 import autoads.tools as tools
+from autoads.cloud_dedup import cloud_dedup
+from autoads.config import config
 from autoads.item_buffer import ItemBuffer
 from autoads.parser_control import AirSpiderParserControl
 from autoads.request import Request
+from autoads.request_journal import RequestJournal
 from autoads.log import log
 from autoads.memory_db import MemoryDB
+from autoads.task_counter import TaskCounter
 # import tracemalloc
 
 
@@ -24,10 +29,14 @@ class AirSpider(Thread):
 
         self._thread_count = thread_count
 
-        self._memory_db = MemoryDB()
+        # 未完成任务计数，覆盖请求队列、正在处理的请求和ItemBuffer中未入库的数据，归零即采集结束
+        self._task_counter = TaskCounter()
+        self._memory_db = MemoryDB(task_counter=self._task_counter)
         self._parser_controls = []
 
-        self._processing_requests = MemoryDB()
+        # 线程开始处理的请求，只用于在界面显示；不按ads_id绑定，也不计入任务数
+        self._processing_requests = Queue()
+        self._processing_count = 0
 
         for key, value in kwargs.items():
             self.__dict__[key] = value
@@ -44,9 +53,28 @@ class AirSpider(Thread):
         if not hasattr(self, 'grid_layout'):
             self.grid_layout = None
 
-        self._item_buffer = ItemBuffer(stop_event=self.stop_event)
+        if not hasattr(self, 'request_journal'):
+            self.request_journal = config.request_journal
+
+        # 请求日志按爬虫类名保存，线程名每次运行都不同
+        self._journal = RequestJournal(config.request_journal_path, self.__class__.__name__) if self.request_journal else None
+
+        self._item_buffer = ItemBuffer(stop_event=self.stop_event, task_counter=self._task_counter)
 
     def distribute_task(self):
+        if self._journal:
+            requests = self._journal.open()
+            if requests:
+                # 上次运行没有完成，直接恢复未完成的请求，不再重新读取和过滤输入文件
+                for request in requests:
+                    request.parser_name = self.name
+                    request.stop_event = self.stop_event  # 请求日志不保存stop_event
+                    self._memory_db.add(request)
+
+                log.info(f'从请求日志恢复了{len(requests)}个未完成的请求')
+                tools.send_message_to_ui(self.ms, self.ui, f'继续上次未完成的采集，恢复了{len(requests)}个请求')
+                return
+
         log.info(f'开始调用start_requests中的请求')
         # tools.send_message_to_ui(self.ms, self.ui, "开始调用start_requests中的请求")
         i = 0
@@ -55,6 +83,8 @@ class AirSpider(Thread):
                 raise ValueError("仅支持 yield Request")
 
             request.parser_name = request.parser_name or self.name
+            if self._journal:
+                self._journal.add(request)
             self._memory_db.add(request)
             i += 1
 
@@ -63,53 +93,50 @@ class AirSpider(Thread):
         # tools.send_message_to_ui(self.ms, self.ui, f'调用start_requests结束，共加入了{i}个请求')
 
     def all_thread_is_done(self):
-        # if hasattr(self, 'stop_event') and self.stop_event.isSet():
-        #     return True
-        
-        # Track if we've already shown stop message to avoid spamming
-        if not hasattr(self, '_stop_message_shown'):
-            self._stop_message_shown = False
-
-        for i in range(3):  # 降低偶然性, 因为各个环节不是并发的，很有可能当时状态为假，但检测下一条时该状态为真。一次检测很有可能遇到这种偶然性
-            # 检测 parser_control 状态
-            active_threads = 0
-            for parser_control in self._parser_controls:
-                if not parser_control.is_not_task():
-                    active_threads += 1
-            
-            if active_threads > 0:
-                if hasattr(self, 'stop_event') and self.stop_event and self.stop_event.isSet():
-                    if not self._stop_message_shown:
-                        tools.send_message_to_ui(self.ms, self.ui, f'正在终止 {active_threads} 个采集器，请稍候...')
-                        self._stop_message_shown = True
-                return False
-
-            # 检测 任务队列 状态
-            if not self._memory_db.empty():
-                if hasattr(self, 'stop_event') and self.stop_event and self.stop_event.isSet():
-                    if not self._stop_message_shown:
-                        tools.send_message_to_ui(self.ms, self.ui, f'正在清空请求库...')
-                        self._stop_message_shown = True
-                return False
-
-            # 检测 item_buffer 状态
-            if (
-                    self._item_buffer.get_items_count() > 0
-                    or self._item_buffer.is_adding_to_db()
-            ):
-                if hasattr(self, 'stop_event') and self.stop_event.isSet():
-                    if not self._stop_message_shown:
-                        tools.send_message_to_ui(self.ms, self.ui, f'还有{self._item_buffer.get_items_count()}条数据没有保存')
-                        self._stop_message_shown = True
-                return False
-
-            tools.delay_time(1)
-        # 跟踪内存分配情况
-        # snap_shot=tracemalloc.take_snapshot()
-        # top_stats=snap_shot.statistics('lineno')
-        # for stat in top_stats:
-        #     log.info(stat)
-        return True
+        """
+        请求队列、正在处理的请求及待入库的数据都已完成
+        :return:
+        """
+        if self._task_counter.is_done():
+            return True
+
+        if self.stop_event and self.stop_event.is_set():
+            # Track if we've already shown stop message to avoid spamming
+            if not hasattr(self, '_stop_message_shown'):
+                self._stop_message_shown = False
+
+            active_threads = len([parser_control for parser_control in self._parser_controls if parser_control.is_alive()])
+            if not self._stop_message_shown:
+                if active_threads:
+                    tools.send_message_to_ui(self.ms, self.ui, f'正在终止 {active_threads} 个采集器，请稍候...')
+                elif self._item_buffer.get_items_count() > 0:
+                    tools.send_message_to_ui(self.ms, self.ui, f'还有{self._item_buffer.get_items_count()}条数据没有保存')
+                self._stop_message_shown = True
+
+            # 采集线程都已退出且没有在入库的数据，剩下的计数是被清理掉的请求，直接结束
+            if not active_threads and not self._item_buffer.is_adding_to_db():
+                self._task_counter.reset()
+                return True
+
+        return False
+
+    def show_processing_requests(self):
+        """
+        获取历史请求库，实时显示到界面中
+        :return:
+        """
+        while True:
+            try:
+                requests = self._processing_requests.get_nowait()
+            except Empty:
+                break
+            self._processing_count += 1
+            if hasattr(self,'request_to_str') and callable(self.request_to_str):
+                tools.send_message_to_ui(self.ms, self.ui,
+                                         f'{self._processing_count}.{self.request_to_str(requests)}')
+            else:
+                tools.send_message_to_ui(self.ms, self.ui,
+                                         f'{self._processing_count}.<font color="#3900FF">{requests.url}\n</font>')
 
     def run(self):
         # print(f'threading.current_thread()={threading.current_thread().__class__.__name__}')
@@ -144,7 +171,8 @@ class AirSpider(Thread):
             parser_control = AirSpiderParserControl(self._memory_db, self._item_buffer, self._processing_requests,
                                                     ui=self.ui, ms=self.ms,
                                                     grid_layout=self.grid_layout, stop_event=self.stop_event,
-                                                    is_use_interval_timeout=is_use_interval_timeout)
+                                                    is_use_interval_timeout=is_use_interval_timeout,
+                                                    journal=self._journal)
             parser_control.add_parser(self)
             parser_control.start()
             self._parser_controls.append(parser_control)
@@ -155,27 +183,17 @@ class AirSpider(Thread):
 
         stop_message_send = False
 
-        precessed_req = 0
-
         while True:
             try:
-                if hasattr(self, 'stop_event') and self.stop_event and self.stop_event.isSet() and not stop_message_send:
+                if hasattr(self, 'stop_event') and self.stop_event and self.stop_event.is_set() and not stop_message_send:
                     tools.send_message_to_ui(self.ms, self.ui, "停止采集中...")
                     stop_message_send = True
 
-                # 获取历史请求库，实时显示到界面中
-                requests = self._processing_requests.get()
-                if requests:
-                    precessed_req += 1
-                    if hasattr(self,'request_to_str') and callable(self.request_to_str):
-                        tools.send_message_to_ui(self.ms, self.ui,
-                                                 f'{precessed_req}.{self.request_to_str(requests)}')
-                    else:
-                        tools.send_message_to_ui(self.ms, self.ui,
-                                                 f'{precessed_req}.<font color="#3900FF">{requests.url}\n</font>')
+                self.show_processing_requests()
 
+                # 任务计数归零时立即被唤醒，否则最多等待1秒刷新一次界面
+                self._task_counter.wait_done(timeout=1)
                 is_done = self.all_thread_is_done()
-                # print(f'is_done={is_done}')
                 if is_done:
                     # 停止 parser_controls
                     for parser_control in self._parser_controls:
@@ -184,11 +202,22 @@ class AirSpider(Thread):
                     # 关闭item_buffer
                     self._item_buffer.stop()
 
+                    # 推送还没同步到远程的云端去重标记，其他实例不再重复处理
+                    cloud_dedup.flush()
+
+                    # 停止时保留未完成的请求，下次启动时恢复；全部完成则删除请求日志
+                    if self._journal:
+                        if self.stop_event and self.stop_event.is_set():
+                            self._journal.close()
+                        else:
+                            self._journal.clear()
+
                     # 关闭webdirver
                     if Request.webdriver_pool:
                         Request.webdriver_pool.close()
 
                     log.info("无任务，爬虫结束")
+                    log.info(f"界面消息统计: {tools.ui_message_bus.get_stats()}")
 
                     tools.send_message_to_ui(self.ms, self.ui, f"无任务，采集结束")
                     if self.ms:
@@ -197,8 +226,7 @@ class AirSpider(Thread):
 
             except Exception as e:
                 log.exception(e)
-
-            tools.delay_time(1)  # 1秒钟检查一次爬虫状态
+                tools.delay_time(1)
 
         # 为了线程可重复start
         self._started.clear()
@@ -8,25 +8,127 @@ import os
 import sys
 import io
 import json
+import queue
 import traceback
 import functools
+import collections
 from datetime import datetime
 from loguru import logger
 import threading
 import atexit
 
+# In-memory views keep only the most recent entries, the full session goes to the JSONL spill file
+MAX_ACTIONS = 2000
+MAX_ERRORS = 500
+MAX_TERMINAL_LINES = 2000
+SPILL_QUEUE_SIZE = 10000  # entries waiting for the spill writer, more are dropped and counted
+SPILL_BATCH_SIZE = 1000
+
+_STOP = object()
+
+
+class RingBuffer(collections.deque):
+    """Fixed-size buffer that drops the oldest entries, supports slicing like a list"""
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(self)[index]
+        return super().__getitem__(index)
+
+
+class JsonlSpill:
+    """
+    Append entries to a JSONL file from a background thread
+    Callers never block: when the queue is full the entry is dropped and counted
+    """
+
+    def __init__(self, path, max_queue_size=SPILL_QUEUE_SIZE):
+        self.path = path
+        self.dropped = 0
+        self._file = open(path, 'a', encoding='utf-8')
+        self._queue = queue.Queue(max_queue_size)
+        self._thread = threading.Thread(target=self._run, name="app_log_spill", daemon=True)
+        self._thread.start()
+
+    def put(self, entry):
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            try:
+                while len(batch) < SPILL_BATCH_SIZE:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                pass
+
+            markers = []
+            stop = False
+            lines = []
+            for entry in batch:
+                if entry is _STOP:
+                    stop = True
+                elif isinstance(entry, threading.Event):
+                    markers.append(entry)
+                else:
+                    try:
+                        lines.append(json.dumps(entry, ensure_ascii=False, default=str) + "\n")
+                    except Exception:
+                        self.dropped += 1
+
+            try:
+                self._file.writelines(lines)
+                self._file.flush()
+            except Exception:
+                self.dropped += len(lines)
+
+            for marker in markers:
+                marker.set()
+            if stop:
+                return
+
+    def flush(self, timeout=5):
+        """Wait until everything queued so far is on disk"""
+        if not self._thread.is_alive():
+            return False
+        marker = threading.Event()
+        try:
+            self._queue.put(marker, timeout=timeout)
+        except queue.Full:
+            return False
+        return marker.wait(timeout)
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        self._file.close()
+
+    def __iter__(self):
+        """Stream entries back from the spill file"""
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue  # partial line from a crash
+
 
 class TeeOutput:
     """Capture stdout/stderr while still printing to console"""
-    def __init__(self, original_stream, log_buffer):
+    def __init__(self, original_stream, capture):
         self.original_stream = original_stream
-        self.log_buffer = log_buffer
+        self.capture = capture
+        self.stream_name = "stdout" if original_stream is sys.__stdout__ else "stderr"
     
     def write(self, message):
         if message.strip():  # Only log non-empty messages
-            self.log_buffer.append({
+            self.capture("terminal", {
                 "type": "TERMINAL",
-                "stream": "stdout" if self.original_stream == sys.__stdout__ else "stderr",
+                "stream": self.stream_name,
                 "message": message.rstrip(),
                 "timestamp": datetime.now().isoformat()
             })
@@ -70,14 +172,15 @@ class AppLogger:
         self.default_log_dir = './logs/'
         self.log_file = None
         self.json_log_file = None
-        self.actions = []
-        self.terminal_output = []
-        self.errors = []
+        self.spill_file = None
+        self._spill = None
+        self._capture_lock = threading.Lock()
         self.start_time = datetime.now()
         self.save_location = None  # User-chosen save location
         self._save_dialog_shown = False
         
         self._setup_logging()
+        self._setup_capture(self.default_log_dir)
         self._capture_terminal_output()
         self._log_session_start()
     
@@ -118,14 +221,78 @@ class AppLogger:
         
         logger.info(f"📝 日志系统初始化完成 | Log file: {self.log_file}")
     
+    def _setup_capture(self, log_dir, max_actions=MAX_ACTIONS, max_errors=MAX_ERRORS,
+                       max_terminal_lines=MAX_TERMINAL_LINES):
+        """Setup the in-memory ring buffers and the JSONL spill file of this session"""
+        with self._capture_lock:
+            if self._spill:
+                self._spill.close()
+
+            self.actions = RingBuffer(maxlen=max_actions)
+            self.errors = RingBuffer(maxlen=max_errors)
+            self.terminal_output = RingBuffer(maxlen=max_terminal_lines)
+            self._counts = {"action": 0, "error": 0, "terminal": 0}
+            self._event_counts = {}
+
+            self.spill_file = os.path.join(log_dir, f'session_{self.session_id}.jsonl')
+            try:
+                self._spill = JsonlSpill(self.spill_file)
+            except OSError as e:
+                # Without the spill file save_logs falls back to the ring buffers
+                self._spill = None
+                error = e
+            else:
+                error = None
+
+        if error:
+            logger.warning(f"Log spill file unavailable: {error}")
+
+    def _capture(self, kind, entry):
+        """Keep an entry in the ring buffers and queue it for the spill file"""
+        with self._capture_lock:
+            self._counts[kind] += 1
+            if kind == "terminal":
+                self.terminal_output.append(entry)
+            else:
+                if kind == "error":
+                    self.errors.append(entry)
+                self.actions.append(entry)
+                event_type = entry.get('event', 'UNKNOWN')
+                self._event_counts[event_type] = self._event_counts.get(event_type, 0) + 1
+
+            if self._spill:
+                self._spill.put({"kind": kind, **entry})
+
+    def _iter_entries(self, *kinds):
+        """Stream entries of the whole session, from the spill file when available"""
+        if self._spill:
+            self._spill.flush()
+            for entry in self._spill:
+                kind = entry.pop("kind", None)
+                if kind in kinds:
+                    yield entry
+        elif "terminal" in kinds:
+            yield from list(self.terminal_output)
+        elif "action" in kinds:
+            yield from list(self.actions)
+        else:
+            yield from list(self.errors)
+
+    def close(self):
+        """Flush and close the spill file"""
+        with self._capture_lock:
+            spill, self._spill = self._spill, None
+        if spill:
+            spill.close()
+
     def _capture_terminal_output(self):
         """Capture all stdout/stderr output"""
         # Only capture if streams are available (not in PyInstaller windowed mode)
         try:
             if sys.__stdout__ is not None and sys.stdout is not None:
-                sys.stdout = TeeOutput(sys.__stdout__, self.terminal_output)
+                sys.stdout = TeeOutput(sys.__stdout__, self._capture)
             if sys.__stderr__ is not None and sys.stderr is not None:
-                sys.stderr = TeeOutput(sys.__stderr__, self.terminal_output)
+                sys.stderr = TeeOutput(sys.__stderr__, self._capture)
             logger.info("📺 终端输出捕获已启动")
         except Exception as e:
             # In windowed mode, just skip terminal capture
@@ -152,7 +319,7 @@ class AppLogger:
             "user": os.environ.get('USER', os.environ.get('USERNAME', 'unknown'))
         }
         
-        self.actions.append(session_info)
+        self._capture("action", session_info)
         logger.info("=" * 80)
         logger.info(f"🚀 应用启动 | Session ID: {self.session_id}")
         logger.info(f"📍 系统: {platform.system()} {platform.release()} ({platform.machine()})")
@@ -175,7 +342,7 @@ class AppLogger:
             "thread_id": threading.current_thread().ident
         }
         
-        self.actions.append(action)
+        self._capture("action", action)
         
         status = "✅" if success else "❌"
         details_str = json.dumps(details, ensure_ascii=False) if details else ""
@@ -308,8 +475,7 @@ class AppLogger:
             error["exception_message"] = str(exception)
             error["traceback"] = traceback.format_exc()
         
-        self.errors.append(error)
-        self.actions.append(error)
+        self._capture("error", error)
         
         logger.error(f"❌ [{error_type}] {message}")
         if exception:
@@ -374,11 +540,9 @@ class AppLogger:
         end_time = datetime.now()
         duration = (end_time - self.start_time).total_seconds()
         
-        # Count events by type
-        event_counts = {}
-        for action in self.actions:
-            event_type = action.get('event', 'UNKNOWN')
-            event_counts[event_type] = event_counts.get(event_type, 0) + 1
+        with self._capture_lock:
+            counts = dict(self._counts)
+            event_counts = dict(self._event_counts)
         
         return {
             "session_id": self.session_id,
@@ -386,12 +550,14 @@ class AppLogger:
             "end_time": end_time.isoformat(),
             "duration_seconds": duration,
             "duration_formatted": f"{int(duration // 60)}m {int(duration % 60)}s",
-            "total_actions": len(self.actions),
-            "total_errors": len(self.errors),
-            "total_terminal_output": len(self.terminal_output),
+            "total_actions": counts["action"] + counts["error"],
+            "total_errors": counts["error"],
+            "total_terminal_output": counts["terminal"],
             "event_counts": event_counts,
+            "dropped_entries": self._spill.dropped if self._spill else 0,
             "log_file": self.log_file,
-            "json_log_file": self.json_log_file
+            "json_log_file": self.json_log_file,
+            "spill_file": self.spill_file if self._spill else None
         }
     
     def save_logs(self, save_path=None):
@@ -414,16 +580,19 @@ class AppLogger:
         
         summary = self.get_session_summary()
         
-        session_data = {
-            **summary,
-            "actions": self.actions,
-            "errors": self.errors,
-            "terminal_output": self.terminal_output
-        }
-        
-        # Save JSON log
+        # Save JSON log, entries are streamed one at a time so memory stays flat
         with open(json_file, 'w', encoding='utf-8') as f:
-            json.dump(session_data, f, ensure_ascii=False, indent=2)
+            f.write(json.dumps(summary, ensure_ascii=False, indent=2)[:-2])
+            for name, kinds in (("actions", ("action", "error")),
+                                ("errors", ("error",)),
+                                ("terminal_output", ("terminal",))):
+                f.write(f',\n  "{name}": [')
+                separator = "\n    "
+                for entry in self._iter_entries(*kinds):
+                    f.write(separator + json.dumps(entry, ensure_ascii=False, default=str))
+                    separator = ",\n    "
+                f.write("\n  ]" if separator != "\n    " else "]")
+            f.write("\n}\n")
         
         # Also write summary to text log
         with open(log_file, 'a', encoding='utf-8') as f:
@@ -443,7 +612,7 @@ class AppLogger:
             # Write terminal output
             f.write("\n📺 TERMINAL OUTPUT:\n")
             f.write("-" * 40 + "\n")
-            for entry in self.terminal_output:
+            for entry in self._iter_entries("terminal"):
                 f.write(f"[{entry['timestamp']}] [{entry['stream']}] {entry['message']}\n")
         
         logger.info(f"💾 日志已保存到: {save_path or self.default_log_dir}")
@@ -461,8 +630,8 @@ class AppLogger:
         return self.actions[-count:]
     
     def get_errors(self):
-        """Get all errors from this session"""
-        return self.errors
+        """Get the most recent errors of this session, all of them are in the spill file"""
+        return list(self.errors)
     
     def export_for_support(self, save_path=None):
         """Export logs in a format suitable for sending to support"""
@@ -482,18 +651,19 @@ class AppLogger:
             
             f.write("❌ ERRORS (错误):\n")
             f.write("-" * 40 + "\n")
-            if self.errors:
-                for error in self.errors:
-                    f.write(f"\n[{error['timestamp']}] {error['error_type']}: {error['message']}\n")
-                    if 'traceback' in error:
-                        f.write("Traceback:\n")
-                        f.write(error['traceback'] + "\n")
-            else:
+            has_errors = False
+            for error in self._iter_entries("error"):
+                has_errors = True
+                f.write(f"\n[{error['timestamp']}] {error['error_type']}: {error['message']}\n")
+                if 'traceback' in error:
+                    f.write("Traceback:\n")
+                    f.write(error['traceback'] + "\n")
+            if not has_errors:
                 f.write("No errors recorded.\n")
             
             f.write("\n📋 ALL ACTIONS (所有操作):\n")
             f.write("-" * 40 + "\n")
-            for action in self.actions:
+            for action in self._iter_entries("action", "error"):
                 event = action.get('event', 'UNKNOWN')
                 action_name = action.get('action', '')
                 timestamp = action.get('timestamp', '')
@@ -501,7 +671,7 @@ class AppLogger:
                 status = "✅" if success else "❌"
                 f.write(f"[{timestamp}] {status} [{event}] {action_name}\n")
                 if action.get('details'):
-                    f.write(f"    Details: {json.dumps(action['details'], ensure_ascii=False)}\n")
+                    f.write(f"    Details: {json.dumps(action['details'], ensure_ascii=False, default=str)}\n")
             
             f.write("\n📺 TERMINAL OUTPUT (终端输出):\n")
             f.write("-" * 40 + "\n")
@@ -548,3 +718,4 @@ def log_spider(spider_name):
 
 # Global instance
 app_logger = AppLogger()
+atexit.register(app_logger.close)
@@ -2,16 +2,22 @@
 """
 Cloud Deduplication Service - 云端去重复
 Allows checking and marking items as processed across multiple instances
+remote模式下标记先记录在本地，由后台线程定时批量推送；远程查询到的已处理记录也写入本地，
+远程不可用时仍能判断。其他实例标记、但本实例从未查询过的数据不会拉取到本地
 """
+import atexit
 import hashlib
 import json
 import os
 import sqlite3
 import requests
 import threading
+import time
+from collections import OrderedDict
 from datetime import datetime
 from autoads.log import log
 from autoads.config import config
+from autoads.dedup.bloomfilter import ScalableBloomFilter
 
 
 class CloudDeduplication:
@@ -22,6 +28,16 @@ class CloudDeduplication:
     _instance = None
     _lock = threading.Lock()
     
+    RECENT_CACHE_SIZE = 100000  # 最近确认已处理的hash缓存数量
+    SQL_BATCH_SIZE = 500  # IN查询每批的参数数量，SQLite默认最多999个
+    BLOOM_INITIAL_CAPACITY = 100000
+    BLOOM_ERROR_RATE = 0.001  # 误判只会多查一次数据库
+    REMOTE_TIMEOUT = 5
+    REMOTE_BATCH_SIZE = 1000  # 每个请求最多携带的hash数量
+    REMOTE_PUSH_SIZE = 200  # 待同步的标记达到该数量时推送
+    REMOTE_PUSH_INTERVAL = 10  # 后台线程每隔该秒数推送一次积累的标记
+    REMOTE_RETRY_INTERVAL = 30  # 远程失败后该秒数内直接使用本地
+    
     def __new__(cls, *args, **kwargs):
         if not cls._instance:
             with cls._lock:
@@ -39,7 +55,36 @@ class CloudDeduplication:
         self.mode = 'local'  # 'local' or 'remote'
         self.remote_url = ''
         self.local_db_path = './dedup_cache/'
-        self._connection = None
+        
+        # 每个线程一个SQLite连接（WAL模式下读写可并发），close时统一关闭
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
+        self._tables_created = set()
+        
+        # 最近确认已处理的hash，命中时不再查询数据库
+        self._recent_hashes = OrderedDict()
+        self._recent_lock = threading.Lock()
+        
+        # 本地数据库中所有hash的布隆过滤器，判定不存在的直接返回，不查询数据库
+        self._bloom = None
+        self._bloom_db_file = None
+        self._bloom_lock = threading.RLock()
+        self._bloom_stats = {
+            'bloom_hits': 0,  # 由布隆过滤器直接判定为未处理
+            'bloom_misses': 0,  # 可能已处理，需要查询数据库
+            'bloom_false_positives': 0,  # 查询数据库后实际未处理
+        }
+        
+        # remote模式的批量同步状态
+        self._sync_lock = threading.RLock()
+        self._pending_count = 0
+        self._push_time = time.time()
+        self._remote_retry_time = 0
+        self._remote_recovered = False  # 为False时下次远程请求成功后先推送积累的标记
+        self._bulk_supported = True  # 远程服务有 /check_many /mark_many 接口，旧版服务返回404时改为逐条请求
+        self._pusher = None  # 定时推送的后台线程，第一次标记时启动
+        self._pusher_stop = threading.Event()
         
         # Load config
         self._load_config()
@@ -79,21 +124,32 @@ class CloudDeduplication:
             log.debug(f"Cloud dedup config error: {e}")
     
     def _get_local_db(self):
-        """Get local SQLite connection"""
+        """Get SQLite connection of current thread"""
         if not os.path.exists(self.local_db_path):
             os.makedirs(self.local_db_path)
         
         db_file = os.path.join(self.local_db_path, f'{self.db_name}.db')
         
-        if self._connection is None:
-            self._connection = sqlite3.connect(db_file, check_same_thread=False)
-            self._create_tables()
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.db_file != db_file:
+            # check_same_thread=False 只是为了close时能从其他线程关闭，平时每个连接只在自己的线程使用
+            connection = sqlite3.connect(db_file, timeout=30, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')  # WAL下提交不再每次fsync，checkpoint时才同步
+            self._local.connection = connection
+            self._local.db_file = db_file
+            
+            with self._connections_lock:
+                self._connections.append(connection)
+                if db_file not in self._tables_created:
+                    self._create_tables(connection)
+                    self._tables_created.add(db_file)
         
-        return self._connection
+        return connection
     
-    def _create_tables(self):
+    def _create_tables(self, connection):
         """Create necessary tables"""
-        cursor = self._connection.cursor()
+        cursor = connection.cursor()
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS processed_items (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -107,7 +163,81 @@ class CloudDeduplication:
         cursor.execute('''
             CREATE INDEX IF NOT EXISTS idx_item_hash ON processed_items(item_hash)
         ''')
-        self._connection.commit()
+        # remote模式下尚未推送到远程的标记
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS pending_marks (
+                item_hash TEXT PRIMARY KEY,
+                item_type TEXT NOT NULL,
+                item_key TEXT,
+                created_at TEXT NOT NULL,
+                source TEXT
+            )
+        ''')
+        connection.commit()
+    
+    def _remember(self, item_hashes):
+        """Add hashes to recent cache"""
+        with self._recent_lock:
+            for item_hash in item_hashes:
+                self._recent_hashes[item_hash] = None
+                self._recent_hashes.move_to_end(item_hash)
+            while len(self._recent_hashes) > self.RECENT_CACHE_SIZE:
+                self._recent_hashes.popitem(last=False)
+    
+    def _is_recent(self, item_hash):
+        with self._recent_lock:
+            return item_hash in self._recent_hashes
+    
+    def _forget_all(self):
+        with self._recent_lock:
+            self._recent_hashes.clear()
+    
+    def _get_bloom(self):
+        """Get bloom filter of current db, warmed from processed_items on first use"""
+        db_file = os.path.join(self.local_db_path, f'{self.db_name}.db')
+        
+        with self._bloom_lock:
+            if self._bloom is None or self._bloom_db_file != db_file:
+                conn = self._get_local_db()
+                count = conn.execute('SELECT COUNT(*) FROM processed_items').fetchone()[0]
+                bloom = ScalableBloomFilter(
+                    initial_capacity=max(self.BLOOM_INITIAL_CAPACITY, count * 2),
+                    error_rate=self.BLOOM_ERROR_RATE,
+                )
+                
+                cursor = conn.execute('SELECT item_hash FROM processed_items')
+                while True:
+                    rows = cursor.fetchmany(10000)
+                    if not rows:
+                        break
+                    bloom.add([row[0] for row in rows], skip_check=True)
+                
+                self._bloom = bloom
+                self._bloom_db_file = db_file
+                log.debug(f"Cloud dedup bloom filter warmed with {count} items")
+            
+            return self._bloom
+    
+    def _bloom_may_contain(self, item_hashes):
+        """Return hashes that may be processed, the others are definitely not"""
+        with self._bloom_lock:
+            exists = self._get_bloom().get(list(item_hashes))
+            maybe = [item_hash for item_hash, is_exist in zip(item_hashes, exists) if is_exist]
+            self._bloom_stats['bloom_hits'] += len(item_hashes) - len(maybe)
+            self._bloom_stats['bloom_misses'] += len(maybe)
+        return maybe
+    
+    def _bloom_add(self, item_hashes):
+        """Keep bloom filter in sync with processed_items, only if it is already warmed"""
+        db_file = os.path.join(self.local_db_path, f'{self.db_name}.db')
+        with self._bloom_lock:
+            if self._bloom is not None and self._bloom_db_file == db_file:
+                self._bloom.add(list(item_hashes), skip_check=True)
+    
+    def _reset_bloom(self):
+        with self._bloom_lock:
+            self._bloom = None
+            self._bloom_db_file = None
     
     def _hash_item(self, item_key, item_type='member'):
         """Generate hash for an item"""
@@ -126,48 +256,97 @@ class CloudDeduplication:
         Returns:
             bool: True if already processed, False otherwise
         """
+        return self.is_processed_many([item_key], item_type)[0]
+    
+    def is_processed_many(self, item_keys, item_type='member'):
+        """
+        Check many items at once
+        批量检查是否已经处理过
+        本地数据库中有的直接返回，remote模式下其余的一次请求批量查询
+        
+        Args:
+            item_keys: list of unique identifiers
+            item_type: Type of items
+        
+        Returns:
+            list: bool for each item_key, same order
+        """
+        item_keys = list(item_keys)
         if not self.enabled:
-            return False
+            return [False] * len(item_keys)
         
-        item_hash = self._hash_item(item_key, item_type)
+        item_hashes = [self._hash_item(item_key, item_type) for item_key in item_keys]
+        with self._recent_lock:
+            unknown = {item_hash for item_hash in item_hashes if item_hash not in self._recent_hashes}
         
-        try:
-            if self.mode == 'local':
-                return self._local_is_processed(item_hash)
-            else:
-                return self._remote_is_processed(item_hash, item_key, item_type)
-        except Exception as e:
-            log.error(f"Error checking processed status: {e}")
-            return False
+        processed = set()
+        if unknown:
+            try:
+                processed = self._local_processed_hashes(list(unknown))
+                if self.mode != 'local':
+                    remote_processed = self._remote_processed_hashes([h for h in unknown if h not in processed])
+                    if remote_processed:
+                        # 远程已处理的写入本地，之后远程不可用时也能判断，且不再请求远程
+                        keys = dict(zip(item_hashes, item_keys))
+                        self._local_mark_processed_many(
+                            [(item_hash, keys[item_hash]) for item_hash in remote_processed], item_type, 'remote'
+                        )
+                    processed |= remote_processed
+            except Exception as e:
+                log.error(f"Error checking processed status: {e}")
+            self._remember(processed)
+        
+        return [item_hash not in unknown or item_hash in processed for item_hash in item_hashes]
     
     def _local_is_processed(self, item_hash):
         """Check locally"""
+        return bool(self._local_processed_hashes([item_hash]))
+    
+    def _local_processed_hashes(self, item_hashes):
+        """Return the subset of item_hashes that exist locally"""
+        item_hashes = self._bloom_may_contain(item_hashes)
+        if not item_hashes:
+            return set()
+        
         conn = self._get_local_db()
         cursor = conn.cursor()
-        cursor.execute('SELECT 1 FROM processed_items WHERE item_hash = ?', (item_hash,))
-        return cursor.fetchone() is not None
-    
-    def _remote_is_processed(self, item_hash, item_key, item_type):
-        """Check via remote API"""
-        try:
-            response = requests.post(
-                f"{self.remote_url}/check",
-                json={
-                    'db_name': self.db_name,
-                    'item_hash': item_hash,
-                    'item_key': item_key,
-                    'item_type': item_type
-                },
-                timeout=5
+        processed = set()
+        for i in range(0, len(item_hashes), self.SQL_BATCH_SIZE):
+            batch = item_hashes[i:i + self.SQL_BATCH_SIZE]
+            cursor.execute(
+                f'SELECT item_hash FROM processed_items WHERE item_hash IN ({",".join("?" * len(batch))})',
+                batch
             )
-            if response.status_code == 200:
-                data = response.json()
-                return data.get('exists', False)
-        except Exception as e:
-            log.warning(f"Remote dedup check failed, falling back to local: {e}")
-            # Fallback to local
-            return self._local_is_processed(item_hash)
-        return False
+            processed.update(row[0] for row in cursor.fetchall())
+        
+        with self._bloom_lock:
+            self._bloom_stats['bloom_false_positives'] += len(set(item_hashes) - processed)
+        return processed
+    
+    def _remote_processed_hashes(self, item_hashes):
+        """
+        Check via remote API, REMOTE_BATCH_SIZE hashes per request
+        Returns empty set when remote is unavailable (local result is used)
+        """
+        processed = set()
+        for i in range(0, len(item_hashes), self.REMOTE_BATCH_SIZE):
+            batch = item_hashes[i:i + self.REMOTE_BATCH_SIZE]
+            if self._bulk_supported:
+                data = self._remote_post('/check_many', {'db_name': self.db_name, 'item_hashes': batch})
+                if data is not None:
+                    processed.update(data.get('exists', []))
+                    continue
+                if self._bulk_supported:
+                    break
+            
+            # 旧版服务没有批量接口，逐条查询
+            for item_hash in batch:
+                data = self._remote_post('/check', {'db_name': self.db_name, 'item_hash': item_hash})
+                if data is None:
+                    return processed
+                if data.get('exists'):
+                    processed.add(item_hash)
+        return processed
     
     def mark_processed(self, item_key, item_type='member', source=''):
         """
@@ -182,57 +361,205 @@ class CloudDeduplication:
         Returns:
             bool: True if marked successfully
         """
+        return self.mark_processed_many([item_key], item_type, source)
+    
+    def mark_processed_many(self, item_keys, item_type='member', source=''):
+        """
+        Mark many items as processed in one transaction
+        批量标记为已处理
+        remote模式下先记录到本地并加入待同步队列，积累到REMOTE_PUSH_SIZE条或超过REMOTE_PUSH_INTERVAL秒后批量推送
+        
+        Args:
+            item_keys: list of unique identifiers
+            item_type: Type of items
+            source: Source identifier (e.g., ads_id)
+        
+        Returns:
+            bool: True if all marked successfully
+        """
         if not self.enabled:
             return True
         
-        item_hash = self._hash_item(item_key, item_type)
+        rows = [(self._hash_item(item_key, item_type), item_key) for item_key in item_keys]
+        if not rows:
+            return True
         
         try:
-            if self.mode == 'local':
-                return self._local_mark_processed(item_hash, item_key, item_type, source)
-            else:
-                return self._remote_mark_processed(item_hash, item_key, item_type, source)
+            marked = self._local_mark_processed_many(rows, item_type, source, pending=self.mode != 'local')
+            if marked and self.mode != 'local':
+                self._maybe_push_pending(len(rows))
         except Exception as e:
             log.error(f"Error marking processed: {e}")
             return False
+        
+        if marked:
+            self._remember([item_hash for item_hash, _ in rows])
+        return marked
     
     def _local_mark_processed(self, item_hash, item_key, item_type, source):
         """Mark locally"""
+        return self._local_mark_processed_many([(item_hash, item_key)], item_type, source)
+    
+    def _local_mark_processed_many(self, rows, item_type, source, pending=False):
+        """
+        Mark locally, one transaction for all rows
+        pending: also queue rows for pushing to remote
+        """
         conn = self._get_local_db()
-        cursor = conn.cursor()
+        created_at = datetime.now().isoformat()
+        values = [(item_hash, item_type, item_key, created_at, source) for item_hash, item_key in rows]
         try:
-            cursor.execute('''
-                INSERT OR IGNORE INTO processed_items 
-                (item_hash, item_type, item_key, created_at, source)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (item_hash, item_type, item_key, datetime.now().isoformat(), source))
-            conn.commit()
+            with conn:
+                conn.executemany('''
+                    INSERT OR IGNORE INTO processed_items 
+                    (item_hash, item_type, item_key, created_at, source)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', values)
+                if pending:
+                    conn.executemany('''
+                        INSERT OR IGNORE INTO pending_marks 
+                        (item_hash, item_type, item_key, created_at, source)
+                        VALUES (?, ?, ?, ?, ?)
+                    ''', values)
+            self._bloom_add([item_hash for item_hash, _ in rows])
             return True
         except Exception as e:
             log.error(f"Error inserting to local db: {e}")
             return False
     
-    def _remote_mark_processed(self, item_hash, item_key, item_type, source):
-        """Mark via remote API"""
+    def _remote_post(self, path, payload, timeout=None):
+        """
+        POST to remote API
+        Returns response json, or None when remote is unavailable.
+        After a failure remote is skipped for REMOTE_RETRY_INTERVAL seconds;
+        the first success after that pushes all marks queued meanwhile.
+        """
+        if time.time() < self._remote_retry_time:
+            return None
+        
         try:
             response = requests.post(
-                f"{self.remote_url}/mark",
-                json={
-                    'db_name': self.db_name,
-                    'item_hash': item_hash,
-                    'item_key': item_key,
-                    'item_type': item_type,
-                    'source': source
-                },
-                timeout=5
+                f"{self.remote_url}{path}",
+                json=payload,
+                timeout=timeout or self.REMOTE_TIMEOUT
             )
-            if response.status_code == 200:
-                return True
+            if response.status_code == 404 and path in ('/check_many', '/mark_many'):
+                # 服务可用，只是不支持批量接口，不算作故障
+                self._bulk_supported = False
+                log.warning(f"Remote dedup server has no {path} endpoint, falling back to per-item /check and /mark")
+                return None
+            response.raise_for_status()
+            data = response.json()
+        except Exception as e:
+            log.warning(f"Remote dedup {path} failed, using local: {e}")
+            self._remote_retry_time = time.time() + self.REMOTE_RETRY_INTERVAL
+            self._remote_recovered = False
+            return None
+        
+        if not self._remote_recovered:
+            # 首次连通或从故障中恢复，把期间积累的标记同步到远程
+            self._remote_recovered = True
+            if path not in ('/mark_many', '/mark'):
+                self.sync()
+        return data
+    
+    def _maybe_push_pending(self, count):
+        with self._sync_lock:
+            self._pending_count += count
+            if self._pending_count < self.REMOTE_PUSH_SIZE:
+                self._start_pusher()
+                return
+        self.sync()
+    
+    def _start_pusher(self):
+        """启动定时推送线程，不依赖下一次标记来推送积累的标记"""
+        with self._sync_lock:
+            if self._pusher is None or not self._pusher.is_alive():
+                self._pusher = threading.Thread(target=self._push_loop, name='CloudDedupPusher', daemon=True)
+                self._pusher.start()
+    
+    def _push_loop(self):
+        stop = self._pusher_stop
+        while not stop.wait(self.REMOTE_PUSH_INTERVAL):
+            if not self._pending_count or time.time() - self._push_time < self.REMOTE_PUSH_INTERVAL:
+                continue
+            self.flush()
+    
+    def _stop_pusher(self):
+        with self._sync_lock:
+            pusher, self._pusher = self._pusher, None
+            stop, self._pusher_stop = self._pusher_stop, threading.Event()
+        stop.set()
+        if pusher and pusher is not threading.current_thread():
+            pusher.join(timeout=self.REMOTE_TIMEOUT)
+    
+    def flush(self):
+        """
+        Push queued marks now, errors are logged
+        采集结束时调用，把积累的标记推送到远程，其他实例不会再重复处理
+        
+        Returns:
+            bool: True if nothing is left to push
+        """
+        if not self.enabled or self.mode == 'local':
+            return True
+        try:
+            return self.sync()
         except Exception as e:
-            log.warning(f"Remote dedup mark failed, falling back to local: {e}")
-            # Fallback to local
-            return self._local_mark_processed(item_hash, item_key, item_type, source)
-        return False
+            log.warning(f"Error pushing pending dedup marks: {e}")
+            return False
+    
+    def sync(self):
+        """
+        Push all queued marks to remote in batches
+        将待同步的标记批量推送到远程
+        
+        Returns:
+            bool: True if nothing is left to push
+        """
+        if self.mode == 'local':
+            return True
+        
+        with self._sync_lock:
+            conn = self._get_local_db()
+            self._push_time = time.time()
+            while True:
+                rows = conn.execute(
+                    'SELECT item_hash, item_type, item_key, created_at, source FROM pending_marks LIMIT ?',
+                    (self.REMOTE_BATCH_SIZE,)
+                ).fetchall()
+                if not rows:
+                    self._pending_count = 0
+                    return True
+                
+                pushed = self._remote_push(rows)
+                if pushed:
+                    with conn:
+                        conn.executemany('DELETE FROM pending_marks WHERE item_hash = ?', [(row[0],) for row in pushed])
+                    self._pending_count = max(0, self._pending_count - len(pushed))
+                if len(pushed) < len(rows):
+                    return False
+    
+    def _remote_push(self, rows):
+        """
+        推送一批待同步的标记，旧版服务没有 /mark_many 时逐条 /mark
+        
+        Returns:
+            list: 已推送的行
+        """
+        items = [dict(zip(('item_hash', 'item_type', 'item_key', 'created_at', 'source'), row)) for row in rows]
+        if self._bulk_supported:
+            if self._remote_post('/mark_many', {'db_name': self.db_name, 'items': items}) is not None:
+                return rows
+            if self._bulk_supported:
+                return []
+        
+        pushed = []
+        for row, item in zip(rows, items):
+            if self._remote_post('/mark', dict(item, db_name=self.db_name)) is None:
+                break
+            pushed.append(row)
+        return pushed
     
     def test_connection(self):
         """
@@ -289,26 +616,37 @@ class CloudDeduplication:
         清空数据库
         """
         try:
-            if self.mode == 'local':
-                conn = self._get_local_db()
-                cursor = conn.cursor()
-                cursor.execute('DELETE FROM processed_items')
-                conn.commit()
-                log.info(f"Cleared local dedup database: {self.db_name}")
-                return True
-            else:
+            if self.mode != 'local':
                 response = requests.post(
                     f"{self.remote_url}/clear",
                     json={'db_name': self.db_name},
                     timeout=10
                 )
-                return response.status_code == 200
+                if response.status_code != 200:
+                    return False
+            
+            # remote模式下本地数据库是远程数据的缓存，一起清空
+            conn = self._get_local_db()
+            with conn:
+                conn.execute('DELETE FROM processed_items')
+                conn.execute('DELETE FROM pending_marks')
+            with self._sync_lock:
+                self._pending_count = 0
+            self._forget_all()
+            self._reset_bloom()
+            log.info(f"Cleared dedup database: {self.db_name}")
+            return True
         except Exception as e:
             log.error(f"Error clearing database: {e}")
             return False
     
     def get_stats(self):
-        """Get statistics"""
+        """
+        Get statistics
+        bloom_hits: lookups answered by the bloom filter without touching the database
+        bloom_misses: lookups that had to query the database
+        bloom_false_positives: bloom_misses that turned out not processed
+        """
         try:
             conn = self._get_local_db()
             cursor = conn.cursor()
@@ -326,41 +664,61 @@ class CloudDeduplication:
             cursor.execute('SELECT COUNT(*) FROM processed_items WHERE created_at LIKE ?', (f'{today}%',))
             today_count = cursor.fetchone()[0]
             
+            # Marks not pushed to remote yet
+            cursor.execute('SELECT COUNT(*) FROM pending_marks')
+            pending_count = cursor.fetchone()[0]
+            
+            with self._bloom_lock:
+                bloom_stats = dict(self._bloom_stats)
+            
             return {
                 'total': total,
                 'by_type': by_type,
-                'today': today_count
+                'today': today_count,
+                'pending_sync': pending_count,
+                **bloom_stats
             }
         except Exception as e:
             log.error(f"Error getting stats: {e}")
-            return {'total': 0, 'by_type': {}, 'today': 0}
+            return {'total': 0, 'by_type': {}, 'today': 0, 'pending_sync': 0, **self._bloom_stats}
     
     def set_config(self, enabled=None, db_name=None, mode=None, remote_url=None):
         """Update configuration"""
-        if enabled is not None:
-            self.enabled = enabled
-            config.set_option('cloud_dedup', 'enabled', str(enabled))
-        
-        if db_name is not None:
-            self.db_name = db_name
-            config.set_option('cloud_dedup', 'db_name', db_name)
-            self._connection = None  # Reset connection for new db
-        
-        if mode is not None:
-            self.mode = mode
-            config.set_option('cloud_dedup', 'mode', mode)
-        
-        if remote_url is not None:
-            self.remote_url = remote_url
-            config.set_option('cloud_dedup', 'remote_url', remote_url)
+        with config.transaction():  # 多项修改只写一次 config.ini
+            if enabled is not None:
+                self.enabled = enabled
+                config.set_option('cloud_dedup', 'enabled', str(enabled))
+            
+            if db_name is not None:
+                self.db_name = db_name
+                config.set_option('cloud_dedup', 'db_name', db_name)
+                self._forget_all()  # 各线程在下次使用时连接到新的数据库
+            
+            if mode is not None:
+                self.mode = mode
+                config.set_option('cloud_dedup', 'mode', mode)
+            
+            if remote_url is not None:
+                self.remote_url = remote_url
+                self._bulk_supported = True  # 新的服务重新检测是否支持批量接口
+                config.set_option('cloud_dedup', 'remote_url', remote_url)
     
     def close(self):
-        """Close connections"""
-        if self._connection:
-            self._connection.close()
-            self._connection = None
+        """Push queued marks, stop the pusher and close connections of all threads"""
+        self._stop_pusher()
+        self.flush()
+        
+        with self._connections_lock:
+            for connection in self._connections:
+                try:
+                    connection.close()
+                except Exception as e:
+                    log.debug(f"Error closing dedup connection: {e}")
+            self._connections = []
+            self._local = threading.local()
 
 
 # Global instance
 cloud_dedup = CloudDeduplication()
+atexit.register(cloud_dedup.close)  # 进程退出前推送还没同步的标记
 
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""
+Cloud Deduplication Stand-in Server - 云端去重复本地测试服务
+Implements the remote API used by CloudDeduplication in memory, for offline tests
+
+Endpoints:
+    POST /check        {db_name, item_hash}            -> {exists: bool}
+    POST /mark         {db_name, item_hash, ...}       -> {success: true}
+    POST /check_many   {db_name, item_hashes: [...]}   -> {exists: [hashes that exist]}
+    POST /mark_many    {db_name, items: [{item_hash, item_type, item_key, created_at, source}]}
+                                                        -> {success: true, added: int}
+    POST /clear        {db_name}                       -> {success: true}
+    GET  /status?db_name=xxx                           -> {count: int}
+    --no-bulk: only /check and /mark, like servers deployed before the bulk endpoints
+
+Usage:
+    python -m autoads.cloud_dedup_server --port 8765
+"""
+import argparse
+import json
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class DedupRequestHandler(BaseHTTPRequestHandler):
+    server: 'DedupServer'
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, data, status=200):
+        body = json.dumps(data).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.server.requests[url.path] += 1
+        if url.path != '/status':
+            return self._send_json({'error': 'not found'}, 404)
+
+        db_name = parse_qs(url.query).get('db_name', ['default'])[0]
+        with self.server.lock:
+            count = len(self.server.databases.get(db_name, {}))
+        self._send_json({'count': count})
+
+    def do_POST(self):
+        self.server.requests[self.path] += 1
+        try:
+            payload = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+        except ValueError:
+            return self._send_json({'error': 'invalid json'}, 400)
+
+        handlers = {
+            '/check': self.server.check,
+            '/mark': self.server.mark,
+            '/clear': self.server.clear,
+        }
+        if self.server.bulk:
+            handlers.update({'/check_many': self.server.check_many, '/mark_many': self.server.mark_many})
+        handler = handlers.get(self.path)
+        if handler is None:
+            return self._send_json({'error': 'not found'}, 404)
+
+        self._send_json(handler(payload))
+
+
+class DedupServer(ThreadingHTTPServer):
+    """
+    In-memory dedup server, data is lost when stopped
+    requests: Counter of requests per path, for asserting round-trips in tests
+    bulk: serve /check_many and /mark_many
+    """
+    daemon_threads = True
+
+    def __init__(self, host='127.0.0.1', port=0, bulk=True):
+        super().__init__((host, port), DedupRequestHandler)
+        self.bulk = bulk
+        self.lock = threading.Lock()
+        self.databases = {}  # db_name -> {item_hash: item}
+        self.requests = Counter()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def _get_db(self, payload):
+        return self.databases.setdefault(payload.get('db_name', 'default'), {})
+
+    def check(self, payload):
+        with self.lock:
+            return {'exists': payload.get('item_hash') in self._get_db(payload)}
+
+    def mark(self, payload):
+        return self.mark_many({'db_name': payload.get('db_name'), 'items': [payload]})
+
+    def check_many(self, payload):
+        with self.lock:
+            db = self._get_db(payload)
+            return {'exists': [item_hash for item_hash in payload.get('item_hashes', []) if item_hash in db]}
+
+    def mark_many(self, payload):
+        added = 0
+        with self.lock:
+            db = self._get_db(payload)
+            for item in payload.get('items', []):
+                if item.get('item_hash') and item['item_hash'] not in db:
+                    db[item['item_hash']] = item
+                    added += 1
+        return {'success': True, 'added': added}
+
+    def clear(self, payload):
+        with self.lock:
+            self._get_db(payload).clear()
+        return {'success': True}
+
+    def start(self):
+        """Serve in a background thread"""
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Cloud dedup stand-in server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--no-bulk', action='store_true', help='only serve /check and /mark')
+    args = parser.parse_args()
+
+    server = DedupServer(args.host, args.port, bulk=not args.no_bulk)
+    print(f'Cloud dedup stand-in server listening on {server.url}')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == '__main__':
+    main()
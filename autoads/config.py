@@ -1,6 +1,74 @@
 import configparser
+import contextlib
+import io
 import os.path
 import json
+import stat
+import tempfile
+import threading
+import types
+
+
+class ConfigSnapshot(object):
+    """
+    解析一次的只读配置快照，xpath 规则预先解码为 tuple，整数和布尔值预先转换
+    配置修改后会生成新的快照，旧快照不受影响
+    """
+
+    def __init__(self, parser):
+        values = {}
+        xpaths = {}
+        ints = {}
+        for section in parser.sections():
+            options = values[section] = {}
+            for option in parser.options(section):
+                try:
+                    value = parser.get(section, option)
+                except configparser.InterpolationError:
+                    value = parser.get(section, option, raw=True)
+                options[option] = value
+                try:
+                    ints[section, option] = int(value)
+                except ValueError:
+                    pass
+                if 'xpath' in option:
+                    try:
+                        xpaths[section, option] = tuple(json.loads(value))
+                    except (ValueError, TypeError):
+                        pass  # 不是合法的xpath列表，读取时再报错
+
+        self.values = types.MappingProxyType({section: types.MappingProxyType(options)
+                                              for section, options in values.items()})
+        self._xpaths = xpaths
+        self._ints = ints
+
+    def get(self, section, option):
+        try:
+            options = self.values[section]
+        except KeyError:
+            raise configparser.NoSectionError(section) from None
+        try:
+            return options[option]
+        except KeyError:
+            raise configparser.NoOptionError(option, section) from None
+
+    def has_option(self, section, option):
+        return option in self.values.get(section, ())
+
+    def get_xpath(self, section, option):
+        xpath = self._xpaths.get((section, option))
+        if xpath is None:
+            return json.loads(self.get(section, option))
+        return xpath
+
+    def get_int(self, section, option, default):
+        return self._ints.get((section, option), default)
+
+    def get_bool(self, section, option, default):
+        options = self.values.get(section)
+        if options is None or option not in options:
+            return default
+        return options[option].lower() == 'true'
 
 
 class Config(object):
@@ -9,6 +77,11 @@ class Config(object):
         # Open a configuration file
         self.__name = None
         self.__config = None
+        self.__snapshot = None
+        self.__lock = threading.RLock()
+        self.__listeners = []
+        self.__transaction_depth = 0
+        self.__dirty = False
         self.lang = {'请选择': '', '英语': 'en', '阿拉伯语': 'ar', '孟加拉语': 'bn-IN', '米沙鄢语': 'ceb-PH', '捷克语 ': 'cs-CZ',
                      '德语 ': 'de-DE', '希腊语': 'el-GR', '西班牙文': 'es', '芬兰语': 'fi-FI', '菲律宾语': 'fil-PH', '法语': 'fr',
                      '希伯来文e': 'he-IL', '印地语': 'hi-IN', '匈牙利文': 'hu-HU', '印度尼西亚语': 'id-ID', '意大利文': 'it-IT',
@@ -41,35 +114,135 @@ class Config(object):
             self.__config = _config
             return _config
 
+    @property
+    def snapshot(self):
+        """
+        当前配置的只读快照，读取配置不加锁
+        """
+        snapshot = self.__snapshot
+        if snapshot is None:
+            with self.__lock:
+                if self.__snapshot is None:
+                    self.__snapshot = ConfigSnapshot(self.config)
+                snapshot = self.__snapshot
+        return snapshot
+
+    def subscribe(self, listener):
+        """
+        配置写入文件后调用 listener(snapshot)，读取方可以据此替换自己持有的快照
+        """
+        with self.__lock:
+            self.__listeners.append(listener)
+        return listener
+
+    def unsubscribe(self, listener):
+        with self.__lock:
+            if listener in self.__listeners:
+                self.__listeners.remove(listener)
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """
+        批量修改配置，最外层事务结束时只写一次文件；出现异常时撤销事务内的修改
+        """
+        with self.__lock:
+            if self.__transaction_depth == 0:
+                backup = io.StringIO()
+                self.config.write(backup)
+            self.__transaction_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self.__transaction_depth -= 1
+                if self.__transaction_depth == 0:
+                    self.__rollback(backup)
+                raise
+            else:
+                self.__transaction_depth -= 1
+                if self.__transaction_depth == 0 and self.__dirty:
+                    self.__flush()
+
+    def __rollback(self, backup):
+        _config = configparser.ConfigParser()
+        _config.read_string(backup.getvalue())
+        self.__config = _config
+        self.__snapshot = ConfigSnapshot(_config)
+        self.__dirty = False
+
+    def __changed(self):
+        # 同一事务中的后续读取能看到新值，文件和通知留到事务结束
+        self.__snapshot = ConfigSnapshot(self.config)
+        if self.__transaction_depth:
+            self.__dirty = True
+        else:
+            self.__flush()
+
+    def __flush(self):
+        """
+        先写临时文件再替换，中途失败不会留下写了一半的 config.ini
+        """
+        config_dir = os.path.dirname(self.config_path)
+        fd, tmp_path = tempfile.mkstemp(prefix='.config-', suffix='.tmp', dir=config_dir)
+        try:
+            if os.path.exists(self.config_path):
+                os.chmod(tmp_path, stat.S_IMODE(os.stat(self.config_path).st_mode))
+            with open(fd, mode='w', encoding='utf-8') as f:
+                self.config.write(f)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.config_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.__dirty = False
+
+        snapshot = self.snapshot
+        for listener in list(self.__listeners):
+            try:
+                listener(snapshot)
+            except Exception as e:
+                from autoads.log import log  # autoads.log 不依赖配置，这里延迟导入
+                log.error(f"config listener {listener!r} failed: {e}")
+
     def add_section(self, section):
-        if not self.config.has_section(section):
-            self.config.add_section(section)
-            self.config.write(open(self.config_path, mode='w', encoding='utf-8'))
+        with self.__lock:
+            if not self.config.has_section(section):
+                self.config.add_section(section)
+                self.__changed()
 
     def set_option(self, section, option, value):
-        self.add_section(section)
-        self.config.set(section, option, value)
-
-        self.config.write(open(self.config_path, mode='w', encoding='utf-8'))
+        with self.__lock:
+            with self.transaction():
+                self.add_section(section)
+                self.config.set(section, option, value)
+                self.__changed()
 
     def remove_section(self, section):
-        self.config.remove_section(section)
-        self.config.write(open(self.config_path, mode='w', encoding='utf-8'))
+        with self.__lock:
+            self.config.remove_section(section)
+            self.__changed()
 
     def remove_option(self, section, option):
-        if self.config.has_section(section):
-            self.config.remove_option(section, option)
-
-        self.config.write(open(self.config_path, mode='w', encoding='utf-8'))
+        with self.__lock:
+            if self.config.has_section(section):
+                self.config.remove_option(section, option)
+            self.__changed()
 
     def get_options(self, section):
         return self.config.options(section)
 
     def get_option(self, section, option):
-        return self.config.get(section, option)
+        return self.snapshot.get(section, option)
 
     def get_xpath(self, section, option):
-        return json.loads(self.config.get(section, option))
+        return self.snapshot.get_xpath(section, option)
+
+    def get_int(self, section, option, default):
+        return self.snapshot.get_int(section, option, default)
+
+    def get_bool(self, section, option, default):
+        return self.snapshot.get_bool(section, option, default)
 
     @property
     def members_user(self):
@@ -97,19 +270,19 @@ class Config(object):
 
     @property
     def members_xpath_public_admin(self):
-        return json.loads(self.get_option('members', 'xpath_public_admin'))
+        return self.get_xpath('members', 'xpath_public_admin')
 
     @property
     def members_xpath_public_user(self):
-        return json.loads(self.get_option('members', 'xpath_public_user'))
+        return self.get_xpath('members', 'xpath_public_user')
 
     @property
     def members_xpath_apply_join_admin(self):
-        return json.loads(self.get_option('members', 'xpath_apply_join_admin'))
+        return self.get_xpath('members', 'xpath_apply_join_admin')
 
     @property
     def members_xpath_apply_join_user(self):
-        return json.loads(self.get_option('members', 'xpath_apply_join_user'))
+        return self.get_xpath('members', 'xpath_apply_join_user')
 
     @property
     def groups_user(self):
@@ -129,7 +302,7 @@ class Config(object):
 
     @property
     def groups_xpath_query(self):
-        return json.loads(self.get_option('groups', 'xpath_query'))
+        return self.get_xpath('groups', 'xpath_query')
 
     @property
     def groups_words(self):
@@ -212,10 +385,7 @@ class Config(object):
     @property
     def keep_browser_open(self):
         """Keep browser open after collection stops"""
-        try:
-            return self.get_option('ads', 'keep_browser_open').lower() == 'true'
-        except:
-            return True  # Default: keep browser open
+        return self.get_bool('ads', 'keep_browser_open', True)  # Default: keep browser open
 
     @property
     def max_scroll_count(self):
@@ -236,10 +406,7 @@ class Config(object):
     # IP Pool properties
     @property
     def ip_pool_enabled(self):
-        try:
-            return self.get_option('ip_pool', 'enabled').lower() == 'true'
-        except:
-            return False
+        return self.get_bool('ip_pool', 'enabled', False)
     
     @property
     def ip_pool_proxy_type(self):
@@ -264,40 +431,31 @@ class Config(object):
     
     @property
     def ip_pool_rotate_after_requests(self):
-        try:
-            return int(self.get_option('ip_pool', 'rotate_after_requests'))
-        except:
-            return 0
+        return self.get_int('ip_pool', 'rotate_after_requests', 0)
     
     @property
     def ip_pool_test_before_use(self):
-        try:
-            return self.get_option('ip_pool', 'test_before_use').lower() == 'true'
-        except:
-            return True
+        return self.get_bool('ip_pool', 'test_before_use', True)
     
     @property
     def ip_pool_timeout(self):
-        try:
-            return int(self.get_option('ip_pool', 'timeout'))
-        except:
-            return 10
+        return self.get_int('ip_pool', 'timeout', 10)
 
     @property
     def greets_xpath_send_btn(self):
-        return json.loads(self.get_option('greets', 'xpath_send_btn'))
+        return self.get_xpath('greets', 'xpath_send_btn')
 
     @property
     def greets_xpath_close_btn_row(self):
-        return json.loads(self.get_option('greets', 'xpath_close_btn_row'))
+        return self.get_xpath('greets', 'xpath_close_btn_row')
 
     @property
     def greets_xpath_mwchat_textbox(self):
-        return json.loads(self.get_option('greets', 'xpath_mwchat_textbox'))
+        return self.get_xpath('greets', 'xpath_mwchat_textbox')
 
     @property
     def greets_xpath_mwchat_file(self):
-        return json.loads(self.get_option('greets', 'xpath_mwchat_file'))
+        return self.get_xpath('greets', 'xpath_mwchat_file')
 
     @property
     def contact_phone(self):
@@ -318,7 +476,7 @@ class Config(object):
 
     @property
     def posts_xpath(self):
-        return json.loads(self.get_option('posts', 'xpath_post'))
+        return self.get_xpath('posts', 'xpath_post')
 
     # Pages configuration
     @property
@@ -335,7 +493,7 @@ class Config(object):
 
     @property
     def pages_xpath(self):
-        return json.loads(self.get_option('pages', 'xpath_page'))
+        return self.get_xpath('pages', 'xpath_page')
 
     # Instagram configuration
     @property
@@ -364,17 +522,11 @@ class Config(object):
 
     @property
     def ins_max_thread_count(self):
-        try:
-            return int(self.get_option('instagram', 'max_thread_count'))
-        except:
-            return 2
+        return self.get_int('instagram', 'max_thread_count', 2)
 
     @property
     def ins_max_scroll_count(self):
-        try:
-            return int(self.get_option('instagram', 'max_scroll_count'))
-        except:
-            return 5
+        return self.get_int('instagram', 'max_scroll_count', 5)
 
     # Automation configuration
     @property
@@ -400,17 +552,11 @@ class Config(object):
 
     @property
     def like_count(self):
-        try:
-            return int(self.get_option('automation', 'like_count'))
-        except:
-            return 10
+        return self.get_int('automation', 'like_count', 10)
 
     @property
     def like_interval(self):
-        try:
-            return int(self.get_option('automation', 'like_interval'))
-        except:
-            return 5
+        return self.get_int('automation', 'like_interval', 5)
 
     @property
     def comment_mode(self):
@@ -435,17 +581,11 @@ class Config(object):
 
     @property
     def comment_count(self):
-        try:
-            return int(self.get_option('automation', 'comment_count'))
-        except:
-            return 5
+        return self.get_int('automation', 'comment_count', 5)
 
     @property
     def comment_interval(self):
-        try:
-            return int(self.get_option('automation', 'comment_interval'))
-        except:
-            return 10
+        return self.get_int('automation', 'comment_interval', 10)
 
     @property
     def follow_mode(self):
@@ -463,17 +603,11 @@ class Config(object):
 
     @property
     def follow_count(self):
-        try:
-            return int(self.get_option('automation', 'follow_count'))
-        except:
-            return 10
+        return self.get_int('automation', 'follow_count', 10)
 
     @property
     def follow_interval(self):
-        try:
-            return int(self.get_option('automation', 'follow_interval'))
-        except:
-            return 5
+        return self.get_int('automation', 'follow_interval', 5)
 
     @property
     def add_friend_mode(self):
@@ -484,17 +618,11 @@ class Config(object):
 
     @property
     def add_friend_count(self):
-        try:
-            return int(self.get_option('automation', 'add_friend_count'))
-        except:
-            return 10
+        return self.get_int('automation', 'add_friend_count', 10)
 
     @property
     def add_friend_interval(self):
-        try:
-            return int(self.get_option('automation', 'add_friend_interval'))
-        except:
-            return 5
+        return self.get_int('automation', 'add_friend_interval', 5)
 
     @property
     def add_friend_location(self):
@@ -526,10 +654,7 @@ class Config(object):
 
     @property
     def group_join_count(self):
-        try:
-            return int(self.get_option('automation', 'group_join_count'))
-        except:
-            return 5
+        return self.get_int('automation', 'group_join_count', 5)
 
     @property
     def group_post_content(self):
@@ -547,17 +672,11 @@ class Config(object):
 
     @property
     def group_post_interval(self):
-        try:
-            return int(self.get_option('automation', 'group_post_interval'))
-        except:
-            return 30
+        return self.get_int('automation', 'group_post_interval', 30)
 
     @property
     def group_post_public(self):
-        try:
-            return self.get_option('automation', 'group_post_public').lower() == 'true'
-        except:
-            return False
+        return self.get_bool('automation', 'group_post_public', False)
 
     @property
     def main_post_content(self):
@@ -575,24 +694,15 @@ class Config(object):
 
     @property
     def main_post_count(self):
-        try:
-            return int(self.get_option('automation', 'main_post_count'))
-        except:
-            return 1
+        return self.get_int('automation', 'main_post_count', 1)
 
     @property
     def main_post_interval(self):
-        try:
-            return int(self.get_option('automation', 'main_post_interval'))
-        except:
-            return 60
+        return self.get_int('automation', 'main_post_interval', 60)
 
     @property
     def main_post_public(self):
-        try:
-            return self.get_option('automation', 'main_post_public').lower() == 'true'
-        except:
-            return True
+        return self.get_bool('automation', 'main_post_public', True)
 
     @property
     def message_mode(self):
@@ -617,38 +727,23 @@ class Config(object):
 
     @property
     def advanced_message_interval(self):
-        try:
-            return int(self.get_option('automation', 'advanced_message_interval'))
-        except:
-            return 5
+        return self.get_int('automation', 'advanced_message_interval', 5)
 
     @property
     def advanced_message_count(self):
-        try:
-            return int(self.get_option('automation', 'advanced_message_count'))
-        except:
-            return 10
+        return self.get_int('automation', 'advanced_message_count', 10)
 
     @property
     def message_anti_ban(self):
-        try:
-            return self.get_option('automation', 'message_anti_ban').lower() == 'true'
-        except:
-            return False
+        return self.get_bool('automation', 'message_anti_ban', False)
 
     @property
     def message_cloud_backup(self):
-        try:
-            return self.get_option('automation', 'message_cloud_backup').lower() == 'true'
-        except:
-            return False
+        return self.get_bool('automation', 'message_cloud_backup', False)
 
     @property
     def register_count(self):
-        try:
-            return int(self.get_option('automation', 'register_count'))
-        except:
-            return 1
+        return self.get_int('automation', 'register_count', 1)
 
     @property
     def register_name_lang(self):
@@ -680,10 +775,7 @@ class Config(object):
 
     @property
     def register_old_version(self):
-        try:
-            return self.get_option('automation', 'register_old_version').lower() == 'true'
-        except:
-            return False
+        return self.get_bool('automation', 'register_old_version', False)
 
     @property
     def contact_action(self):
@@ -694,10 +786,7 @@ class Config(object):
 
     @property
     def contact_count(self):
-        try:
-            return int(self.get_option('automation', 'contact_count'))
-        except:
-            return 100
+        return self.get_int('automation', 'contact_count', 100)
 
     @property
     def contact_region(self):
@@ -729,10 +818,7 @@ class Config(object):
 
     @property
     def contact_sequential(self):
-        try:
-            return self.get_option('automation', 'contact_sequential').lower() == 'true'
-        except:
-            return False
+        return self.get_bool('automation', 'contact_sequential', False)
 
     @property
     def contact_file_path(self):
@@ -751,10 +837,7 @@ class Config(object):
     # Cloud Deduplication properties
     @property
     def cloud_dedup_enabled(self):
-        try:
-            return self.get_option('cloud_dedup', 'enabled').lower() == 'true'
-        except:
-            return False
+        return self.get_bool('cloud_dedup', 'enabled', False)
 
     @property
     def cloud_dedup_db_name(self):
@@ -784,6 +867,32 @@ class Config(object):
         except:
             return './dedup_cache/'
 
+    # Item dedup properties
+    @property
+    def dedup_persistent(self):
+        """Keep ItemBuffer dedup state in a memory-mapped snapshot across restarts (opt-in)"""
+        return self.get_bool('main', 'dedup_persistent', False)
+
+    @property
+    def dedup_cache_path(self):
+        try:
+            return self.get_option('main', 'dedup_cache_path')
+        except:
+            return './dedup_cache/'
+
+    # Request journal properties
+    @property
+    def request_journal(self):
+        """Journal queued requests to disk so a crashed or stopped run resumes where it was"""
+        return self.get_bool('main', 'request_journal', False)
+
+    @property
+    def request_journal_path(self):
+        try:
+            return self.get_option('main', 'request_journal_path')
+        except:
+            return './request_journal/'
+
     # Account Management properties
     @property
     def accounts_file(self):
@@ -794,17 +903,11 @@ class Config(object):
 
     @property
     def accounts_skip_used(self):
-        try:
-            return self.get_option('accounts', 'skip_used').lower() == 'true'
-        except:
-            return True
+        return self.get_bool('accounts', 'skip_used', True)
 
     @property
     def accounts_auto_mark_used(self):
-        try:
-            return self.get_option('accounts', 'auto_mark_used').lower() == 'true'
-        except:
-            return True
+        return self.get_bool('accounts', 'auto_mark_used', True)
 
     @property
     def members_selected_file(self):
@@ -857,18 +960,12 @@ class Config(object):
     @property
     def screen_width(self):
         """屏幕宽度 - Screen width for browser auto-arrangement"""
-        try:
-            return int(self.get_option('main', 'screen_width'))
-        except:
-            return 1920
+        return self.get_int('main', 'screen_width', 1920)
 
     @property
     def screen_height(self):
         """屏幕高度 - Screen height for browser auto-arrangement"""
-        try:
-            return int(self.get_option('main', 'screen_height'))
-        except:
-            return 1080
+        return self.get_int('main', 'screen_height', 1080)
 
 
 config = Config()
@@ -2,6 +2,17 @@
 
 from __future__ import absolute_import
 
+import mmap
+import os
+import re
+import struct
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 class BitArray:
     def setall(self, value):
         pass
@@ -29,18 +40,23 @@ class BitArray:
     def count(self, value=True):
         raise ImportError("this method mush be implement")
 
+    def flush(self, force=False):
+        """
+        将数据写入持久化存储，内存实现无需处理
+        """
+        pass
+
+    def close(self):
+        pass
+
 
 class MemoryBitArray(BitArray):
     def __init__(self, num_bits):
-        try:
-            import bitarray
-        except Exception as e:
-            raise Exception(
-                "需要安装feapder完整版\ncommand: pip install myfeapder[all]\n若安装出错，参考：https://boris.org.cn/myfeapder/#/question/%E5%AE%89%E8%A3%85%E9%97%AE%E9%A2%98"
-            )
+        bitarray = _import_bitarray()
 
         self.num_bits = num_bits
         self.bitarray = bitarray.bitarray(num_bits, endian="little")
+        self._buffer = None  # bitarray底层字节的numpy视图，批量读写用
 
         self.setall(0)
 
@@ -89,3 +105,235 @@ class MemoryBitArray(BitArray):
 
     def count(self, value=True):
         return self.bitarray.count(value)
+
+    def get_buffer(self):
+        """
+        little endian: 第offset位在第 offset >> 3 个字节的第 offset & 7 位
+        """
+        if self._buffer is None:
+            self._buffer = np.frombuffer(self.bitarray, dtype=np.uint8)
+        return self._buffer
+
+    def get_batch(self, offsets):
+        """
+        批量取值
+        @param offsets: numpy数组
+        @return: numpy数组 uint8
+        """
+        return batch_get(self.get_buffer(), offsets)
+
+    def set_batch(self, offsets, value=1):
+        """
+        批量设置，返回之前的值，与逐个调用set的结果一致
+        @param offsets: numpy数组
+        @param value: 0 / 1
+        @return: numpy数组 uint8
+        """
+        return batch_set(self.get_buffer(), offsets, value)
+
+
+class MmapBitArray(MemoryBitArray):
+    """
+    基于内存映射文件的位数组，重启后直接映射已有文件，不需要重新分配和清零
+    文件格式: 64字节文件头 + 位数据（little endian，与MemoryBitArray一致）
+    文件头: magic, 版本, capacity, error_rate, num_slices, bits_per_slice, 已置1的位数
+    已置1的位数随set/set_batch更新，count不需要扫描整个文件
+    """
+
+    MAGIC = b"ADBF"
+    VERSION = 1
+    HEADER = struct.Struct("<4sHQdIQ")
+    BIT_COUNT = struct.Struct("<Q")  # 紧跟在HEADER之后
+    HEADER_SIZE = 64  # 预留空间，以后增加文件头字段不影响数据偏移
+    FILE_SUFFIX = ".bloom"
+    FLUSH_INTERVAL = 10  # 距上次写盘超过该秒数才真正flush，避免每批数据都同步整个文件
+
+    def __init__(self, file_path, capacity, error_rate, num_slices, bits_per_slice):
+        """
+        @param file_path: 快照文件路径，不存在时创建
+        其余参数写入文件头；文件已存在时以文件头为准，可先用read_header读取
+        """
+        bitarray = _import_bitarray()
+
+        self.file_path = file_path
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.num_slices = num_slices
+        self.bits_per_slice = bits_per_slice
+        self.num_bits = num_slices * bits_per_slice
+
+        header = self.read_header(file_path)
+        if header:
+            self.__dict__.update(header)
+            self.num_bits = self.num_slices * self.bits_per_slice
+        else:
+            self._create_file()
+
+        self._file = open(file_path, "r+b")
+        self._mmap = mmap.mmap(self._file.fileno(), self.HEADER_SIZE + self.num_bytes)
+        self._view = memoryview(self._mmap)[self.HEADER_SIZE :]
+        # 直接在映射的内存上操作，按需从文件读入，打开文件的耗时与大小无关
+        self.bitarray = bitarray.bitarray(buffer=self._view, endian="little")
+        self._buffer = None
+        self._flush_time = time.time()
+
+    def __repr__(self):
+        return "MmapBitArray: {} {}".format(self.file_path, self.num_bits)
+
+    @property
+    def num_bytes(self):
+        return (self.num_bits + 7) // 8
+
+    @classmethod
+    def make_file_path(cls, path, name):
+        name = re.sub(r"[^\w.-]", "_", name or "bloomfilter")
+        return os.path.join(path, name + cls.FILE_SUFFIX)
+
+    @classmethod
+    def read_header(cls, file_path):
+        """
+        读取快照文件头
+        @return: dict / None（文件不存在）
+        """
+        if not os.path.exists(file_path):
+            return None
+
+        with open(file_path, "rb") as f:
+            data = f.read(cls.HEADER.size + cls.BIT_COUNT.size)
+            file_size = os.fstat(f.fileno()).st_size
+
+        if len(data) < cls.HEADER.size + cls.BIT_COUNT.size:
+            raise ValueError("bloomfilter快照文件头不完整: {}".format(file_path))
+
+        magic, version, capacity, error_rate, num_slices, bits_per_slice = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            raise ValueError("不是bloomfilter快照文件: {}".format(file_path))
+
+        if file_size < cls.HEADER_SIZE + (num_slices * bits_per_slice + 7) // 8:
+            raise ValueError("bloomfilter快照文件大小与文件头不符: {}".format(file_path))
+
+        return dict(
+            capacity=capacity,
+            error_rate=error_rate,
+            num_slices=num_slices,
+            bits_per_slice=bits_per_slice,
+        )
+
+    def _create_file(self):
+        os.makedirs(os.path.dirname(self.file_path) or ".", exist_ok=True)
+
+        # 先写到临时文件，完整后再改名，避免中途退出留下没有文件头的快照
+        tmp_path = self.file_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            # truncate扩展出的部分由文件系统补0（包括已置1的位数），不需要逐字节写入
+            f.truncate(self.HEADER_SIZE + self.num_bytes)
+            f.write(
+                self.HEADER.pack(
+                    self.MAGIC,
+                    self.VERSION,
+                    self.capacity,
+                    self.error_rate,
+                    self.num_slices,
+                    self.bits_per_slice,
+                )
+            )
+        os.replace(tmp_path, self.file_path)
+
+    def _get_bit_count(self):
+        return self.BIT_COUNT.unpack_from(self._mmap, self.HEADER.size)[0]
+
+    def _add_bit_count(self, delta):
+        if delta:
+            self.BIT_COUNT.pack_into(self._mmap, self.HEADER.size, self._get_bit_count() + delta)
+
+    def setall(self, value):
+        self.bitarray.setall(value)
+        self.BIT_COUNT.pack_into(self._mmap, self.HEADER.size, self.num_bits if value else 0)
+        if value:  # 末尾补齐字节的位不计入
+            self.bitarray[self.num_bits :] = 0
+
+    def set(self, offsets, values):
+        old_values = super(MmapBitArray, self).set(offsets, values)
+
+        # old_values与逐个设置的顺序一致，据此计算置1位数的变化
+        if isinstance(offsets, list):
+            if not isinstance(values, list):
+                values = [values] * len(offsets)
+            self._add_bit_count(
+                sum(bool(value) - old for value, old in zip(values, old_values) if bool(value) != old)
+            )
+        else:
+            self._add_bit_count(bool(values) - old_values)
+
+        return old_values
+
+    def set_batch(self, offsets, value=1):
+        old_values = super(MmapBitArray, self).set_batch(offsets, value)
+        changed = int(old_values.sum())
+        self._add_bit_count(len(old_values) - changed if value else -changed)
+        return old_values
+
+    def count(self, value=True):
+        bit_count = self._get_bit_count()
+        return bit_count if value else self.num_bits - bit_count
+
+    def flush(self, force=False):
+        """
+        将修改过的页写回文件，未修改的页不会写入
+        @param force: 为False时距离上次写盘不足FLUSH_INTERVAL秒则跳过
+        """
+        if self._mmap is None:
+            return
+        if not force and time.time() - self._flush_time < self.FLUSH_INTERVAL:
+            return
+
+        self._mmap.flush()
+        self._flush_time = time.time()
+
+    def close(self):
+        if self._mmap is None:
+            return
+
+        self.flush(force=True)
+
+        # 释放所有对映射内存的引用后才能关闭
+        self._buffer = None
+        self.bitarray = None
+        self._view.release()
+        self._mmap.close()
+        self._file.close()
+        self._mmap = None
+
+
+def _import_bitarray():
+    try:
+        import bitarray
+    except Exception as e:
+        raise Exception(
+            "需要安装feapder完整版\ncommand: pip install myfeapder[all]\n若安装出错，参考：https://boris.org.cn/myfeapder/#/question/%E5%AE%89%E8%A3%85%E9%97%AE%E9%A2%98"
+        )
+
+    return bitarray
+
+
+def batch_get(buffer, offsets):
+    return (buffer[offsets >> 3] >> (offsets & 7).astype(np.uint8)) & 1
+
+
+def batch_set(buffer, offsets, value=1):
+    byte_index = offsets >> 3
+    masks = np.left_shift(1, offsets & 7).astype(np.uint8)
+    old_values = (buffer[byte_index] & masks) != 0
+
+    # 同一批中重复的offset，逐个设置时后出现的会读到前面刚设置的值
+    repeated = np.ones(len(offsets), dtype=bool)
+    repeated[np.unique(offsets, return_index=True)[1]] = False
+
+    if value:
+        old_values |= repeated
+        np.bitwise_or.at(buffer, byte_index, masks)
+    else:
+        old_values &= ~repeated
+        np.bitwise_and.at(buffer, byte_index, ~masks)
+
+    return old_values.astype(np.uint8)
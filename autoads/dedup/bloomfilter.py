@@ -3,14 +3,19 @@
 
 import hashlib
 import math
+import os
 import threading
-import time
 from struct import unpack, pack
 
 from . import bitarray
 
+try:
+    import numpy as np
+except ImportError:  # 没有安装numpy时逐个key计算offset
+    np = None
 
-def make_hashfuncs(num_slices, num_bits):
+
+def _get_hash_params(num_slices, num_bits):
     if num_bits >= (1 << 31):
         fmt_code, chunk_size = "Q", 8
     elif num_bits >= (1 << 15):
@@ -34,11 +39,21 @@ def make_hashfuncs(num_slices, num_bits):
         num_salts += 1
     salts = tuple(hashfn(hashfn(pack("I", i)).digest()) for i in range(num_salts))
 
+    return fmt_code, fmt, salts
+
+
+def _to_bytes(key):
+    if isinstance(key, str):
+        return key.encode("utf-8")
+    else:
+        return str(key).encode("utf-8")
+
+
+def make_hashfuncs(num_slices, num_bits):
+    fmt_code, fmt, salts = _get_hash_params(num_slices, num_bits)
+
     def _make_hashfuncs(key):
-        if isinstance(key, str):
-            key = key.encode("utf-8")
-        else:
-            key = str(key).encode("utf-8")
+        key = _to_bytes(key)
 
         i = 0
         for salt in salts:
@@ -53,9 +68,40 @@ def make_hashfuncs(num_slices, num_bits):
     return _make_hashfuncs
 
 
+def make_batch_hashfuncs(num_slices, num_bits):
+    """
+    批量计算hash，与make_hashfuncs的结果一致
+    @return: 函数 keys -> numpy数组 shape=(len(keys), num_slices)
+    """
+    fmt_code, fmt, salts = _get_hash_params(num_slices, num_bits)
+    dtype = np.dtype(fmt_code)  # 与struct不带前缀时一样使用本机字节序
+
+    def _make_batch_hashfuncs(keys):
+        if not keys:
+            return np.empty((0, num_slices), dtype=np.int64)
+
+        digests = []
+        for key in keys:
+            key = _to_bytes(key)
+            for salt in salts:
+                h = salt.copy()
+                h.update(key)
+                digests.append(h.digest())
+
+        hashes = np.frombuffer(b"".join(digests), dtype=dtype).reshape(len(keys), -1)
+        return (hashes[:, :num_slices] % num_bits).astype(np.int64)
+
+    return _make_batch_hashfuncs
+
+
 class BloomFilter(object):
     BASE_MEMORY = 1
     BASE_REDIS = 2
+    BASE_MMAP = 3
+
+    # 是否使用numpy批量计算offset及读写bit
+    vectorized = np is not None
+    VECTORIZE_MIN_KEYS = 8  # key较少时numpy的调用开销比逐个计算大
 
     def __init__(
         self,
@@ -64,7 +110,11 @@ class BloomFilter(object):
         bitarray_type=BASE_MEMORY,
         name=None,
         redis_url=None,
+        path="./dedup_cache/",
     ):
+        """
+        @param path: BASE_MMAP时快照文件所在目录，文件名由name生成
+        """
         if not (0 < error_rate < 1):
             raise ValueError("Error_Rate must be between 0 and 1.")
         if not capacity > 0:
@@ -88,6 +138,23 @@ class BloomFilter(object):
         if bitarray_type == BloomFilter.BASE_MEMORY:
             self.bitarray = bitarray.MemoryBitArray(self.num_bits)
             self.bitarray.setall(False)
+        elif bitarray_type == BloomFilter.BASE_MMAP:
+            file_path = bitarray.MmapBitArray.make_file_path(path, name)
+            header = bitarray.MmapBitArray.read_header(file_path)
+            if header:  # 已有快照，参数以文件头为准
+                self._setup(
+                    header["error_rate"],
+                    header["num_slices"],
+                    header["bits_per_slice"],
+                    header["capacity"],
+                )
+            self.bitarray = bitarray.MmapBitArray(
+                file_path,
+                self.capacity,
+                self.error_rate,
+                self.num_slices,
+                self.bits_per_slice,
+            )
         else:
             raise ValueError("not support this bitarray type")
 
@@ -98,18 +165,26 @@ class BloomFilter(object):
         self.capacity = capacity
         self.num_bits = num_slices * bits_per_slice
         self.make_hashes = make_hashfuncs(self.num_slices, self.bits_per_slice)
+        if np is not None:
+            self.make_batch_hashes = make_batch_hashfuncs(self.num_slices, self.bits_per_slice)
+            self._slice_offsets = np.arange(self.num_slices, dtype=np.int64) * self.bits_per_slice
 
         self._is_at_capacity = False
         self._check_capacity_time = 0
+        self._bit_count = None  # 已置1的位数，首次使用时统计一次，之后由add增量维护
 
     def __repr__(self):
         return "<BloomFilter: {}>".format(self.bitarray)
 
-    def get(self, keys, to_list=False):
-        is_list = isinstance(keys, list)
-        keys = keys if is_list else [keys]
-        is_exists = []
+    def _is_vectorized(self, keys):
+        return (
+            self.vectorized
+            and np is not None
+            and len(keys) >= self.VECTORIZE_MIN_KEYS
+            and hasattr(self.bitarray, "get_batch")
+        )
 
+    def _get_offsets(self, keys):
         offsets = []
         for key in keys:
             hashes = self.make_hashes(key)
@@ -118,9 +193,23 @@ class BloomFilter(object):
                 offsets.append(offset + k)
                 offset += self.bits_per_slice
 
-        old_values = self.bitarray.get(offsets)
-        for i in range(0, len(old_values), self.num_slices):
-            is_exists.append(int(all(old_values[i : i + self.num_slices])))
+        return offsets
+
+    def _get_batch_offsets(self, keys):
+        return (self.make_batch_hashes(keys) + self._slice_offsets).ravel()
+
+    def get(self, keys, to_list=False):
+        is_list = isinstance(keys, list)
+        keys = keys if is_list else [keys]
+        is_exists = []
+
+        if self._is_vectorized(keys):
+            old_values = self.bitarray.get_batch(self._get_batch_offsets(keys))
+            is_exists = old_values.reshape(-1, self.num_slices).all(axis=1).astype(int).tolist()
+        else:
+            old_values = self.bitarray.get(self._get_offsets(keys))
+            for i in range(0, len(old_values), self.num_slices):
+                is_exists.append(int(all(old_values[i : i + self.num_slices])))
 
         if to_list:
             return is_exists
@@ -149,12 +238,18 @@ class BloomFilter(object):
         if self._is_at_capacity:
             return self._is_at_capacity
 
-        bit_count = self.bitarray.count()
+        bit_count = self.bit_count
         if bit_count and bit_count / self.num_bits > 0.5:
             self._is_at_capacity = True
 
         return self._is_at_capacity
 
+    @property
+    def bit_count(self):
+        if self._bit_count is None:
+            self._bit_count = self.bitarray.count()
+        return self._bit_count
+
     def add(self, keys):
         """
         Adds a key to this bloom filter. If the key already exists in this
@@ -170,104 +265,172 @@ class BloomFilter(object):
         keys = keys if is_list else [keys]
         is_added = []
 
-        offsets = []
-        for key in keys:
-            hashes = self.make_hashes(key)
-            offset = 0
-            for k in hashes:
-                offsets.append(offset + k)
-                offset += self.bits_per_slice
+        if self._is_vectorized(keys):
+            old_values = self.bitarray.set_batch(self._get_batch_offsets(keys), 1)
+            is_added = (~old_values.reshape(-1, self.num_slices).all(axis=1)).astype(int).tolist()
+            new_bits = len(old_values) - int(old_values.sum())
+        else:
+            old_values = self.bitarray.set(self._get_offsets(keys), 1)
+            for i in range(0, len(old_values), self.num_slices):
+                is_added.append(1 ^ int(all(old_values[i : i + self.num_slices])))
+            new_bits = len(old_values) - sum(old_values)
 
-        old_values = self.bitarray.set(offsets, 1)
-        for i in range(0, len(old_values), self.num_slices):
-            is_added.append(1 ^ int(all(old_values[i : i + self.num_slices])))
+        # old_values 与逐个设置的结果一致，为0的位就是这次新置1的位
+        self._bit_count = self.bit_count + new_bits
 
         return is_added if is_list else is_added[0]
 
+    def flush(self, force=False):
+        self.bitarray.flush(force)
+
+    def close(self):
+        self.bitarray.close()
+
 
 class ScalableBloomFilter(object):
     """
     自动扩展空间的bloomfilter, 当一个filter满一半的时候，创建下一个
+    第一个filter在首次add/get时才创建，之后每个filter的容量是上一个的growth_factor倍
+    第i个filter的误判率为 error_rate * (1 - r) * r ** i（r为error_tightening_ratio），
+    所有filter的误判率之和不超过error_rate，链上filter变多时总误判率不会随之增长
     """
 
     BASE_MEMORY = BloomFilter.BASE_MEMORY
+    BASE_MMAP = BloomFilter.BASE_MMAP
 
     def __init__(
         self,
-        initial_capacity: int = 10000000,
+        initial_capacity: int = 100000,
         error_rate: float = 0.00001,
         bitarray_type=BASE_MEMORY,
         name=None,
         redis_url=None,
+        path="./dedup_cache/",
+        growth_factor: int = 4,
+        error_tightening_ratio: float = 0.5,
     ):
 
         if not error_rate or error_rate < 0:
             raise ValueError("Error_Rate must be a decimal less than 0.")
+        if not growth_factor >= 1:
+            raise ValueError("Growth_Factor must be >= 1")
+        if not (0 < error_tightening_ratio < 1):
+            raise ValueError("Error_Tightening_Ratio must be between 0 and 1.")
 
         self._setup(
-            initial_capacity, error_rate, name, bitarray_type, redis_url=redis_url
+            initial_capacity,
+            error_rate,
+            name,
+            bitarray_type,
+            redis_url=redis_url,
+            path=path,
+            growth_factor=growth_factor,
+            error_tightening_ratio=error_tightening_ratio,
         )
 
-    def _setup(self, initial_capacity, error_rate, name, bitarray_type, redis_url):
+    def _setup(
+        self,
+        initial_capacity,
+        error_rate,
+        name,
+        bitarray_type,
+        redis_url,
+        path,
+        growth_factor,
+        error_tightening_ratio,
+    ):
         self.initial_capacity = initial_capacity
         self.error_rate = error_rate
         self.name = name
         self.bitarray_type = bitarray_type
         self.redis_url = redis_url
+        self.path = path
+        self.growth_factor = growth_factor
+        self.error_tightening_ratio = error_tightening_ratio
 
-        self.filters = []
-
-        self.filters.append(self.create_filter())
+        self.filters = []  # 首次使用时由check_filter_capacity创建
         self._thread_lock = threading.RLock()
-        self._check_capacity_time = 0
 
     def __repr__(self):
+        if not self.filters:
+            return "<ScalableBloomFilter: {} (not allocated)>".format(self.name)
         return "<ScalableBloomFilter: {}>".format(self.filters[-1].bitarray)
 
+    def _filter_name(self):
+        return self.name + str(len(self.filters)) if self.name else self.name
+
+    def _load_filters(self):
+        self.filters.append(self.create_filter())
+        if self.bitarray_type == ScalableBloomFilter.BASE_MMAP:
+            # 加载上次运行时已扩展出的filter
+            while os.path.exists(
+                bitarray.MmapBitArray.make_file_path(self.path, self._filter_name())
+            ):
+                self.filters.append(self.create_filter())
+
     def create_filter(self):
+        if self.filters:
+            # 已有的filter可能来自快照，容量以实际的为准
+            capacity = self.filters[-1].capacity * self.growth_factor
+        else:
+            capacity = self.initial_capacity
+
         filter = BloomFilter(
-            capacity=self.initial_capacity,
-            error_rate=self.error_rate,
+            capacity=capacity,
+            error_rate=self.filter_error_rate(len(self.filters)),
             bitarray_type=self.bitarray_type,
-            name=self.name + str(len(self.filters)) if self.name else self.name,
+            name=self._filter_name(),
             redis_url=self.redis_url,
+            path=self.path,
         )
 
         return filter
 
+    def filter_error_rate(self, index):
+        """
+        第index个filter的误判率，按error_tightening_ratio等比收紧
+        快照中已有的filter以文件头中的误判率为准
+        """
+        ratio = self.error_tightening_ratio
+        return self.error_rate * (1 - ratio) * ratio ** index
+
     def check_filter_capacity(self):
         """
-        检测filter状态，如果已满，加载新的filter
+        检测filter状态，如果还没有filter或已满，创建新的filter
+        filter的bit_count是增量维护的，检查开销很小，每次add/get都检查，避免容量小的filter被写满
         @return:
         """
-        if (
-            not self._check_capacity_time
-            or time.time() - self._check_capacity_time > 1800
-        ):
-            if self.bitarray_type == ScalableBloomFilter.BASE_MEMORY:
-                with self._thread_lock:
-                    while True:
-                        if self.filters[-1].is_at_capacity:
-                            self.filters.append(self.create_filter())
-                        else:
-                            break
-
-                    self._check_capacity_time = time.time()
-            else:
-                # 全局锁 同一时间只有一个进程在真正的创建新的filter，等这个进程创建完，其他进程只是把刚创建的filter append进来
-                key = (
-                    f"ScalableBloomFilter:{self.name}"
-                    if self.name
-                    else "ScalableBloomFilter"
-                )
+        if self.filters and not self.filters[-1].is_at_capacity:
+            return
+
+        with self._thread_lock:
+            if not self.filters:
+                self._load_filters()
 
-                while True:
-                    if self.filters[-1].is_at_capacity:
-                        self.filters.append(self.create_filter())
-                    else:
-                        break
+            while self.filters[-1].is_at_capacity:
+                self.filters.append(self.create_filter())
 
-                self._check_capacity_time = time.time()
+    @staticmethod
+    def _mark_first_occurrence(keys, not_exist_keys, not_exist_value):
+        """
+        将检查结果映射回keys，不存在的key只有第一次出现时记为not_exist_value，其余记为相反值
+        @param keys: 原始key列表，可包含重复
+        @param not_exist_keys: 所有filter中都不存在的key
+        @param not_exist_value: 不存在时的取值 add为1 get为0
+        @return: 与keys一一对应的结果列表
+        """
+        not_exist_keys = set(not_exist_keys)
+        exist_value = 1 ^ not_exist_value
+
+        results = []
+        for key in keys:
+            if key in not_exist_keys:
+                not_exist_keys.discard(key)
+                results.append(not_exist_value)
+            else:
+                results.append(exist_value)
+
+        return results
 
     def add(self, keys, skip_check=False):
         """
@@ -314,16 +477,7 @@ class ScalableBloomFilter(object):
                 current_filter.add(not_exist_keys)
 
             # 比较key是否已存在, 内部重复的key 若不存在啊则只留其一算为不存在，其他看作已存在
-            for i, key in enumerate(keys):
-                for j, not_exist_key in enumerate(not_exist_keys):
-                    if key == not_exist_key:
-                        keys[i] = 1
-                        not_exist_keys.pop(j)
-                        break
-                else:
-                    keys[i] = 0
-
-            is_added = keys
+            is_added = self._mark_first_occurrence(keys, not_exist_keys, 1)
             return is_added if is_list else is_added[0]
 
     def get(self, keys):
@@ -331,7 +485,7 @@ class ScalableBloomFilter(object):
 
         is_list = isinstance(keys, list)
 
-        keys = keys if is_list else [keys]  # 最终会修改为 [0, 1, ...] 0表示不存在 1 已存在
+        keys = keys if is_list else [keys]
         not_exist_keys = list(set(keys))
 
         # 检查之前的bloomfilter是否存在
@@ -353,18 +507,22 @@ class ScalableBloomFilter(object):
                 break
 
         # 比较key是否已存在, 内部重复的key 若不存在啊则只留其一算为不存在，其他看作已存在
-        for i, key in enumerate(keys):
-            for j, not_exist_key in enumerate(not_exist_keys):
-                if key == not_exist_key:
-                    keys[i] = 0
-                    not_exist_keys.pop(j)
-                    break
-            else:
-                keys[i] = 1
-
-        is_exists = keys
+        is_exists = self._mark_first_occurrence(keys, not_exist_keys, 0)
         return is_exists if is_list else is_exists[0]
 
+    def flush(self, force=False):
+        """
+        持久化到快照文件，只有BASE_MMAP需要
+        @param force: 为False时按时间间隔节流
+        """
+        for filter in self.filters:
+            filter.flush(force)
+
+    def close(self):
+        with self._thread_lock:
+            for filter in self.filters:
+                filter.close()
+
     @property
     def capacity(self):
         """Returns the total capacity for all filters in this SBF"""
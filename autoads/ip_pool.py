@@ -271,8 +271,9 @@ class IPPoolManager:
                     self._browser_proxy_map.clear()
                     # Save to config
                     import json
-                    config.set_option('ip_pool', 'proxies', json.dumps(new_proxies))
-                    config.set_option('ip_pool', 'enabled', 'True')
+                    with config.transaction():
+                        config.set_option('ip_pool', 'proxies', json.dumps(new_proxies))
+                        config.set_option('ip_pool', 'enabled', 'True')
                     log.info(f"已从文件加载 {loaded} 个代理")
                     
         except FileNotFoundError:
@@ -338,8 +339,9 @@ class IPPoolManager:
             self._failed_proxies.clear()
             self._browser_proxy_map.clear()
             self._current_index = 0
-            config.set_option('ip_pool', 'proxies', '[]')
-            config.set_option('ip_pool', 'enabled', 'False')
+            with config.transaction():
+                config.set_option('ip_pool', 'proxies', '[]')
+                config.set_option('ip_pool', 'enabled', 'False')
             log.info("已清空所有代理配置")
 
 
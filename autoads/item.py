@@ -13,6 +13,15 @@ import re
 import autoads.tools as tools
 
 
+_EXCLUDED_KEYS = frozenset((
+    "__name__",
+    "__table_name__",
+    "__name_underline__",
+    "__update_key__",
+    "__unique_key__",
+))
+
+
 class ItemMetaclass(type):
     def __new__(cls, name, bases, attrs):
         attrs.setdefault("__name__", None)
@@ -21,10 +30,29 @@ class ItemMetaclass(type):
         attrs.setdefault("__update_key__", None)
         attrs.setdefault("__unique_key__", None)
 
+        # 编译to_dict的布局：__dict__中的key对应的输出字段名（None为不输出），按需填充
+        attrs["__dict_keys__"] = {}
+        # 子类声明了__slots__时，slots中的字段也输出到to_dict
+        item_slots = []
+        for base in bases:
+            item_slots.extend(getattr(base, "__item_slots__", ()))
+        slots = attrs.get("__slots__", ())
+        if isinstance(slots, str):
+            slots = (slots,)
+        for slot in slots:
+            if slot not in ("__dict__", "__weakref__", "_fingerprint") and slot not in item_slots:
+                if slot.startswith("__") and not slot.endswith("__"):
+                    slot = f"_{name.lstrip('_')}{slot}"  # 私有slot的实际名字
+                item_slots.append(slot)
+        attrs["__item_slots__"] = tuple(item_slots)
+        attrs["__item_slot_set__"] = frozenset(item_slots)
+
         return type.__new__(cls, name, bases, attrs)
 
 
 class Item(metaclass=ItemMetaclass):
+    # _fingerprint 缓存 (唯一键及其值, fingerprint)；子类可以声明__slots__减少属性访问开销
+    __slots__ = ("__dict__", "__weakref__", "_fingerprint")
     __unique_key__ = []
 
     def __init__(self, **kwargs):
@@ -34,10 +62,33 @@ class Item(metaclass=ItemMetaclass):
         return "<{}: {}>".format(self.item_name, tools.dumps_json(self.to_dict))
 
     def __getitem__(self, key):
+        if key in self.__class__.__item_slot_set__:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
         return self.__dict__[key]
 
     def __setitem__(self, key, value):
-        self.__dict__[key] = value
+        if key in self.__class__.__item_slot_set__:
+            setattr(self, key, value)
+        else:
+            self.__dict__[key] = value
+        self._fingerprint = None
+
+    def __setstate__(self, state):
+        """
+        pickle/copy恢复：字段改为__slots__之前pickle的数据，__dict__中与slot同名的字段写入slot
+        """
+        state, slots = state if isinstance(state, tuple) else (state, None)
+        item_slots = self.__class__.__item_slot_set__
+        for key, value in (state or {}).items():
+            if key in item_slots:
+                setattr(self, key, value)
+            else:
+                self.__dict__[key] = value
+        for key, value in (slots or {}).items():
+            setattr(self, key, value)
 
     def pre_to_db(self):
         """
@@ -45,20 +96,40 @@ class Item(metaclass=ItemMetaclass):
         """
         pass
 
+    @classmethod
+    def _dict_key(cls, key):
+        """
+        __dict__中的key在to_dict中的字段名，None为不输出
+        """
+        if key in _EXCLUDED_KEYS:
+            return None
+        if key.startswith(f"_{cls.__name__}"):
+            key = key.replace(f"_{cls.__name__}", "")
+        return key
+
     @property
     def to_dict(self):
+        cls = self.__class__
+        dict_keys = cls.__dict_keys__
         propertys = {}
+        # slots中的字段在前，与改为__slots__之前按__init__赋值顺序输出一致
+        for slot in cls.__item_slots__:
+            try:
+                value = getattr(self, slot)
+            except AttributeError:
+                continue
+            name = dict_keys.get(slot)
+            if name is None:
+                name = dict_keys[slot] = cls._dict_key(slot)
+            propertys[name] = value
+
         for key, value in self.__dict__.items():
-            if key not in (
-                    "__name__",
-                    "__table_name__",
-                    "__name_underline__",
-                    "__update_key__",
-                    "__unique_key__",
-            ):
-                if key.startswith(f"_{self.__class__.__name__}"):
-                    key = key.replace(f"_{self.__class__.__name__}", "")
-                propertys[key] = value
+            try:
+                name = dict_keys[key]
+            except KeyError:
+                name = dict_keys[key] = cls._dict_key(key)
+            if name is not None:
+                propertys[name] = value
 
         return propertys
 
@@ -111,23 +182,58 @@ class Item(metaclass=ItemMetaclass):
 
     @property
     def fingerprint(self):
-        args = []
-        for key, value in self.to_dict.items():
-            # log.info(f'key-->{key},value-->{value},unique_key-->{self.unique_key}')
-            if value:
-                if (self.unique_key and key in self.unique_key) or not self.unique_key:
-                    # log.info(f'{key}-->{value}')
-                    args.append(str(value))
+        """
+        唯一键的值（没有唯一键时为所有字段的值）排序后的md5
+        计算后缓存，唯一键或其值改变时（属性赋值、item[key]赋值）重新计算
+        """
+        unique_key = self.unique_key
+        if isinstance(unique_key, str):
+            unique_key = (unique_key,)
+
+        # 只缓存唯一键都有值的情况，比较唯一键的值即可判断缓存是否有效
+        key_values = None
+        if unique_key:
+            item_slots = self.__class__.__item_slot_set__
+            fields = self.__dict__
+            key_values = tuple(getattr(self, key, None) if key in item_slots else fields.get(key) for key in unique_key)
+            if None in key_values:
+                key_values = None
+            else:
+                key_values = (tuple(unique_key), key_values)
+                cached = getattr(self, "_fingerprint", None)
+                if cached and cached[0] == key_values:
+                    return cached[1]
+
+        if key_values:
+            args = [str(value) for value in dict(zip(*key_values)).values() if value]
+        elif unique_key:
+            propertys = self.to_dict
+            args = [str(propertys[key]) for key in dict.fromkeys(unique_key) if propertys.get(key)]
+        else:
+            propertys = self.to_dict
+            args = [str(value) for value in propertys.values() if value]
 
         if args:
             args = sorted(args)
             # return args[0]  #单个key测试用
-            return tools.get_md5(*args)
+            fingerprint = tools.get_md5(*args)
+            if key_values:
+                self._fingerprint = (key_values, fingerprint)
+            return fingerprint
         else:
             return None
 
     def to_UpdateItem(self):
-        update_item = UpdateItem(**self.__dict__)
+        kwargs = {}
+        for slot in self.__class__.__item_slots__:
+            try:
+                kwargs[slot] = getattr(self, slot)
+            except AttributeError:
+                pass
+        kwargs.update(self.__dict__)
+        update_item = UpdateItem(**kwargs)
+        if self.unique_key:
+            update_item.unique_key = self.unique_key
         update_item.item_name = self.item_name
         update_item.update_key=self.__update_key__
         update_item.table_name=self.__table_name__
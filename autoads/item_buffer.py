@@ -2,16 +2,37 @@
 
 import importlib
 import threading
-from queue import Queue
+import time
+from concurrent.futures import ThreadPoolExecutor
 
 import autoads.tools as tools
+from autoads.config import config
 from autoads.dedup import Dedup
+from autoads.dedup.bloomfilter import ScalableBloomFilter
 from autoads.item import Item, UpdateItem
 from autoads.log import log
 from autoads.pipelines import BasePipeline
+from autoads.task_counter import TaskCounter
 
-MAX_ITEM_COUNT = 5000  # 缓存中最大item数
+MAX_ITEM_COUNT = 5000  # 缓存中最大item数，超过后put_item阻塞
 UPLOAD_BATCH_MAX_SIZE = 1000
+FLUSH_ITEM_COUNT = 500  # 缓存中的数据达到该条数时入库
+FLUSH_INTERVAL = 0.2  # 或最早的一条数据等待了该秒数时入库
+WRITER_COUNT = 4  # 并行写入不同表的线程数
+
+
+class _LazyDumpsJson:
+    """
+    写日志时才格式化数据，日志级别不输出时不做格式化
+    """
+
+    __slots__ = ("datas",)
+
+    def __init__(self, datas):
+        self.datas = datas
+
+    def __str__(self):
+        return tools.dumps_json(self.datas, indent=16)
 
 
 class ItemBuffer(threading.Thread):
@@ -19,18 +40,35 @@ class ItemBuffer(threading.Thread):
 
     ITEM_PIPELINES = [
         # "autoads.pipelines.mysql_pipeline.MysqlPipeline",
+        # "autoads.pipelines.segment_pipeline.SegmentPipeline",  # 列式分段存储
+        # "autoads.pipelines.sqlite_pipeline.SqlitePipeline",  # 嵌入式sqlite数据库
         "autoads.pipelines.file_pipeline.FilePipeline",
     ]
 
-    def __init__(self, stop_event=None):
+    def __init__(self, stop_event=None, task_counter: TaskCounter = None):
         if not hasattr(self, "_table_item"):
             super(ItemBuffer, self).__init__()
 
             self._thread_stop = False
             self._is_adding_to_db = False
             self.stop_event = stop_event
-
-            self._items_queue = Queue(maxsize=MAX_ITEM_COUNT)
+            self._task_counter = task_counter  # 与请求队列共享的未完成任务计数
+
+            # 双缓存：采集线程写入_buffer，入库线程整个取走后写入数据库，期间采集线程写入新的_buffer
+            self._buffer = []
+            self._buffer_started = 0  # _buffer中第一条数据的时间
+            self._buffer_condition = threading.Condition()
+            self._writing_count = 0  # 入库线程正在写入的数据条数
+            self._stats = {
+                "max_queue_depth": 0,
+                "flush_count": 0,
+                "flushed_items": 0,
+                "flush_seconds": 0.0,
+                "last_flush_ms": 0.0,
+                "max_flush_ms": 0.0,
+                "blocked_puts": 0,
+                "blocked_seconds": 0.0,
+            }
 
             self._item_tables = {
                 # 'item_name': 'table_name' # 缓存item名与表名对应关系
@@ -44,14 +82,30 @@ class ItemBuffer(threading.Thread):
 
             }
 
+            self._item_table_keys = {
+                # 'table_name': (__unique_key__, __update_key__) # 新表入库前按此建表
+            }
+            self._created_tables = set()
+
             self._pipelines = self.load_pipelines()
 
             self._mysql_pipeline = None
 
+            self._writer_pool = None  # 按表并行写入的线程池
+
             # self._have_mysql_pipeline = MYSQL_PIPELINE_PATH in self.ITEM_PIPELINES
 
             if not self.__class__.dedup:
-                self.__class__.dedup = Dedup(to_md5=False)
+                if config.dedup_persistent:
+                    # 去重数据映射到dedup_cache下的快照文件，重启后不丢失
+                    self.__class__.dedup = Dedup(
+                        to_md5=False,
+                        absolute_name="item_buffer",
+                        bitarray_type=ScalableBloomFilter.BASE_MMAP,
+                        path=config.dedup_cache_path,
+                    )
+                else:
+                    self.__class__.dedup = Dedup(to_md5=False)
 
             # 导出重试的次数
             self.export_retry_times = 0
@@ -85,81 +139,169 @@ class ItemBuffer(threading.Thread):
         while not self._thread_stop:
             if self.stop_event and self.stop_event.isSet():
                 log.info(f'界面中点击了停止按钮，正在清理临时数据库，并设置thread_stop=True')
-                tools.clear_queue(self._items_queue)
+                self.__clear_items()
                 self._thread_stop=True
                 break
 
+            self.__wait_for_items()
             self.flush()
-            tools.delay_time(1)
-
 
         self.close()
 
     def stop(self):
         self._thread_stop = True
+        with self._buffer_condition:
+            self._buffer_condition.notify_all()
         self._started.clear()
 
+    def __is_stopped(self):
+        return self._thread_stop or bool(self.stop_event and self.stop_event.isSet())
+
+    def __wait_for_items(self):
+        """
+        等到缓存中的数据达到 FLUSH_ITEM_COUNT 条，或最早的一条已等待 FLUSH_INTERVAL 秒
+        """
+        with self._buffer_condition:
+            while not self.__is_stopped():
+                if len(self._buffer) >= FLUSH_ITEM_COUNT:
+                    return
+                if self._buffer:
+                    timeout = self._buffer_started + FLUSH_INTERVAL - time.monotonic()
+                    if timeout <= 0:
+                        return
+                else:
+                    timeout = 1  # 没有数据时最多等待1秒再检查状态
+                self._buffer_condition.wait(timeout)
+
     def put_item(self, item):
         if isinstance(item, Item) and not (self.stop_event and self.stop_event.isSet()):
-            self._items_queue.put(item)
+            if self._task_counter:
+                self._task_counter.add()
+
+            with self._buffer_condition:
+                if len(self._buffer) >= MAX_ITEM_COUNT:
+                    # 入库跟不上采集：阻塞到入库线程取走当前缓存
+                    blocked_at = time.perf_counter()
+                    while len(self._buffer) >= MAX_ITEM_COUNT and not self.__is_stopped():
+                        self._buffer_condition.wait(1)
+                    self._stats["blocked_puts"] += 1
+                    self._stats["blocked_seconds"] += time.perf_counter() - blocked_at
+
+                if not self._buffer:
+                    self._buffer_started = time.monotonic()
+                self._buffer.append(item)
+
+                depth = len(self._buffer)
+                if depth > self._stats["max_queue_depth"]:
+                    self._stats["max_queue_depth"] = depth
+                if depth == 1 or depth == FLUSH_ITEM_COUNT:
+                    self._buffer_condition.notify_all()
+
+    def __swap_buffer(self):
+        """
+        取走正在收集的缓存，采集线程继续写入新的缓存
+        """
+        with self._buffer_condition:
+            items, self._buffer = self._buffer, []
+            self._writing_count = len(items)
+            self._buffer_condition.notify_all()  # 唤醒被阻塞的put_item
+        return items
+
+    def __clear_items(self):
+        count = len(self.__swap_buffer())
+        self._writing_count = 0
+        if self._task_counter:
+            self._task_counter.done(count)
+
+    def __task_done(self, count):
+        if self._task_counter:
+            self._task_counter.done(count)
+
+    def get_stats(self):
+        """
+        入库统计，用于判断瓶颈在入库还是在浏览器采集
+        queue_depth: 缓存中等待入库的数据条数
+        max_queue_depth: 缓存中最多时的数据条数
+        flush_count / flushed_items: 入库次数 / 入库的数据条数
+        last_flush_ms / avg_flush_ms / max_flush_ms: 每次入库的耗时
+        blocked_puts / blocked_seconds: 缓存满时put_item被阻塞的次数 / 总时长
+        """
+        with self._buffer_condition:
+            stats = dict(self._stats)
+            stats["queue_depth"] = len(self._buffer) + self._writing_count
+        flush_count = stats["flush_count"]
+        stats["avg_flush_ms"] = stats.pop("flush_seconds") * 1000 / flush_count if flush_count else 0
+        return stats
 
     def flush(self):
-        try:
-            items = []
-            update_items = []
-            requests = []
-            callbacks = []
-            items_fingerprints = []
-            data_count = 0
-
-            while not self._items_queue.empty():
-                data = self._items_queue.get_nowait()
-
-                data_count += 1
+        items = self.__swap_buffer()
+        if not items:
+            return
 
-                # data 分类
-                if callable(data):
-                    # log.info(f'callable true {data}')
-                    callbacks.append(data)
+        started = time.perf_counter()
+        blocked_seconds = self._stats["blocked_seconds"]
+        try:
+            for begin in range(0, len(items), UPLOAD_BATCH_MAX_SIZE):
+                if self.stop_event and self.stop_event.isSet():
+                    self.__task_done(len(items) - begin)
+                    return
 
-                elif isinstance(data, UpdateItem):
-                    update_items.append(data)
+                batch = items[begin:begin + UPLOAD_BATCH_MAX_SIZE]
+                try:
+                    self.__add_batch_to_db(batch)
+                finally:
+                    self.__task_done(len(batch))
 
-                elif isinstance(data, Item):
-                    items.append(data)
-                    items_fingerprints.append(data.fingerprint)
+        except Exception as e:
+            log.exception(e)
 
-                else:  # request-redis
-                    requests.append(data)
+        finally:
+            self._writing_count = 0
+            self.__record_flush(len(items), time.perf_counter() - started, blocked_seconds)
+
+    def __record_flush(self, count, seconds, blocked_seconds):
+        stats = self._stats
+        stats["flush_count"] += 1
+        stats["flushed_items"] += count
+        stats["flush_seconds"] += seconds
+        stats["last_flush_ms"] = seconds * 1000
+        stats["max_flush_ms"] = max(stats["max_flush_ms"], seconds * 1000)
+
+        blocked = stats["blocked_seconds"] - blocked_seconds
+        if blocked > 0:
+            log.warning(
+                f"入库跟不上采集速度：本次入库{count}条耗时{seconds:.2f}秒，采集线程被阻塞{blocked:.2f}秒"
+            )
 
-                # print(f'fingerprints-1:{len(items_fingerprints)}')
+    def __add_batch_to_db(self, batch):
+        items = []
+        update_items = []
+        requests = []
+        callbacks = []
+        items_fingerprints = []
 
-                if data_count >= UPLOAD_BATCH_MAX_SIZE:
-                    self.__add_item_to_db(
-                        items, update_items, requests, callbacks, items_fingerprints
-                    )
+        for data in batch:
+            # data 分类
+            if callable(data):
+                # log.info(f'callable true {data}')
+                callbacks.append(data)
 
-                    items = []
-                    update_items = []
-                    requests = []
-                    callbacks = []
-                    items_fingerprints = []
-                    data_count = 0
+            elif isinstance(data, UpdateItem):
+                update_items.append(data)
 
-            if self.stop_event and self.stop_event.isSet():
-                tools.clear_queue(self._items_queue)
-                return
+            elif isinstance(data, Item):
+                items.append(data)
+                items_fingerprints.append(data.fingerprint)
 
-            if data_count:
-                self.__add_item_to_db(
-                    items, update_items, requests, callbacks, items_fingerprints
-                )
+            else:  # request-redis
+                requests.append(data)
 
-        except Exception as e:
-            log.exception(e)
+        self.__add_item_to_db(
+            items, update_items, requests, callbacks, items_fingerprints
+        )
 
     def get_items_count(self):
-        return self._items_queue.qsize()
+        return len(self._buffer) + self._writing_count
 
     def is_adding_to_db(self):
         return self._is_adding_to_db
@@ -182,35 +324,23 @@ class ItemBuffer(threading.Thread):
 
         dedup_items = []
         dedup_items_fingerprints = []
-        items_count = dedup_items_count = dup_items_count = 0
-        # print(f'is_exists--># _is_exists}')
-        while _is_exists:
-            item = items.pop(0)
-            items_fingerprint = items_fingerprints.pop(0)
-            # print(f'is_exists-->{_is_exists}')
-            is_exist = _is_exists.pop(0)
-
-            items_count += 1
-
+        for item, items_fingerprint, is_exist in zip(items, items_fingerprints, _is_exists):
             if not is_exist:
                 dedup_items.append(item)
                 dedup_items_fingerprints.append(items_fingerprint)
-                dedup_items_count += 1
-            else:
-                # print(f"重复的链接：{items_fingerprint}")
-                dup_items_count += 1
 
+        items_count = len(_is_exists)
+        dedup_items_count = len(dedup_items)
         log.info(
-            "待入库数据 {} 条， 重复 {} 条，实际待入库数据 {} 条".format(
-                items_count, dup_items_count, dedup_items_count
-            )
+            "待入库数据 %s 条， 重复 %s 条，实际待入库数据 %s 条",
+            items_count, items_count - dedup_items_count, dedup_items_count
         )
 
         return dedup_items, dedup_items_fingerprints
 
     def __pick_items(self, items, is_update_item=False):
         """
-        将每个表之间的数据分开 拆分后 原items为空
+        将每个表之间的数据分开
         @param items:
         @param is_update_item:
         @return:
@@ -219,35 +349,43 @@ class ItemBuffer(threading.Thread):
             # 'table_name': [{}, {}]
         }
 
-        while items:
-            item = items.pop(0)
-            # 取item下划线格式的名
-            # 下划线类的名先从dict中取，没有则现取，然后存入dict。加快下次取的速度
-            # item_name = item.item_name
-            # table_name = self._item_tables.get(item_name)
+        item_update_keys = self._item_update_keys
+        item_table_keys = self._item_table_keys
+        for item in items:
             # 考虑到每个item都会有一个保存地址，所以就按照__table_name来做
-            table_name=item.table_name
-            log.info(f'待保存数据信息：table_name={table_name}')
-            # if not table_name:
-            #     table_name = item.table_name
-            #     self._item_tables[item_name] = table_name
-
-            if table_name not in datas_dict:
-                datas_dict[table_name] = []
+            table_name = item.table_name
 
-            datas_dict[table_name].append(item.to_dict)
+            datas = datas_dict.get(table_name)
+            if datas is None:
+                datas = datas_dict[table_name] = []
+            datas.append(item.to_dict)
 
-            if is_update_item and table_name not in self._item_update_keys:
-                self._item_update_keys[table_name] = item.update_key
-                self._item_unique_keys[table_name] = item.unique_key
-                # print(f'item.update_key-->{item.update_key}')
+            if is_update_item:
+                if table_name not in item_update_keys:
+                    item_update_keys[table_name] = item.update_key
+                    self._item_unique_keys[table_name] = item.unique_key
+            elif table_name not in item_table_keys:
+                item_table_keys[table_name] = (item.unique_key, item.__update_key__)
 
-            log.info(f'此次共有{len(datas_dict.keys())}个文件待保存')
+        if datas_dict:
+            log.info("此次共有%s个文件待保存", len(datas_dict))
 
         return datas_dict
 
     def __export_to_db(self, table, datas, is_update=False, update_keys=(), unique_keys=()):
 
+        if not is_update and table not in self._created_tables:
+            table_unique_keys, table_update_keys = self._item_table_keys.get(table, ((), ()))
+            for pipeline in self._pipelines:
+                try:
+                    pipeline.create_table(
+                        table, unique_keys=table_unique_keys or (), update_keys=table_update_keys or ()
+                    )
+                except Exception as e:
+                    log.error(f"{pipeline.__class__.__name__} 建表失败. table: {table}  error: {e}")
+                    return False
+            self._created_tables.add(table)
+
         for pipeline in self._pipelines:
             if is_update:
                 # if table == self._task_table and not isinstance(
@@ -280,63 +418,98 @@ class ItemBuffer(threading.Thread):
 
         return True
 
-    def __add_item_to_db(
-            self, items, update_items, requests, callbacks, items_fingerprints
-    ):
-        export_success = True
-        self._is_adding_to_db = True
-
-        items, items_fingerprints = self.__dedup_items(items, items_fingerprints)
+    @property
+    def writer_pool(self):
+        if not self._writer_pool:
+            self._writer_pool = ThreadPoolExecutor(max_workers=WRITER_COUNT, thread_name_prefix="item_writer")
+        return self._writer_pool
 
-        # 分捡
-        items_dict = self.__pick_items(items)
-        update_items_dict = self.__pick_items(update_items, is_update_item=True)
+    def __safe_export_to_db(self, table, datas, **kwargs):
+        """
+        一个表写入异常只算作该表失败，不影响其他写入线程
+        """
+        try:
+            return self.__export_to_db(table, datas, **kwargs)
+        except Exception as e:
+            log.exception(e)
+            return False
 
-        # item批量入库
-        failed_items = {"add": [], "update": [], "requests": []}
-        while items_dict:
-            table, datas = items_dict.popitem()
+    def __write_table(self, table_datas):
+        """
+        写入一个表的数据，在写入线程中执行
+        @return: 写入失败的数据 {"add": {"table": table, "datas": datas}, "update": {...}}
+        """
+        table, datas = table_datas
+        failed_items = {}
 
+        if "add" in datas:
             log.debug(
                 """
                 -------------- item 批量入库 --------------
                 表名: %s
                 datas: %s
-                    """
-                % (table, tools.dumps_json(datas, indent=16))
+                    """,
+                table, _LazyDumpsJson(datas["add"])
             )
 
-            if not self.__export_to_db(table, datas):
-                export_success = False
-                failed_items["add"].append({"table": table, "datas": datas})
-
-        # 执行批量update
-        while update_items_dict:
-            table, datas = update_items_dict.popitem()
+            if not self.__safe_export_to_db(table, datas["add"]):
+                failed_items["add"] = {"table": table, "datas": datas["add"]}
 
+        if "update" in datas:
             log.debug(
                 """
                 -------------- item 批量更新 --------------
                 表名: %s
                 datas: %s
-                    """
-                % (table, tools.dumps_json(datas, indent=16))
+                    """,
+                table, _LazyDumpsJson(datas["update"])
             )
 
             update_keys = self._item_update_keys.get(table)
             unique_keys = self._item_unique_keys.get(table)
             # print(f'unique_keys-->{unique_keys}')
-            if not self.__export_to_db(
-                    table, datas, is_update=True, update_keys=update_keys,unique_keys=unique_keys
+            if not self.__safe_export_to_db(
+                    table, datas["update"], is_update=True, update_keys=update_keys, unique_keys=unique_keys
             ):
+                failed_items["update"] = {"table": table, "datas": datas["update"]}
+
+        return failed_items
+
+    def __add_item_to_db(
+            self, items, update_items, requests, callbacks, items_fingerprints
+    ):
+        export_success = True
+        self._is_adding_to_db = True
+
+        items, items_fingerprints = self.__dedup_items(items, items_fingerprints)
+
+        # 分捡
+        items_dict = self.__pick_items(items)
+        update_items_dict = self.__pick_items(update_items, is_update_item=True)
+
+        # 每个表一个写入任务：同一个表内先入库后更新，不同的表并行写入
+        tables = {}
+        for table, datas in items_dict.items():
+            tables.setdefault(table, {})["add"] = datas
+        for table, datas in update_items_dict.items():
+            tables.setdefault(table, {})["update"] = datas
+
+        if len(tables) > 1:
+            results = list(self.writer_pool.map(self.__write_table, tables.items()))
+        else:
+            results = [self.__write_table(table_datas) for table_datas in tables.items()]
+
+        # 失败的数据按表记录
+        failed_items = {"add": [], "update": [], "requests": []}
+        for table_failed_items in results:
+            for kind, failed in table_failed_items.items():
                 export_success = False
-                failed_items["update"].append({"table": table, "datas": datas})
+                failed_items[kind].append(failed)
 
         if export_success:
             # 执行回调
-            while callbacks:
+            for callback in callbacks:
                 try:
-                    callback = callbacks.pop(0)
                     callback()
                 except Exception as e:
                     log.exception(e)
@@ -344,10 +517,19 @@ class ItemBuffer(threading.Thread):
             # 去重入库
             if items_fingerprints:
                 self.__class__.dedup.add(items_fingerprints, skip_check=True)
+                self.__class__.dedup.flush()
 
         self._is_adding_to_db = False
 
     def close(self):
+        log.info(f"入库统计: {self.get_stats()}")
+        if self.__class__.dedup:
+            self.__class__.dedup.flush(force=True)
+
+        if self._writer_pool:
+            self._writer_pool.shutdown(wait=True)
+            self._writer_pool = None
+
         # 调用pipeline的close方法
         for pipeline in self._pipelines:
             try:
@@ -12,14 +12,17 @@ from autoads.config import config
 
 
 class GroupItem(Item):
+    # 固定字段放在slots中，每个群组省掉一个__dict__
+    __slots__ = ('word', 'group_name', 'group_link', 'ads_id', 'create_time', 'last_apply_time', 'apply_nums', 'status',
+                 'priority')
     __table_name__ = config.groups_table
     __update_key__ = ('status', 'last_apply_time', 'apply_nums')
+    __unique_key__ = ('group_link',)
 
     def __init__(self):
         self.word = None
         self.group_name = None
         self.group_link = None
-        self.unique_key = ('group_link',)
         self.ads_id = None  # 使用的浏览器id，会对应facebook账号，在获取成员的时候就直接使用此id
         self.create_time = None  # 首次爬取日期
         self.last_apply_time = ''  # 最近一次申请的日期
@@ -12,8 +12,11 @@ from autoads.config import config
 
 
 class MemberItem(Item):
+    # 固定字段放在slots中，每个成员省掉一个__dict__
+    __slots__ = ('group_name', 'group_link', 'member_name', 'member_link', 'role_type', 'ads_id', 'priority', 'status')
     __table_name__ = config.members_table
     __update_key__ = ('status',)
+    __unique_key__ = ('member_link',)
 
     def __init__(self):
         self.group_name=None
@@ -21,7 +24,6 @@ class MemberItem(Item):
         # self.group_type = None  # 备份一下，这个群组是不是需要加入的，如果是需要加入的就需要由指定的ads_id来处理
         self.member_name = None
         self.member_link = None
-        self.unique_key = ['member_link']
         self.role_type = None  # 普通用户或者管理员和版主
         self.ads_id = None  # 备份一下，方便下次找的时候能够找到是对应哪个账号操作了当前群组
         self.priority = 300
@@ -1,6 +1,8 @@
 import logging
 import os
+import queue
 import sys
+import threading
 from logging.handlers import BaseRotatingHandler
 
 import loguru
@@ -22,6 +24,7 @@ class RotatingFileHandler(BaseRotatingHandler):
     def __init__(
             self, filename, mode="a", max_bytes=0, backup_count=0, encoding=None, delay=0
     ):
+        self.bytes_written = 0  # 当前文件已写入的字节数
         BaseRotatingHandler.__init__(self, filename, mode, encoding, delay)
         self.max_bytes = max_bytes
         self.backup_count = backup_count
@@ -55,16 +58,143 @@ class RotatingFileHandler(BaseRotatingHandler):
         if not self.delay:
             self.stream = self._open()
 
-    def shouldRollover(self, record):
+    def _open(self):
+        stream = super()._open()
+        # 只在打开文件时取一次文件大小，之后在内存中累加写入的字节数
+        self.bytes_written = os.path.getsize(self.baseFilename) if "a" in self.mode else 0
+        return stream
 
+    def shouldRollover(self, record):
         if self.stream is None:  # delay was set...
             self.stream = self._open()
-        if self.max_bytes > 0:  # are we rolling over?
-            msg = "%s\n" % self.format(record)
-            self.stream.seek(0, 2)  # due to non-posix-compliant Windows feature
-            if self.stream.tell() + len(msg) >= self.max_bytes:
-                return 1
-        return 0
+        return 1 if 0 < self.max_bytes <= self.bytes_written else 0
+
+    def write(self, record):
+        """
+        格式化一次并写入，不flush；按内存中记录的字节数判断是否需要滚动
+        """
+        msg = self.format(record) + self.terminator
+        size = len(msg.encode(self.encoding or "utf8", errors="replace"))
+        if self.stream is None:
+            self.stream = self._open()
+        if self.max_bytes > 0 and self.bytes_written and self.bytes_written + size >= self.max_bytes:
+            self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+        self.stream.write(msg)
+        self.bytes_written += size
+
+    def emit(self, record):
+        try:
+            self.write(record)
+            self.flush()
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+
+class QueueWriterHandler(logging.Handler):
+    """
+    与 logging.handlers.QueueHandler 类似：日志记录放入有界队列，由后台线程写入目标handler，
+    工作线程不等待磁盘IO。队列满时丢弃日志并计数，写入线程会把丢弃的条数写到日志中
+    """
+
+    _STOP = object()
+
+    def __init__(self, handler, max_queue_size=10000):
+        super().__init__()
+        self.handler = handler
+        self.queue = queue.Queue(max_queue_size)
+        self.dropped = 0  # 队列满时丢弃的日志条数
+        self._reported_dropped = 0
+        self._thread = threading.Thread(target=self._run, name="log_writer", daemon=True)
+        self._thread.start()
+
+    def emit(self, record):
+        try:
+            # 在调用线程中合并参数，之后参数对象被修改也不影响日志内容
+            record.msg = record.getMessage()
+            record.args = None
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+        except Exception:
+            self.handleError(record)
+
+    def _write(self, record):
+        write = getattr(self.handler, "write", None)
+        try:
+            if record.levelno < self.handler.level:
+                return
+            if write:
+                write(record)
+            else:
+                self.handler.handle(record)
+        except Exception:
+            self.handler.handleError(record)
+
+    def _report_dropped(self):
+        dropped = self.dropped - self._reported_dropped
+        if dropped:
+            self._reported_dropped += dropped
+            self._write(logging.makeLogRecord({
+                "name": "log_writer",
+                "levelno": logging.WARNING,
+                "levelname": "WARNING",
+                "msg": f"日志队列已满，丢弃了{dropped}条日志（共{self.dropped}条）",
+                "threadName": "log_writer",
+            }))
+
+    def _run(self):
+        while True:
+            records = [self.queue.get()]
+            # 一次取完队列中的记录，写完后只flush一次
+            while len(records) < 1000:
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            stop = False
+            for record in records:
+                if record is self._STOP:
+                    stop = True
+                elif not isinstance(record, threading.Event):  # Event 是 flush() 的标记
+                    self._write(record)
+            self._report_dropped()
+            try:
+                self.handler.flush()
+            except Exception:
+                pass
+            for record in records:
+                if isinstance(record, threading.Event):
+                    record.set()  # 之前的记录已写入文件
+            if stop:
+                return
+
+    def flush(self, timeout=5):
+        """
+        等待队列中已有的日志写入文件
+        """
+        if not self._thread.is_alive() or threading.current_thread() is self._thread:
+            return
+        flushed = threading.Event()
+        try:
+            self.queue.put(flushed, timeout=timeout)
+        except queue.Full:
+            return
+        flushed.wait(timeout)
+
+    def close(self):
+        if self._thread.is_alive():
+            try:
+                self.queue.put(self._STOP, timeout=5)
+            except queue.Full:
+                pass
+            self._thread.join(5)
+        self.handler.close()
+        super().close()
 
 
 def get_logger(
@@ -139,7 +269,8 @@ def get_logger(
             encoding=encoding,
         )
         rf_handler.setFormatter(formatter)
-        logger.addHandler(rf_handler)
+        # 后台线程写文件，工作线程不等待磁盘IO
+        logger.addHandler(QueueWriterHandler(rf_handler))
     if color and is_write_to_console:
         loguru_handler = InterceptHandler()
         loguru_handler.setFormatter(formatter)
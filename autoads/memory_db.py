@@ -3,16 +3,35 @@
 Created on 2020/4/21 11:42 PM
 ---------
 @summary: 基于内存的队列，代替redis
+          按ads_id分片：每个ads_id一个优先级子队列，没有ads_id的数据放到共享队列
+          线程领取某个ads_id的请求后，该ads_id被绑定到这个线程，直到unbind前其他线程不会再领取它的请求
 ---------
 @author: Boris
 @email: boris_liu@foxmail.com
 """
-from queue import PriorityQueue
+import heapq
+import threading
+import time
+
+from autoads.task_counter import TaskCounter
 
 
 class MemoryDB:
-    def __init__(self):
-            self.priority_queue = PriorityQueue()
+    def __init__(self, task_counter: TaskCounter = None):
+        """
+        :param task_counter: 未完成任务计数器，add时加一，task_done时减一，可与其他组件共享
+        """
+        self._shared_queue = []  # 没有ads_id的数据
+        self._key_queues = {
+            # 'ads_id': [request, ...]  # 小顶堆
+        }
+        self._bound_keys = set()  # 已被线程绑定的ads_id
+        self._condition = threading.Condition()
+        self.task_counter = task_counter or TaskCounter()
+
+    @staticmethod
+    def _get_key(item):
+        return getattr(item, 'ads_id', None)
 
     def add(self, item):
         """
@@ -20,18 +39,96 @@ class MemoryDB:
         :param item: 数据: 支持小于号比较的类 或者 （priority, item）
         :return:
         """
-        self.priority_queue.put(item)
+        key = self._get_key(item)
+        self.task_counter.add()
+        with self._condition:
+            if key is None:
+                heapq.heappush(self._shared_queue, item)
+            else:
+                heapq.heappush(self._key_queues.setdefault(key, []), item)
+            self._condition.notify_all()
+
+    def _pop(self, key=None):
+        if key is not None:
+            queue = self._key_queues.get(key)
+            if not queue:
+                return None
+            item = heapq.heappop(queue)
+            if not queue:
+                del self._key_queues[key]
+            return item
 
-    def get(self):
+        # 在共享队列和未被绑定的ads_id队列中取优先级最高的，取到ads_id的请求时同时绑定该ads_id
+        best_key, best_queue = None, self._shared_queue or None
+        for queue_key, queue in self._key_queues.items():
+            if queue_key in self._bound_keys:
+                continue
+            if best_queue is None or queue[0] < best_queue[0]:
+                best_key, best_queue = queue_key, queue
+
+        if best_queue is None:
+            return None
+
+        item = heapq.heappop(best_queue)
+        if best_key is not None:
+            self._bound_keys.add(best_key)
+            if not best_queue:
+                del self._key_queues[best_key]
+        return item
+
+    def get(self, key=None, timeout=None):
         """
         获取任务
-        :return:
+        :param key: ads_id，指定时只取该ads_id的任务；为None时取共享队列或未被绑定的ads_id的任务，并绑定该ads_id
+        :param timeout: 为None时不阻塞，否则最多阻塞等待timeout秒
+        :return: 任务，没有任务返回None
         """
-        try:
-            item = self.priority_queue.get_nowait()
+        with self._condition:
+            item = self._pop(key)
+            if item is None and timeout:
+                end_time = time.monotonic() + timeout
+                while item is None:
+                    remaining = end_time - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+                    item = self._pop(key)
             return item
-        except:
-            return
+
+    def unbind(self, key):
+        """
+        释放线程对ads_id的绑定，其他线程可以继续领取该ads_id的任务
+        :param key: ads_id
+        :return:
+        """
+        with self._condition:
+            self._bound_keys.discard(key)
+            self._condition.notify_all()
+
+    def task_done(self):
+        """
+        取出的任务已处理完成（包括被丢弃的情况）
+        :return:
+        """
+        self.task_counter.done()
+
+    def clear(self):
+        """
+        清空队列，被清掉的任务视为已完成
+        :return:
+        """
+        with self._condition:
+            count = len(self._shared_queue) + sum(len(queue) for queue in self._key_queues.values())
+            self._shared_queue.clear()
+            self._key_queues.clear()
+        self.task_counter.done(count)
+
+    def size(self, key=None):
+        with self._condition:
+            if key is not None:
+                return len(self._key_queues.get(key, ()))
+            return len(self._shared_queue) + sum(len(queue) for queue in self._key_queues.values())
 
     def empty(self):
-        return self.priority_queue.empty()
+        with self._condition:
+            return not self._shared_queue and not self._key_queues
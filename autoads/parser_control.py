@@ -1,8 +1,7 @@
 # -*- coding: utf-8 -*-
 
 import threading
-import time
-from queue import Empty
+from queue import Queue
 from collections.abc import Iterable
 
 import autoads.tools as tools
@@ -11,8 +10,8 @@ from autoads.memory_db import MemoryDB
 from autoads.item import Item
 from autoads.log import log
 from autoads import ads_api
-from urllib.parse import urlparse
 from autoads.request import Request
+from autoads.request_journal import RequestJournal
 
 
 class AirSpiderParserControl(threading.Thread):
@@ -22,8 +21,8 @@ class AirSpiderParserControl(threading.Thread):
     _success_task_count = 0
     _failed_task_count = 0
 
-    def __init__(self, memory_db: MemoryDB, item_buffer: ItemBuffer,processing_request: MemoryDB, ui=None, ms=None, grid_layout=None,
-                 stop_event=None,is_use_interval_timeout=False):
+    def __init__(self, memory_db: MemoryDB, item_buffer: ItemBuffer,processing_request: Queue, ui=None, ms=None, grid_layout=None,
+                 stop_event=None,is_use_interval_timeout=False, journal: RequestJournal = None):
         super(AirSpiderParserControl, self).__init__()
         self._parsers = []
         self._memory_db = memory_db
@@ -32,6 +31,7 @@ class AirSpiderParserControl(threading.Thread):
         self._wait_task_time = 0
         self._item_buffer = item_buffer
         self.ads_id = None  # 当前线程正在操作的浏览器id
+        self._bound_ads_id = None  # 当前线程在请求库中绑定的浏览器id，绑定期间其他线程不会领取它的请求
         self.new_ads_id = None  # 当发现浏览器对应的账号有异常，就会更新此参数，来开启新的浏览器，处理请求
         self._finished_nums = 0  # 当前线程已经处理了多少个请求，当超过配置文件中的请求数，就会重新更新需要操作的浏览器，并清空此参数
         self.is_running = False  # 当前线程是不是有请求正在处理，有可能是还没有返回结果出来，网络出现了卡的情况，这个时候就需要先不要拿请求出来了
@@ -40,6 +40,7 @@ class AirSpiderParserControl(threading.Thread):
         self.grid_layout = grid_layout
         self.stop_event = stop_event
         self.is_use_interval_timeout=is_use_interval_timeout
+        self._journal = journal  # 请求日志，为None时不记录
 
     def init_thread_custom_param(self):
         self.ads_id = None  # 清空当前线程只处理指定的ads_id请求的限制，重新去处理还没有在处理的ads_id
@@ -47,22 +48,14 @@ class AirSpiderParserControl(threading.Thread):
         self._finished_nums = 0
         self.new_ads_id = None
 
-    def request_put_back(self, request=None):
-        # 将请求的put_back参数添加每个线程正在处理这个请求的次数，防止一个请求被一个线程同时出来多次，造成死循环
-        if self.ads_id and request:
-            key = self.ads_id + '_' + urlparse(request.url).path
-            if key not in request.put_back:
-                request.put_back[key] = 1
-            else:
-                request.put_back[key] += 1
-
-            if request.put_back[key] > 2:
-                return False
-            else:
-                return True
-
-        else:
-            return False
+    def release_ads_id(self):
+        """
+        当前线程不再处理绑定的浏览器时，释放请求库中对它的绑定，其他线程才能领取这个浏览器的请求
+        需要在请求处理结束后调用，防止请求处理过程中别的线程同时操作同一个浏览器
+        """
+        if self._bound_ads_id and self._bound_ads_id != self.ads_id:
+            self._memory_db.unbind(self._bound_ads_id)
+            self._bound_ads_id = None
 
     def run(self):
         # print(f'self._started={self._started.is_set()}')
@@ -71,103 +64,47 @@ class AirSpiderParserControl(threading.Thread):
 
         while not self._thread_stop:
             try:
-                # 如果这个线程有正在处理的请求，就先不拿新的请求出来了
-                if self.is_running:
-                    tools.delay_time(2)
-                    continue
-
-                # 先去缓存里面看是不是有属于当前ads_id被丢弃的请求，如果有就取出来，如果没有就从请求库中取
-                if self.ads_id and Request.webdriver_pool:
-                    drop_request = Request.webdriver_pool.get_drop_res(self.ads_id)
-                    if drop_request:
-                        log.info(f'线程{threading.current_thread().name}浏览器（{self.ads_id}获取丢弃的请求{drop_request}')
-                        requests = drop_request
-                    else:
-                        requests = self._memory_db.get()  # 取出请求
-                else:
-                    requests = self._memory_db.get()  # 取出请求
+                # 先取当前浏览器绑定的请求，当前浏览器没有请求了就释放绑定，再去领取其他浏览器的请求
+                requests = None
+                if self.ads_id:
+                    requests = self._memory_db.get(self.ads_id)
+                    if not requests:
+                        self.init_thread_custom_param()
+                        self.release_ads_id()
 
-                self.is_running = True  # 只要取出来请求，就说明当前线程正在处理这个请求了
+                if not requests:
+                    requests = self._memory_db.get(timeout=1)  # 阻塞取出请求，超时后回到循环检查线程状态
 
                 # 多个浏览器同时启动处理，需要让每个浏览器处理同一个类型的请求，不然就会打断别的浏览器的处理过程
                 # 每个浏览器都是有一个ads_id对应，每个请求也有一个ads_id属性
-                # 当一个线程已经处理完一个请求，就需要重新获取下一个同ads_id的请求
+                # 请求库领取某个ads_id的请求时就把这个ads_id绑定给了当前线程，其他线程不会再拿到它的请求
                 if not requests:
                     if not self.is_show_tip:
                         log.debug("parser 等待任务...")
                         self.is_show_tip = True
 
-                    time.sleep(1)
                     self._wait_task_time += 1
-                    self.is_running = False
                     continue
 
-                # 判断是不是同一个账号下的请求，如果不是就把这个请求放回去，等其他线程去拿到这个请求去处理
-                is_put_back = self.request_put_back(requests)
-                if self.ads_id and self.ads_id != requests.ads_id:
-                    log.info(
-                        f'2、线程{threading.current_thread().name}浏览器{self.ads_id}获取到不是同一个账号下的请求:{requests},is_put_back={is_put_back}')
-                    if is_put_back:  # 判断是不是可以放回，如果同一个线程放回的次数超过5次，就不再放回，就认定丢弃了，这种情况有可能是卡死或者死循环
-                        requests.priority += 11
-                        log.info(
-                            f'2、线程{threading.current_thread().name}下浏览器{self.ads_id}针对请求{requests}正在放回第{requests.put_back[self.ads_id+"_"+urlparse(requests.url).path]}次')
-                        self._memory_db.add(requests)
-                        # tools.delay_time(5)
-                    else:
-                        log.info(f'2、线程{threading.current_thread().name}下浏览器{self.ads_id}针对请求{requests}丢弃')
-                        Request.webdriver_pool.add_drop_res(requests)  # 保存被丢弃的请求，这样别的线程就会知道
-                        # pass
-                        # self._finished_nums+=1
-                else:
-                    # 判断ads_id是不是正在处理，通过webdriver_pool中去查找是否存在，如果存在就不处理当前请求
-                    # 此判断是因为总请求个数小于线程开启数，如果没有这个判断，就会产生不同的线程同时操作同一个浏览器的情况发生
-                    # 只要在开启线程个数的时候，不要超过请求的个数，就不会发生上面的情况
-                    # 还有一种情况是，线程在循环下一个浏览器的时候，有可能这个浏览器被别的线程已经打开了，正在处理，也有可能是已经过期的
-                    if not self.ads_id and Request.webdriver_pool and Request.webdriver_pool.exists(requests.ads_id):
-                        log.info(
-                            f'2. 线程{threading.current_thread().name}准备处理{requests.ads_id},发现有别的线程正在处理！重新放回,is_put_back={is_put_back}')
-                        # 考虑到线程刚刚被初始化self.ads_id=None，同时拿到的ads_id是其他线程正在处理的
-                        # 这个时候请求就直接丢弃了，因为并不能设置参数来表示这个请求被当前线程下的浏览器放回的次数
-                        # 所以干脆丢弃掉
-                        log.info(f'2、线程{threading.current_thread().name}下浏览器{self.ads_id}针对请求{requests}丢弃')
-                        Request.webdriver_pool.add_drop_res(requests)  # 保存被丢弃的请求，这样别的线程就会知道
-                    else:
-                        self.is_show_tip = False
-                        if ads_api.expired_ads(requests.ads_id):  # 判断此浏览器是不是已经过期了
-                            log.info(f'2. 线程{threading.current_thread().name}准备处理{requests},发现浏览器过期了！请求丢弃不处理')
-                            self.is_running = False
-                            continue
-
-                        log.info(f'2、线程{threading.current_thread().name}开始处理请求任务：-->{requests}')
-                        # tools.send_message_to_ui(ms=self.ms,ui=self.ui,message='程序开始采集中...')
-                        tools.send_message_to_ui(ms=self.ms, ui=self.ui, message=f'采集<font color="#3900FF">{requests.url}</font>开始')
-
-                        self._processing_request.add(requests)
-
-                        self.ads_id = requests.ads_id
-
-                        requests.finished_nums = self._finished_nums
-                        log.info(
-                            f'线程{threading.current_thread().name}状态1【ads_id={self.ads_id},_finished_nums={self._finished_nums},new_ads_id={self.new_ads_id}】')
-                        self.deal_requests([requests])
-                        # 只有在确定是处理一个浏览器的请求的时候才需要增加
-                        # 当deal_requests在给线程初始化状态的时候，说明是上一个浏览器处理结束，
-                        # 下一个浏览器等待进来的状态，这个时候就不要更新了，处理清零状态就可以了
-                        if self.ads_id:
-                            self._finished_nums += 1  # 给request添加已经处理了多少个请求的标志
-                        log.info(
-                            f'线程{threading.current_thread().name}状态3【ads_id={self.ads_id},_finished_nums={self._finished_nums},new_ads_id={self.new_ads_id}】')
-                        tools.send_message_to_ui(ms=self.ms, ui=self.ui, message=f'结束采集\r\n\r\n')
-                        if self.is_use_interval_timeout:
-                            tools.send_message_to_ui(ms=self.ms, ui=self.ui, message=f'程序等待{requests.member_timeout}秒发送下一个成员')
-                            tools.delay_time(requests.member_timeout)
+                if requests.ads_id:
+                    self.ads_id = self._bound_ads_id = requests.ads_id
 
-                self.is_running = False
+                self.is_running = True  # 只要取出来请求，就说明当前线程正在处理这个请求了
+                try:
+                    self.deal_request(requests)
+                finally:
+                    self.is_running = False
+                    self._memory_db.task_done()  # 丢弃、处理完成都算这次取出的请求已完成
+                    self.release_ads_id()  # 处理过程中线程被初始化了，释放原来绑定的浏览器
+
+                # 点击停止时正在处理的请求没有处理完，留在请求日志中下次恢复
+                if self._journal and not (self.stop_event and self.stop_event.isSet()):
+                    self._journal.ack(requests)
 
                 # 当界面中点击了停止，当前线程让自己停止掉，不再取新的请求出来
                 if self.stop_event and self.stop_event.isSet():
                     log.info(f'线程{threading.current_thread().name}  is_running={self.is_running}  正在清理请求库，并设置thread_stop=True，')
-                    tools.clear_queue(self._memory_db.priority_queue)
+                    self._memory_db.clear()
 
                     if Request.webdriver_pool:
                         tools.send_message_to_ui(self.ms, self.ui, '浏览器关闭中...')
@@ -178,6 +115,7 @@ class AirSpiderParserControl(threading.Thread):
                     self.is_running = False
                     self.is_show_tip = True  # 告诉主线程，自己已经完成自身的关闭了
                     self.init_thread_custom_param()  # 线程初始化
+                    self.release_ads_id()
                     tools.send_message_to_ui(ms=self.ms, ui=self.ui, message=f'结束采集\r\n\r\n')
 
             except Exception as e:
@@ -188,6 +126,39 @@ class AirSpiderParserControl(threading.Thread):
                 tools.delay_time(1)
                 # raise e
 
+    def deal_request(self, requests):
+        """
+        交给当前线程的浏览器处理取出的请求
+        :param requests: 取出的请求
+        :return:
+        """
+        self.is_show_tip = False
+        if ads_api.expired_ads(requests.ads_id):  # 判断此浏览器是不是已经过期了
+            log.info(f'2. 线程{threading.current_thread().name}准备处理{requests},发现浏览器过期了！请求丢弃不处理')
+            return
+
+        log.info(f'2、线程{threading.current_thread().name}开始处理请求任务：-->{requests}')
+        # tools.send_message_to_ui(ms=self.ms,ui=self.ui,message='程序开始采集中...')
+        tools.send_message_to_ui(ms=self.ms, ui=self.ui, message=f'采集<font color="#3900FF">{requests.url}</font>开始')
+
+        self._processing_request.put(requests)
+
+        requests.finished_nums = self._finished_nums
+        log.info(
+            f'线程{threading.current_thread().name}状态1【ads_id={self.ads_id},_finished_nums={self._finished_nums},new_ads_id={self.new_ads_id}】')
+        self.deal_requests([requests])
+        # 只有在确定是处理一个浏览器的请求的时候才需要增加
+        # 当deal_requests在给线程初始化状态的时候，说明是上一个浏览器处理结束，
+        # 下一个浏览器等待进来的状态，这个时候就不要更新了，处理清零状态就可以了
+        if self.ads_id:
+            self._finished_nums += 1  # 给request添加已经处理了多少个请求的标志
+        log.info(
+            f'线程{threading.current_thread().name}状态3【ads_id={self.ads_id},_finished_nums={self._finished_nums},new_ads_id={self.new_ads_id}】')
+        tools.send_message_to_ui(ms=self.ms, ui=self.ui, message=f'结束采集\r\n\r\n')
+        if self.is_use_interval_timeout:
+            tools.send_message_to_ui(ms=self.ms, ui=self.ui, message=f'程序等待{requests.member_timeout}秒发送下一个成员')
+            tools.delay_time(requests.member_timeout)
+
     def deal_requests(self, requests):
         for request in requests:
             # 界面中点击了停止，就需要马上告诉线程执行清理程序了
@@ -275,6 +246,8 @@ class AirSpiderParserControl(threading.Thread):
                                 else:  # 异步
                                     # 将next_request 入库
                                     log.info(f'线程{threading.current_thread().name}，返回的请求加入异步处理库，{result}')
+                                    if self._journal:
+                                        self._journal.add(result)
                                     self._memory_db.add(result)
 
                             elif isinstance(result, Item):
@@ -49,6 +49,19 @@ class BasePipeline(metaclass=abc.ABCMeta):
 
         return True
 
+    def create_table(self, table, unique_keys=(), update_keys=()):
+        """
+        建表, 数据库类的pipeline在入库前按item的 __unique_key__ 与 __update_key__ 建表，文件类的pipeline可不实现此接口
+        Args:
+            table: 表名
+            unique_keys: 唯一的字段, 如 ("member_link",)
+            update_keys: 更新的字段, 如 ("status",)
+
+        Returns:
+
+        """
+        pass
+
     def close(self):
         """
         关闭，爬虫结束时调用
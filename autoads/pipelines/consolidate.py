@@ -0,0 +1,433 @@
+# -*- coding: utf-8 -*-
+"""
+---------
+@summary: 成员文件合并/导出：逐个文件解析，边读边写出，按unique_key去重
+          去重: 默认用内存中的hash set；输入超过BLOOM_THRESHOLD字节时用磁盘上的布隆过滤器，
+                内存占用固定，误判率BLOOM_ERROR_RATE（极少数不重复的数据会被当作重复跳过）
+          解析: workers > 1 时用进程池并行解析文件，按文件顺序写出，结果与单进程一致
+          目录内去重 unique_files: 按64位标识hash去重，可增量只处理文件新追加的部分
+---------
+"""
+
+import hashlib
+import io
+import json
+import multiprocessing as mp
+import os
+import shutil
+import tempfile
+import time
+from array import array
+from typing import Dict, List
+
+from autoads.log import log
+from autoads.pipelines.file_store import extract_key, key_hash
+
+BLOOM_THRESHOLD = 512 * 1024 * 1024  # 输入文件总大小超过该值时用布隆过滤器去重
+BLOOM_ERROR_RATE = 0.000001
+BLOOM_INITIAL_CAPACITY = 1000000
+FILES_PER_WORKER = 8  # 进程池每轮每个进程解析的文件数，限制还没写出的结果占用的内存
+
+
+def parse_file(args):
+    """
+    解析一个文件，进程池中执行
+    @param args: (file_path, unique_key, with_lines)
+    @return: with_lines时为[(key, line)]，否则为[key]；没有key的行跳过
+    """
+    file_path, unique_key, with_lines = args
+    records = []
+    try:
+        with open(file_path, "rb") as f:
+            for raw in f:
+                if not raw.strip():
+                    continue
+                key = extract_key(raw, unique_key)
+                if not key:
+                    continue
+                if with_lines:
+                    line = raw.decode("utf-8")
+                    records.append((key, line if line.endswith("\n") else line + "\n"))
+                else:
+                    records.append(key)
+    except (OSError, UnicodeDecodeError) as e:
+        log.error(f"Error reading {file_path}: {e}")
+    return records
+
+
+class SeenKeys:
+    """
+    已写出的key：hash set 或 磁盘上的布隆过滤器
+    """
+
+    def __init__(self, use_bloom=False):
+        self.use_bloom = use_bloom
+        self._keys = set()
+        self._bloom = None
+        self._bloom_path = None
+        if use_bloom:
+            from autoads.dedup.bloomfilter import ScalableBloomFilter  # autoads.dedup 依赖 tools
+
+            self._bloom_path = tempfile.mkdtemp(prefix="consolidate_")
+            self._bloom = ScalableBloomFilter(
+                initial_capacity=BLOOM_INITIAL_CAPACITY,
+                error_rate=BLOOM_ERROR_RATE,
+                bitarray_type=ScalableBloomFilter.BASE_MMAP,
+                name="seen",
+                path=self._bloom_path,
+            )
+
+    def add_many(self, keys: List[str]) -> List[bool]:
+        """
+        @return: 每个key是否第一次出现
+        """
+        if self._bloom is not None:
+            return [bool(added) for added in self._bloom.add(keys)] if keys else []
+
+        result = []
+        for key in keys:
+            if key in self._keys:
+                result.append(False)
+            else:
+                self._keys.add(key)
+                result.append(True)
+        return result
+
+    def close(self):
+        if self._bloom is not None:
+            self._bloom.close()
+            shutil.rmtree(self._bloom_path, ignore_errors=True)
+            self._bloom = None
+
+
+def _iter_parsed(files, unique_key, with_lines, workers):
+    args = [(file_path, unique_key, with_lines) for file_path in files]
+    if workers <= 1 or len(files) <= 1:
+        for arg in args:
+            yield parse_file(arg)
+        return
+
+    window = workers * FILES_PER_WORKER
+    with mp.Pool(workers) as pool:
+        for i in range(0, len(args), window):
+            yield from pool.map(parse_file, args[i:i + window])
+
+
+def consolidate(files, output_file=None, links_file=None, unique_key="member_link", workers=1,
+                use_bloom=None) -> Dict:
+    """
+    合并多个文件中的数据，按unique_key去重，保留第一次出现的行
+    @param output_file: 写出去重后的原始行，None不写
+    @param links_file: 写出去重后的key（每行一个链接），None不写
+    @param workers: 解析文件的进程数
+    @param use_bloom: None时按输入文件总大小自动选择
+    @return: {"files", "lines", "unique", "seconds", "lines_per_second"}
+    """
+    started = time.perf_counter()
+    if use_bloom is None:
+        use_bloom = sum(os.path.getsize(f) for f in files if os.path.exists(f)) > BLOOM_THRESHOLD
+
+    seen = SeenKeys(use_bloom)
+    outputs = []
+    lines = unique = 0
+    try:
+        output = open(output_file, "w", encoding="utf-8", newline="\n") if output_file else None
+        if output:
+            outputs.append(output)
+        links = open(links_file, "w", encoding="utf-8", newline="\n") if links_file else None
+        if links:
+            outputs.append(links)
+
+        for records in _iter_parsed(files, unique_key, output is not None, workers):
+            lines += len(records)
+            keys = [key for key, _ in records] if output else records
+            for record, is_new in zip(records, seen.add_many(keys)):
+                if not is_new:
+                    continue
+                unique += 1
+                if output:
+                    output.write(record[1])
+                if links:
+                    links.write((record[0] if output else record) + "\n")
+    finally:
+        for f in outputs:
+            f.close()
+        seen.close()
+
+    seconds = time.perf_counter() - started
+    return {
+        "files": len(files),
+        "lines": lines,
+        "unique": unique,
+        "seconds": seconds,
+        "lines_per_second": lines / seconds if seconds else 0,
+    }
+
+
+# ---------------------------------------------------------------------- 目录内去重
+
+UNIQUE_STATE_FILE = ".unique_member.json"  # 每个文件的 size/mtime/已去重到的偏移/md5
+UNIQUE_KEYS_FILE = ".unique_member.keys"  # 已保留数据的64位key hash，小端uint64按文件顺序排列
+DIGEST_CHUNK_SIZE = 1024 * 1024
+
+
+def line_identifier(line: str, is_links_file, unique_key):
+    """
+    一行数据的唯一标识：_links.txt 为整行；json取unique_key，未指定时依次尝试常见的键名；不是json时为整行
+    """
+    if is_links_file:
+        return line
+    try:
+        dictobj = json.loads(line)
+    except ValueError:
+        return line
+    if not isinstance(dictobj, dict):
+        return line
+    if unique_key:
+        return dictobj.get(unique_key, line)
+    return dictobj.get('member_link') or dictobj.get('group_link') or dictobj.get('url') or line
+
+
+def identifier_hash(identifier) -> int:
+    return key_hash(identifier if isinstance(identifier, str) else "\0" + json.dumps(identifier))
+
+
+def _md5_prefix(f, length):
+    """
+    从文件开头读取length字节计算md5
+    @return: (md5, 实际读取的字节数)
+    """
+    md5 = hashlib.md5()
+    remaining = length
+    while remaining:
+        chunk = f.read(min(remaining, DIGEST_CHUNK_SIZE))
+        if not chunk:
+            break
+        md5.update(chunk)
+        remaining -= len(chunk)
+    return md5, length - remaining
+
+
+def hash_file(args):
+    """
+    计算文件中 [offset, 末尾) 每个非空行的标识hash，进程池中执行
+    @param args: (file_path, offset, unique_key, digest)  digest: [0, offset) 上次去重后的md5，
+                 文件内容与之不一致时（被其他地方改写过）从头处理
+    @return: (hashes, offset, end, clean, digest)  offset: 实际开始处理的偏移；end: 处理到的偏移；
+             clean: 所有行都已是去重后写出的格式（去掉首尾空白，无空行）；digest: [0, end) 的md5
+             读取出错时hashes为None
+    """
+    file_path, offset, unique_key, digest = args
+    is_links_file = file_path.endswith('_links.txt')
+    hashes = array("Q")
+    clean = True
+    try:
+        with open(file_path, "rb") as f:
+            md5, length = _md5_prefix(f, offset)
+            if length != offset or md5.hexdigest() != digest:
+                offset = 0
+                md5 = hashlib.md5()
+                f.seek(0)
+            end = offset
+            for raw in f:
+                end += len(raw)
+                md5.update(raw)
+                line = raw.decode("utf-8").strip()
+                if not line:
+                    clean = False
+                    continue
+                if raw != (line + "\n").encode("utf-8"):
+                    clean = False
+                hashes.append(identifier_hash(line_identifier(line, is_links_file, unique_key)))
+    except (OSError, UnicodeDecodeError) as e:
+        log.error(f"去重文件 {file_path} 时出错: {e}")
+        return None, offset, offset, True, None
+    return hashes, offset, end, clean, md5.hexdigest()
+
+
+def rewrite_file(args):
+    """
+    只保留mask中为1的行，改写 [offset, end) 部分，end之后新追加的内容原样保留，进程池中执行
+    @return: (改写后去重部分的结束偏移, 该部分的md5)
+    """
+    file_path, offset, end, mask = args
+    with open(file_path, "rb") as f:
+        md5, _ = _md5_prefix(f, offset)
+        tail = f.read()
+
+    lines = []
+    index = 0
+    for raw in io.BytesIO(tail[:end - offset]):
+        line = raw.decode("utf-8").strip()
+        if not line:
+            continue
+        if mask[index]:
+            lines.append((line + "\n").encode("utf-8"))
+        index += 1
+    kept = b"".join(lines)
+    md5.update(kept)
+
+    if offset == 0:
+        temp_path = file_path + f".unique_{os.getpid()}"
+        with open(temp_path, "wb") as f:
+            f.write(kept + tail[end - offset:])
+        os.replace(temp_path, file_path)
+    else:
+        with open(file_path, "r+b") as f:
+            f.seek(offset)
+            f.write(kept + tail[end - offset:])
+            f.truncate()
+    return offset + len(kept), md5.hexdigest()
+
+
+class UniqueState:
+    """
+    增量去重的水位：每个文件已去重部分的偏移、md5和保留的key，下次只处理新追加的行
+    """
+
+    def __init__(self, directory, unique_key):
+        self.state_path = os.path.join(directory, UNIQUE_STATE_FILE)
+        self.keys_path = os.path.join(directory, UNIQUE_KEYS_FILE)
+        self.unique_key = unique_key
+        self.files = {}  # name -> {"size", "mtime", "offset", "digest", "kept"}，按去重时的文件顺序
+        self.file_keys = {}  # name -> array("Q")，该文件已去重部分保留的key
+
+    def load(self) -> bool:
+        """
+        @return: 水位可用；unique_key变化、keys文件不完整时返回False，需要全量去重
+        """
+        try:
+            with open(self.state_path, encoding="utf-8") as f:
+                state = json.load(f)
+            keys = array("Q")
+            with open(self.keys_path, "rb") as f:
+                keys.frombytes(f.read())
+        except (OSError, ValueError):
+            return False
+
+        files = state.get("files", {})
+        if state.get("unique_key") != self.unique_key or sum(wm.get("kept", 0) for wm in files.values()) != len(keys):
+            return False
+        if not all("digest" in watermark for watermark in files.values()):
+            return False  # 旧版本的水位
+
+        position = 0
+        for name, watermark in files.items():
+            self.file_keys[name] = keys[position:position + watermark["kept"]]
+            position += watermark["kept"]
+        self.files = files
+        return True
+
+    def save(self):
+        keys = array("Q")
+        for name in self.files:
+            keys.extend(self.file_keys[name])
+        with open(self.keys_path, "wb") as f:
+            f.write(keys.tobytes())
+
+        temp_path = self.state_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump({"unique_key": self.unique_key, "files": self.files}, f)
+        os.replace(temp_path, self.state_path)
+
+
+def unique_files(files, unique_key=None, workers=1, incremental=False) -> Dict:
+    """
+    按文件顺序对多个文件去重：第一次出现的行保留，后面重复的行删除，保留的行去掉首尾空白，删除空行
+    解析（计算行的64位标识hash）和改写文件在进程池中并行，合并在主进程中按文件顺序进行，结果与逐个文件处理一致
+    @param incremental: 记录每个文件已去重部分的 size/mtime/偏移/md5 及保留的key，结果与全量去重完全一致：
+                        文件没有变化、且保留的key与前面文件的都不重复时不再读取；
+                        只被追加时校验已去重部分的md5后只处理新追加的行；被改写过或key与前面的文件重复时从头处理
+    @return: {"kept", "removed", "files": {file_path: (kept, removed)}}
+    """
+    files = [f for f in files if '_temp' not in f]
+    result = {"kept": 0, "removed": 0, "files": {}}
+    if not files:
+        return result
+
+    state = UniqueState(os.path.dirname(files[0]), unique_key)
+    previous = state.files if incremental and state.load() else {}
+    previous_keys = state.file_keys
+    state.files, state.file_keys = {}, {}
+    seen = set()
+
+    window = max(workers, 1) * FILES_PER_WORKER
+    pool = mp.Pool(workers) if workers > 1 and len(files) > 1 else None
+    map_func = pool.map if pool else lambda func, args: list(map(func, args))
+    try:
+        for i in range(0, len(files), window):
+            batch = files[i:i + window]
+
+            # 有变化的文件并行解析，没有记录的或变短的从头处理
+            jobs = []
+            for file_path in batch:
+                watermark = previous.get(os.path.basename(file_path))
+                stat = os.stat(file_path)
+                if watermark and watermark["size"] == stat.st_size and watermark["mtime"] == stat.st_mtime:
+                    continue
+                if watermark and stat.st_size >= watermark["offset"]:
+                    jobs.append((file_path, watermark["offset"], unique_key, watermark["digest"]))
+                else:
+                    jobs.append((file_path, 0, unique_key, None))
+            parsed = dict(zip((job[0] for job in jobs), map_func(hash_file, jobs)))
+
+            # 按文件顺序合并
+            rewrites = []
+            for file_path in batch:
+                name = os.path.basename(file_path)
+                watermark = previous.get(name)
+                hashed = parsed.get(file_path)
+                if hashed and hashed[0] is None:
+                    continue
+
+                # 已去重部分保留的key与前面文件的都不重复时原样保留，否则整个文件从头去重
+                prefix_keys = None
+                if watermark and (hashed is None or hashed[1]):
+                    prefix_keys = previous_keys[name]
+                    if seen.isdisjoint(prefix_keys):
+                        seen.update(prefix_keys)
+                    else:
+                        prefix_keys = None
+                        hashed = hash_file((file_path, 0, unique_key, None))
+                        if hashed[0] is None:
+                            continue
+
+                if hashed is None:  # 没有变化
+                    state.files[name] = watermark
+                    state.file_keys[name] = prefix_keys
+                    result["kept"] += watermark["kept"]
+                    continue
+
+                hashes, offset, end, clean, digest = hashed
+                mask = bytearray(len(hashes))
+                for index, hash_value in enumerate(hashes):
+                    if hash_value not in seen:
+                        seen.add(hash_value)
+                        mask[index] = 1
+                keys = array("Q", prefix_keys if offset else ())
+                keys.extend(h for h, keep in zip(hashes, mask) if keep)
+                kept = sum(mask)
+                removed = len(hashes) - kept
+
+                state.files[name] = {"offset": end, "digest": digest, "kept": len(keys)}
+                state.file_keys[name] = keys
+                result["files"][file_path] = (kept, removed)
+                result["kept"] += len(keys)
+                result["removed"] += removed
+                if removed or not clean:
+                    rewrites.append((file_path, offset, end, bytes(mask)))
+
+            for (file_path, _, _, _), (new_end, digest) in zip(rewrites, map_func(rewrite_file, rewrites)):
+                state.files[os.path.basename(file_path)].update(offset=new_end, digest=digest)
+
+            for file_path in batch:
+                if file_path in result["files"]:
+                    stat = os.stat(file_path)
+                    state.files[os.path.basename(file_path)].update(size=stat.st_size, mtime=stat.st_mtime)
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+
+    state.save()
+    return result
@@ -18,6 +18,7 @@ import os
 import glob
 from autoads import tools
 from autoads.log import log
+from autoads.pipelines.file_store import LINE_KEY, get_store, close_stores
 
 
 class FilePipeline(BasePipeline):
@@ -59,9 +60,10 @@ class FilePipeline(BasePipeline):
 
         # 判断文件路径是否存在，如果不存在，则创建，此处是创建多级目录
         if not os.path.isdir(file_dir):
-            os.makedirs(file_dir)
+            os.makedirs(file_dir, exist_ok=True)  # 不同的表可能在多个写入线程中同时创建目录
 
-        with open(table, 'a+', encoding='utf8', newline='\n') as f:
+        # 持有store的锁追加，避免后台压缩重写表文件时丢失数据
+        with get_store(table).lock, open(table, 'a+', encoding='utf8', newline='\n') as f:
             f.writelines([json.dumps(x, ensure_ascii=False) + '\n' for x in items])
             # byte_len = f.write(json.dumps(items, ensure_ascii=False, indent=1))
             return True
@@ -75,89 +77,42 @@ class FilePipeline(BasePipeline):
             update_keys: 更新的字段, 如 ("title", "publish_time")
             unique_keys: 查找行数据的匹配条件
 
-        Returns: 是否更新成功 True / False
+        Returns: 是否更新成功 True / False，表中没有匹配的行也算成功
                  若False，不会将本批数据入到去重库，以便再次入库
 
         """
-        try:
-            split_index = table.rfind('.')
-            new_table = tools.abspath(table[:split_index] + '_temp' + table[split_index:])
-            table = tools.abspath(table)
-
-            if not os.path.exists(table):
-                log.warning(f"Table file not found: {table}")
-                return True  # Return True to not block pipeline
-
-            unique_key = unique_keys[0] if unique_keys else 'member_link'
-            keys = [item.get(unique_key, '') for item in items]
-            
-            # Also collect member_link URLs for plain URL file handling
-            member_links = [item.get('member_link', '') for item in items]
-
-            is_links_file = '_links.txt' in table or table.endswith('_links.txt')
-
-            # Retry logic for file locking issues
-            import time
-            import threading
-            max_retries = 3
-            retry_delay = 0.5
-            thread_id = threading.current_thread().ident or 0
-            new_table = table + f'.temp_{thread_id}'
-            
-            for attempt in range(max_retries):
-                try:
-                    with codecs.open(table, 'r', encoding='utf-8') as fi, \
-                            codecs.open(new_table, 'w', encoding='utf-8') as fo:
-
-                        for line in fi:
-                            line_stripped = line.strip()
-                            if not line_stripped:
-                                continue
-                            
-                            # Try JSON parsing first
-                            try:
-                                dictobj = json.loads(line_stripped)
-                                if dictobj.get(unique_key) in keys:
-                                    item = items[keys.index(dictobj[unique_key])]
-                                    for uk in update_keys:
-                                        dictobj[uk] = item.get(uk, dictobj.get(uk))
-                                    fo.write(json.dumps(dictobj, ensure_ascii=False) + '\n')
-                                else:
-                                    fo.write(line)
-                            except json.JSONDecodeError:
-                                # Plain URL file - check if this URL should be deleted
-                                if is_links_file:
-                                    # For _links.txt files, delete processed entries
-                                    if line_stripped in member_links:
-                                        log.debug(f"Removing processed URL from links file: {line_stripped}")
-                                        continue  # Skip writing this line (delete it)
-                                fo.write(line)
-
-                    # Atomic file replacement
-                    try:
-                        os.replace(new_table, table)
-                    except PermissionError:
-                        os.remove(table)
-                        os.rename(new_table, table)
-                    break  # Success, exit retry loop
-                except PermissionError:
-                    if attempt < max_retries - 1:
-                        log.warning(f"File locked, retry {attempt + 1}/{max_retries}: {table}")
-                        time.sleep(retry_delay * (attempt + 1))
-                        continue
-                    raise  # Re-raise after all retries
-
-            return True
-        except Exception as e:
-            log.error(f"Error in update_items for {table}: {e}")
-            # Clean up temp file if it exists
-            if 'new_table' in locals() and os.path.exists(new_table):
-                try:
-                    os.remove(new_table)
-                except:
-                    pass
+        table = tools.abspath(table)
+        if not os.path.exists(table):
+            log.warning(f"Table file not found: {table}")
             return True  # Return True to not block pipeline
 
+        unique_key = unique_keys[0] if unique_keys else 'member_link'
+        is_links_file = '_links.txt' in table or table.endswith('_links.txt')
+
+        # JSON表文件：按偏移索引原地改写，改写不下的写入更新日志，读取时合并
+        # _links.txt 每行一个链接：删除已处理的链接（记录墓碑，不重写整个文件）
+        import time
+        max_retries = 3
+        retry_delay = 0.5
+        for attempt in range(max_retries):
+            try:
+                store = get_store(table)
+                if is_links_file:
+                    store.delete({item.get('member_link', '') for item in items}, LINE_KEY)
+                else:
+                    store.update(items, update_keys, unique_key)
+                return True
+            except PermissionError:
+                if attempt < max_retries - 1:
+                    log.warning(f"File locked, retry {attempt + 1}/{max_retries}: {table}")
+                    time.sleep(retry_delay * (attempt + 1))
+                    continue
+                log.error(f"Error in update_items for {table}: file locked")
+            except Exception as e:
+                log.error(f"Error in update_items for {table}: {e}")
+                break
+        return False  # 更新失败，本批数据不入去重库，由ItemBuffer记录失败
+
     def dictToObj(self, dictObj, item: Item):
         if not isinstance(dictObj, dict):
             return dictObj
@@ -192,26 +147,23 @@ class FilePipeline(BasePipeline):
         index = 1
         for file_path in files:
             is_links_file = file_path.endswith('_links.txt')
-            with open(file_path, encoding="utf-8") as f:
-                while True:
-                    content = f.readline()
-                    if not content:
-                        break
-                    if index > begin:
-                        # For links files, convert plain URL to minimal JSON format
-                        if is_links_file:
-                            url = content.strip()
-                            if url:
-                                # Create minimal group item JSON from URL
-                                import json as json_mod
-                                content = json_mod.dumps({
-                                    "group_link": url,
-                                    "group_name": url.split('/')[-2] if '/groups/' in url else url,
-                                    "word": "",
-                                    "status": "unknown"
-                                }) + "\n"
-                        yield content  # 消费一条
-                    index += 1
+            # 跳过已删除的行，合并还未压缩回表文件的更新
+            for content in get_store(file_path).iter_lines():
+                if index > begin:
+                    # For links files, convert plain URL to minimal JSON format
+                    if is_links_file:
+                        url = content.strip()
+                        if url:
+                            # Create minimal group item JSON from URL
+                            import json as json_mod
+                            content = json_mod.dumps({
+                                "group_link": url,
+                                "group_name": url.split('/')[-2] if '/groups/' in url else url,
+                                "word": "",
+                                "status": "unknown"
+                            }) + "\n"
+                    yield content  # 消费一条
+                index += 1
 
     def load_items_from_file(self, item: Item, file_path, begin=0):
         """
@@ -227,16 +179,15 @@ class FilePipeline(BasePipeline):
             log.warning(f'File not found: {file_path}')
             return
         
+        # 跳过已删除的行，合并还未压缩回表文件的更新
         index = 1
-        with open(file_path, encoding="utf-8") as f:
-            while True:
-                content = f.readline()
-                if not content:
-                    break
-                if index > begin:
-                    yield content  # 消费一条
-                index += 1
+        for content in get_store(file_path).iter_lines():
+            if index > begin:
+                yield content  # 消费一条
+            index += 1
 
     def close(self):
         if callable(self.__pre_close__):
             self.__pre_close__()
+        # 把更新日志合并回表文件，其他直接读取文件的地方也能拿到最新数据
+        close_stores()
@@ -0,0 +1,475 @@
+# -*- coding: utf-8 -*-
+"""
+---------
+@summary: FilePipeline表文件（每行一条json）的索引及更新存储
+          偏移索引 {table}.idx: 每行 key_hash \t offset，记录每条数据在表文件中的位置
+                    表文件只会被追加时增量补充索引，变短或索引与内容不符时重建
+          更新日志 {table}.updates: 更新后的数据比原行长、无法原地改写时追加到这里，读取表文件时合并
+          删除: 把要删除的行原地改写为等长的空格（直接读取表文件的地方跳过空行即可），
+                并在墓碑文件 {table}.deleted 追加记录，读取时跳过这些行
+          压缩: 更新日志超过COMPACT_THRESHOLD条或pipeline关闭时，把更新合并回表文件；
+                墓碑超过COMPACT_THRESHOLD条时在后台线程中去掉已删除的行
+          _links.txt 等每行一个链接的文件使用 LINE_KEY，整行内容即为key
+          json表文件中不是json的行（如每行一个链接的输入文件）也按整行内容匹配，只能删除不能更新
+---------
+"""
+
+import hashlib
+import json
+import os
+import threading
+from typing import Dict, List
+
+from autoads.log import log
+
+
+def key_hash(key) -> int:
+    """
+    与进程无关的64位hash，用于索引文件
+    """
+    return int.from_bytes(hashlib.md5(str(key).encode("utf-8")).digest()[:8], "little")
+
+
+LINE_KEY = ""  # 每行一个链接的文件：整行内容作为key
+
+
+def extract_key(line: bytes, unique_key):
+    """
+    取一行数据的unique_key值，没有时返回None
+    save_items用json.dumps默认格式写入，字符串值没有转义字符时直接截取，避免整行json.loads
+    """
+    if unique_key == LINE_KEY:
+        return line.strip().decode("utf-8") or None
+
+    marker = ('"%s": "' % unique_key).encode("utf-8")
+    start = line.find(marker)
+    if start >= 0:
+        start += len(marker)
+        end = line.find(b'"', start)
+        value = line[start:end]
+        if end > 0 and b"\\" not in value:
+            return value.decode("utf-8")
+
+    try:
+        return json.loads(line).get(unique_key)
+    except (ValueError, AttributeError):
+        return None
+
+
+def plain_line_key(line: bytes):
+    """
+    json表文件中不是json的行按整行内容作为key，写了一半的json行返回None
+    """
+    line = line.strip()
+    if not line or line.startswith(b"{"):
+        return None
+    try:
+        return line.decode("utf-8")
+    except UnicodeDecodeError:
+        return None
+
+
+class IndexedFileStore:
+    INDEX_SUFFIX = ".idx"
+    UPDATES_SUFFIX = ".updates"
+    TOMBSTONES_SUFFIX = ".deleted"
+    COMPACT_THRESHOLD = 1000  # 更新日志/墓碑条数超过该值时合并回表文件
+
+    def __init__(self, path):
+        self.path = path
+        self.index_path = path + self.INDEX_SUFFIX
+        self.updates_path = path + self.UPDATES_SUFFIX
+        self.tombstones_path = path + self.TOMBSTONES_SUFFIX
+
+        self._lock = threading.RLock()
+        self._compactor = None  # 后台压缩线程
+
+        self._unique_key = None
+        self._offsets = None  # key_hash -> offset / [offset, ...]
+        self._indexed_size = 0  # 索引覆盖到的表文件大小
+
+        self._updates = {}  # unique_key -> {key: {field: value}}
+        self._update_count = 0
+        self._updates_size = -1  # 已加载的更新日志大小，其他实例写入后重新加载
+
+        self._tombstone_count = 0
+        self._tombstones_size = -1
+
+    @property
+    def lock(self):
+        """
+        向表文件追加数据时持有，避免与后台压缩同时进行时丢失数据
+        """
+        return self._lock
+
+    # ------------------------------------------------------------------ 索引
+
+    def _add_offset(self, hash_value, offset):
+        offsets = self._offsets.get(hash_value)
+        if offsets is None:
+            self._offsets[hash_value] = offset
+        elif isinstance(offsets, list):
+            offsets.append(offset)
+        else:
+            self._offsets[hash_value] = [offsets, offset]
+
+    def _get_offsets(self, key) -> List[int]:
+        offsets = self._offsets.get(key_hash(key), [])
+        return offsets if isinstance(offsets, list) else [offsets]
+
+    def _load_index(self, unique_key):
+        self._unique_key = unique_key
+        self._offsets = {}
+        self._indexed_size = 0
+
+        if os.path.exists(self.index_path):
+            with open(self.index_path, encoding="utf-8") as f:
+                if f.readline().rstrip("\n") == "#" + unique_key:
+                    last_offset = -1
+                    for line in f:
+                        hash_value, offset = line.split("\t")
+                        offset = int(offset)
+                        self._add_offset(int(hash_value), offset)
+                        last_offset = max(last_offset, offset)
+
+                    if last_offset >= 0:
+                        with open(self.path, "rb") as data:
+                            data.seek(last_offset)
+                            self._indexed_size = last_offset + len(data.readline())
+                else:
+                    self._offsets = None
+
+        if self._offsets is None or not os.path.exists(self.index_path):
+            self._rebuild_index()
+
+    def _rebuild_index(self):
+        self._offsets = {}
+        self._indexed_size = 0
+        with open(self.index_path, "w", encoding="utf-8") as f:
+            f.write("#" + self._unique_key + "\n")
+        self._extend_index()
+
+    def _extend_index(self):
+        """
+        索引表文件中新追加的部分
+        """
+        entries = []
+        with open(self.path, "rb") as f:
+            f.seek(self._indexed_size)
+            offset = self._indexed_size
+            for line in f:
+                key = self._extract_key(line)
+                if key is not None:
+                    hash_value = key_hash(key)
+                    self._add_offset(hash_value, offset)
+                    entries.append(f"{hash_value}\t{offset}\n")
+                offset += len(line)
+            self._indexed_size = offset
+
+        if entries:
+            with open(self.index_path, "a", encoding="utf-8") as f:
+                f.writelines(entries)
+
+    def _extract_key(self, line: bytes):
+        key = extract_key(line, self._unique_key)
+        if key is None and self._unique_key != LINE_KEY:
+            key = plain_line_key(line)
+        return key
+
+    def _refresh_index(self, unique_key):
+        if self._offsets is None or unique_key != self._unique_key:
+            self._load_index(unique_key)
+
+        size = os.path.getsize(self.path)
+        if size < self._indexed_size:
+            log.debug(f"Table file shrank, rebuilding index: {self.path}")
+            self._rebuild_index()
+        elif size > self._indexed_size:
+            self._extend_index()
+
+    # ------------------------------------------------------------------ 更新日志
+
+    def _load_updates(self):
+        size = os.path.getsize(self.updates_path) if os.path.exists(self.updates_path) else 0
+        if size == self._updates_size:
+            return
+
+        self._updates = {}
+        self._update_count = 0
+        if size:
+            with open(self.updates_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        unique_key, key, values = json.loads(line)
+                    except ValueError:
+                        continue  # 写入中断的最后一行
+                    self._updates.setdefault(unique_key, {}).setdefault(key, {}).update(values)
+                    self._update_count += 1
+        self._updates_size = size
+
+    def _append_updates(self, entries):
+        with open(self.updates_path, "a", encoding="utf-8") as f:
+            for unique_key, key, values in entries:
+                f.write(json.dumps([unique_key, key, values], ensure_ascii=False) + "\n")
+                self._updates.setdefault(unique_key, {}).setdefault(key, {}).update(values)
+        self._update_count += len(entries)
+        self._updates_size = os.path.getsize(self.updates_path)
+
+    def has_updates(self) -> bool:
+        with self._lock:
+            self._load_updates()
+            return bool(self._updates)
+
+    def merge_updates(self, line: str) -> str:
+        """
+        把更新日志合并到读出的一行数据上，没有更新时原样返回
+        """
+        if not self._updates:
+            return line
+        try:
+            data = json.loads(line)
+        except ValueError:
+            return line
+        if not isinstance(data, dict):
+            return line
+
+        merged = False
+        for unique_key, updates in self._updates.items():
+            values = updates.get(data.get(unique_key))
+            if values:
+                data.update(values)
+                merged = True
+
+        return json.dumps(data, ensure_ascii=False) + "\n" if merged else line
+
+    # ------------------------------------------------------------------ 更新
+
+    def update(self, items: List[Dict], update_keys, unique_key) -> int:
+        """
+        更新数据：新的行不比原来长时原地改写（多出的位置用空格补齐），否则写入更新日志
+        @return: 更新的条数
+        """
+        with self._lock:
+            self._load_updates()
+            self._refresh_index(unique_key)
+
+            updated = 0
+            log_entries = []
+            with open(self.path, "r+b") as f:
+                for item in items:
+                    key = item.get(unique_key)
+                    if key is None:
+                        continue
+                    values = {uk: item.get(uk) for uk in update_keys if uk in item}
+
+                    lines = self._read_lines(f, key, unique_key)
+                    if lines is None:  # 索引与表文件内容不符，表文件被其他地方改写过
+                        self._rebuild_index()
+                        lines = self._read_lines(f, key, unique_key) or []
+
+                    lines = [line for line in lines if line[2] is not None]  # 不是json的行没有可更新的字段
+                    if not lines:
+                        continue
+                    updated += 1
+
+                    if key in self._updates.get(unique_key, {}):
+                        # 已有日志中的更新比表文件中的新，继续写日志保证顺序
+                        log_entries.append((unique_key, key, values))
+                        continue
+
+                    for offset, raw, data in lines:
+                        data.update(values)
+                        new_line = json.dumps(data, ensure_ascii=False).encode("utf-8")
+                        old_length = len(raw.rstrip(b"\r\n"))
+                        if len(new_line) > old_length:
+                            log_entries.append((unique_key, key, values))
+                            break
+                        f.seek(offset)
+                        f.write(new_line.ljust(old_length))
+
+            if log_entries:
+                self._append_updates(log_entries)
+                if self._update_count >= self.COMPACT_THRESHOLD:
+                    self.compact()
+
+            return updated
+
+    def _read_lines(self, f, key, unique_key):
+        """
+        读取key所在的行，已删除（空白）的行跳过
+        @return: [(offset, raw, data)]，索引与内容不符时返回None
+        """
+        lines = []
+        for offset in self._get_offsets(key):
+            f.seek(offset)
+            raw = f.readline()
+            if not raw.strip():
+                continue
+            if unique_key == LINE_KEY:
+                data = raw.strip().decode("utf-8")
+                line_key = data
+            else:
+                try:
+                    data = json.loads(raw)
+                except ValueError:
+                    # 不是json的行整行匹配，data为None
+                    data, line_key = None, plain_line_key(raw)
+                    if line_key is None:
+                        return None
+                else:
+                    if not isinstance(data, dict):
+                        return None
+                    line_key = data.get(unique_key)
+            if line_key != key:
+                if key_hash(line_key) == key_hash(key):
+                    continue  # 两个key的hash碰撞，这一行属于另一个key
+                return None
+            lines.append((offset, raw, data))
+        return lines
+
+    # ------------------------------------------------------------------ 删除
+
+    def _load_tombstones(self):
+        size = os.path.getsize(self.tombstones_path) if os.path.exists(self.tombstones_path) else 0
+        if size == self._tombstones_size:
+            return
+
+        self._tombstone_count = 0
+        if size:
+            with open(self.tombstones_path, "rb") as f:
+                self._tombstone_count = sum(1 for _ in f)
+        self._tombstones_size = size
+
+    def delete(self, keys, unique_key=LINE_KEY) -> int:
+        """
+        删除key所在的行：原地改写为等长的空格，并记录墓碑
+        @param unique_key: json表文件的字段名，LINE_KEY表示整行内容即为key
+        @return: 删除的行数
+        """
+        with self._lock:
+            self._load_tombstones()
+            self._refresh_index(unique_key)
+
+            tombstones = []
+            with open(self.path, "r+b") as f:
+                for key in keys:
+                    lines = self._read_lines(f, key, unique_key)
+                    if lines is None:  # 索引与表文件内容不符，表文件被其他地方改写过
+                        self._rebuild_index()
+                        lines = self._read_lines(f, key, unique_key) or []
+
+                    for offset, raw, data in lines:
+                        f.seek(offset)
+                        f.write(b" " * len(raw.rstrip(b"\r\n")))
+                        tombstones.append(json.dumps([unique_key, key, offset], ensure_ascii=False) + "\n")
+
+            if tombstones:
+                with open(self.tombstones_path, "a", encoding="utf-8") as f:
+                    f.writelines(tombstones)
+                self._tombstone_count += len(tombstones)
+                self._tombstones_size = os.path.getsize(self.tombstones_path)
+                if self._tombstone_count >= self.COMPACT_THRESHOLD:
+                    self.compact_in_background()
+
+            return len(tombstones)
+
+    def iter_lines(self):
+        """
+        逐行读取表文件：跳过已删除的行，合并还未压缩回表文件的更新
+        """
+        merge = self.has_updates()
+        with open(self.path, "rb") as f:
+            for raw in f:
+                if not raw.strip():
+                    continue
+                line = raw.decode("utf-8")
+                yield self.merge_updates(line) if merge else line
+
+    # ------------------------------------------------------------------ 压缩
+
+    def compact(self):
+        """
+        把更新日志合并回表文件，去掉已删除的行，并重建索引
+        """
+        with self._lock:
+            self._load_updates()
+            self._load_tombstones()
+            if not self._updates and not self._tombstone_count:
+                return
+
+            temp_path = self.path + f".compact_{threading.get_ident()}"
+            with open(self.path, "rb") as fi, open(temp_path, "wb") as fo:
+                for line in fi:
+                    if line.strip():
+                        fo.write(self.merge_updates(line.decode("utf-8")).encode("utf-8"))
+            try:
+                os.replace(temp_path, self.path)
+            except PermissionError:
+                # Windows下表文件正被读取，下次再压缩
+                os.remove(temp_path)
+                log.warning(f"Table file in use, compaction postponed: {self.path}")
+                return
+
+            for path in (self.updates_path, self.tombstones_path):
+                if os.path.exists(path):
+                    os.remove(path)
+
+            self._updates = {}
+            self._update_count = 0
+            self._updates_size = 0
+            self._tombstone_count = 0
+            self._tombstones_size = 0
+            if self._unique_key is not None:
+                self._rebuild_index()
+            elif os.path.exists(self.index_path):
+                os.remove(self.index_path)
+            log.debug(f"Compacted table file: {self.path}")
+
+    def compact_in_background(self):
+        """
+        在后台线程中压缩，删除数据的调用方不用等待整个表文件重写
+        """
+        with self._lock:
+            if self._compactor and self._compactor.is_alive():
+                return
+            self._compactor = threading.Thread(target=self._compact_safely, daemon=True)
+            self._compactor.start()
+
+    def _compact_safely(self):
+        try:
+            self.compact()
+        except Exception as e:
+            log.error(f"Error compacting {self.path}: {e}")
+
+    def close(self):
+        compactor = self._compactor
+        if compactor:
+            compactor.join()
+        if os.path.exists(self.path):
+            self.compact()
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_store(path) -> IndexedFileStore:
+    """
+    同一个表文件在进程内共用一个store
+    """
+    path = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = IndexedFileStore(path)
+        return store
+
+
+def close_stores():
+    with _stores_lock:
+        stores = list(_stores.values())
+    for store in stores:
+        try:
+            store.close()
+        except Exception as e:
+            log.error(f"Error compacting {store.path}: {e}")
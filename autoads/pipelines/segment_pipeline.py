@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+"""
+---------
+@summary: 列式分段存储的pipeline，与FilePipeline使用相同的表名（xxx.txt），数据存放在对应的 xxx.seg 文件中
+          使用方式: ItemBuffer.ITEM_PIPELINES 中加入 "autoads.pipelines.segment_pipeline.SegmentPipeline"
+          已有的JSONL表文件可用 segment_store.import_jsonl 导入，export_jsonl 导出
+---------
+"""
+
+import glob
+import json
+import os
+from typing import Dict, List, Tuple
+
+from autoads import tools
+from autoads.item import Item
+from autoads.log import log
+from autoads.pipelines import BasePipeline
+from autoads.pipelines.segment_store import (
+    RAW_COLUMN,
+    SEGMENT_SUFFIX,
+    close_segment_stores,
+    get_segment_store,
+    segment_path,
+)
+
+
+class SegmentPipeline(BasePipeline):
+    """
+    pipeline 是单线程的，批量保存数据的操作，不建议在这里写网络请求代码，如下载图片等
+    """
+
+    def save_items(self, table, items: List[Dict]) -> bool:
+        """
+        保存数据，每批数据写入一个行组
+        """
+        try:
+            get_segment_store(segment_path(tools.abspath(table))).append(items)
+            return True
+        except Exception as e:
+            log.error(f"Error in save_items for {table}: {e}")
+            return False
+
+    def update_items(self, table, items: List[Dict], update_keys=Tuple, unique_keys=Tuple) -> bool:
+        """
+        更新数据：追加更新段，读取时合并
+        """
+        unique_key = unique_keys[0] if unique_keys else 'member_link'
+        try:
+            get_segment_store(segment_path(tools.abspath(table))).update(items, update_keys, unique_key)
+        except Exception as e:
+            log.error(f"Error in update_items for {table}: {e}")
+        return True  # Return True to not block pipeline
+
+    def load_items(self, item: Item, begin=0, columns=None):
+        """
+        加载目录中所有分段存储文件的数据，与FilePipeline.load_items一样每次给出一行json
+        @param columns: 只读取这些字段，如 ("member_link", "status")
+        """
+        table = tools.abspath(item.table_name)
+        files = sorted(glob.glob(os.path.join(table, '*' + SEGMENT_SUFFIX)))
+        if not files:
+            log.warning(f"No segment files found in {table}")
+            return
+
+        index = 1
+        for file_path in files:
+            for row in get_segment_store(file_path).scan(columns):
+                if index > begin:
+                    yield self._to_line(row)
+                index += 1
+
+    def load_items_from_file(self, item: Item, file_path, begin=0, columns=None):
+        """
+        从指定的表文件（xxx.txt 或 xxx.seg）加载数据
+        """
+        file_path = tools.abspath(file_path)
+        if not file_path.endswith(SEGMENT_SUFFIX):
+            file_path = segment_path(file_path)
+        if not os.path.exists(file_path):
+            log.warning(f'File not found: {file_path}')
+            return
+
+        index = 1
+        for row in get_segment_store(file_path).scan(columns):
+            if index > begin:
+                yield self._to_line(row)
+            index += 1
+
+    @staticmethod
+    def _to_line(row):
+        if RAW_COLUMN in row and len(row) == 1:
+            return row[RAW_COLUMN] + "\n"
+        return json.dumps(row, ensure_ascii=False) + "\n"
+
+    def close(self):
+        if callable(self.__pre_close__):
+            self.__pre_close__()
+        # 把更新段/删除段合并到数据中
+        close_segment_stores()
@@ -0,0 +1,487 @@
+# -*- coding: utf-8 -*-
+"""
+---------
+@summary: 列式分段存储：群组/成员数据以行组（segment）追加写入 {table}.seg，每个行组内按列存储
+          列编码: 重复值多的列（group_name/group_link/ads_id/status等）字典编码，其余列存utf-8字符串，
+                  非字符串的值存json文本；缺少某个字段的行用位图标记
+          投影读取: 只解码需要的列，如只读 member_link/status，其他列直接跳过
+          更新/删除: 追加更新段/删除段，读取时合并（只作用于更早写入的行），超过COMPACT_THRESHOLD段时合并重写
+          与JSONL互相导入导出，不是json对象的行原样保存在RAW_COLUMN中
+---------
+"""
+
+import json
+import os
+import struct
+import sys
+import threading
+from array import array
+from typing import Dict, Iterable, List
+
+from autoads.log import log
+
+SEGMENT_SUFFIX = ".seg"
+RAW_COLUMN = "__line__"  # 导入时不是json对象的行
+
+
+def segment_path(table) -> str:
+    """
+    表文件（xxx.txt）对应的分段存储文件
+    """
+    root, ext = os.path.splitext(table)
+    return (root if ext == ".txt" else table) + SEGMENT_SUFFIX
+
+
+def _to_bytes(values: array) -> bytes:
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+
+def _from_bytes(typecode, data) -> array:
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+
+class SegmentStore:
+    MAGIC = b"ADSG"
+    VERSION = 1
+    FILE_HEADER = struct.Struct("<4sH")
+    # magic, kind, rows, columns, directory length, data length
+    SEGMENT_HEADER = struct.Struct("<2sBIHIQ")
+    SEGMENT_MAGIC = b"RG"
+
+    KIND_DATA = 0
+    KIND_UPDATE = 1
+    KIND_DELETE = 2
+
+    ENC_STR = 0
+    ENC_JSON = 1
+    ENC_DICT = 2  # 字典条目为字符串
+    ENC_DICT_JSON = 3  # 字典条目为json文本
+
+    # 总是字典编码的列，其他列不同值不超过一半时也字典编码
+    DICTIONARY_COLUMNS = ("group_name", "group_link", "ads_id", "status", "word", "role_type")
+    ROW_GROUP_SIZE = 10000  # 导入/压缩时每个行组的行数
+    COMPACT_THRESHOLD = 100  # 更新段+删除段超过该数量时合并重写
+
+    _MISSING = object()
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._change_segments = None  # 更新段+删除段数量，None表示还未统计
+
+    # ------------------------------------------------------------------ 编码
+
+    @classmethod
+    def _encode_strings(cls, texts: List[str]) -> bytes:
+        blobs = [text.encode("utf-8") for text in texts]
+        offsets = array("I", [0])
+        total = 0
+        for blob in blobs:
+            total += len(blob)
+            offsets.append(total)
+        return _to_bytes(offsets) + b"".join(blobs)
+
+    @classmethod
+    def _decode_strings(cls, data, count, start=0):
+        """
+        @return: (texts, end)
+        """
+        offsets_end = start + (count + 1) * 4
+        offsets = _from_bytes("I", data[start:offsets_end])
+        blob = data[offsets_end:offsets_end + offsets[-1]]
+        texts = [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(count)]
+        return texts, offsets_end + offsets[-1]
+
+    @classmethod
+    def _encode_column(cls, name, values: list):
+        """
+        @return: (encoding, has_presence, data)
+        """
+        present = [value for value in values if value is not cls._MISSING]
+        has_presence = len(present) != len(values)
+        data = b""
+        if has_presence:
+            bitmap = bytearray((len(values) + 7) // 8)
+            for i, value in enumerate(values):
+                if value is not cls._MISSING:
+                    bitmap[i >> 3] |= 1 << (i & 7)
+            data = bytes(bitmap)
+
+        all_str = all(isinstance(value, str) for value in present)
+        texts = present if all_str else [json.dumps(value, ensure_ascii=False) for value in present]
+
+        distinct = {}
+        for text in texts:
+            distinct.setdefault(text, len(distinct))
+        if name in cls.DICTIONARY_COLUMNS or len(distinct) * 2 <= len(texts):
+            codes = array("H" if len(distinct) <= 0xFFFF else "I", [distinct[text] for text in texts])
+            data += struct.pack("<IB", len(distinct), codes.itemsize)
+            data += cls._encode_strings(list(distinct)) + _to_bytes(codes)
+            return cls.ENC_DICT if all_str else cls.ENC_DICT_JSON, has_presence, data
+
+        return cls.ENC_STR if all_str else cls.ENC_JSON, has_presence, data + cls._encode_strings(texts)
+
+    @classmethod
+    def _decode_column(cls, encoding, has_presence, data, rows) -> list:
+        start = 0
+        present_rows = rows
+        bitmap = None
+        if has_presence:
+            bitmap = data[:(rows + 7) // 8]
+            start = len(bitmap)
+            present_rows = sum(bin(byte).count("1") for byte in bitmap)
+
+        if encoding in (cls.ENC_DICT, cls.ENC_DICT_JSON):
+            size, itemsize = struct.unpack_from("<IB", data, start)
+            entries, end = cls._decode_strings(data, size, start + 5)
+            if encoding == cls.ENC_DICT_JSON:
+                entries = [json.loads(entry) for entry in entries]
+            codes = _from_bytes("H" if itemsize == 2 else "I", data[end:end + present_rows * itemsize])
+            present = [entries[code] for code in codes]
+        else:
+            present, _ = cls._decode_strings(data, present_rows, start)
+            if encoding == cls.ENC_JSON:
+                present = [json.loads(text) for text in present]
+
+        if bitmap is None:
+            return present
+        values = []
+        it = iter(present)
+        for i in range(rows):
+            values.append(next(it) if bitmap[i >> 3] & (1 << (i & 7)) else cls._MISSING)
+        return values
+
+    @classmethod
+    def _encode_segment(cls, kind, rows: List[Dict], unique_key="") -> bytes:
+        columns = {}
+        for row in rows:
+            for name in row:
+                columns.setdefault(name, None)
+
+        directory = []
+        datas = []
+        key = unique_key.encode("utf-8")
+        directory.append(struct.pack("<H", len(key)) + key)
+        for name in columns:
+            encoding, has_presence, data = cls._encode_column(name, [row.get(name, cls._MISSING) for row in rows])
+            encoded_name = name.encode("utf-8")
+            directory.append(struct.pack("<H", len(encoded_name)) + encoded_name +
+                             struct.pack("<BBI", encoding, has_presence, len(data)))
+            datas.append(data)
+
+        directory = b"".join(directory)
+        data = b"".join(datas)
+        header = cls.SEGMENT_HEADER.pack(cls.SEGMENT_MAGIC, kind, len(rows), len(columns), len(directory), len(data))
+        return header + directory + data
+
+    # ------------------------------------------------------------------ 写入
+
+    def _write_segment(self, kind, rows, unique_key=""):
+        segment = self._encode_segment(kind, rows, unique_key)
+        with self._lock:
+            new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            if new_file:
+                file_dir = os.path.dirname(self.path)
+                if file_dir:
+                    os.makedirs(file_dir, exist_ok=True)  # 其他进程可能同时创建目录
+            with open(self.path, "ab") as f:
+                if new_file:
+                    f.write(self.FILE_HEADER.pack(self.MAGIC, self.VERSION))
+                f.write(segment)  # 一次写入整个行组，写入中断时读取忽略不完整的最后一段
+
+            if kind != self.KIND_DATA and self._change_segments is not None:
+                self._change_segments += 1
+
+    def append(self, rows: List[Dict]):
+        """
+        追加数据，每次调用写入一个行组
+        """
+        if rows:
+            self._write_segment(self.KIND_DATA, rows)
+
+    def update(self, items: List[Dict], update_keys, unique_key) -> int:
+        """
+        更新数据：追加更新段，只记录unique_key与更新的字段
+        @return: 记录的更新条数
+        """
+        rows = []
+        for item in items:
+            if item.get(unique_key) is None:
+                continue
+            row = {unique_key: item[unique_key]}
+            row.update({key: item[key] for key in update_keys if key in item})
+            rows.append(row)
+        if rows:
+            self._write_segment(self.KIND_UPDATE, rows, unique_key)
+            self._maybe_compact()
+        return len(rows)
+
+    def delete(self, keys: Iterable, unique_key) -> int:
+        """
+        删除数据：追加删除段
+        """
+        rows = [{unique_key: key} for key in keys]
+        if rows:
+            self._write_segment(self.KIND_DELETE, rows, unique_key)
+            self._maybe_compact()
+        return len(rows)
+
+    # ------------------------------------------------------------------ 读取
+
+    def _iter_segments(self, columns=None, kinds=None):
+        """
+        @param columns: 要解码的列，None为所有列
+        @param kinds: 要读取的段类型，None为所有类型；其他类型的段直接跳过
+        @return: 生成器 (index, kind, unique_key, rows, {column: values})
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "rb") as f:
+            file_size = os.fstat(f.fileno()).st_size
+            header = f.read(self.FILE_HEADER.size)
+            if not header:
+                return
+            magic, version = self.FILE_HEADER.unpack(header)
+            if magic != self.MAGIC or version != self.VERSION:
+                raise ValueError(f"Not a segment file: {self.path}")
+
+            index = 0
+            while True:
+                header = f.read(self.SEGMENT_HEADER.size)
+                if len(header) < self.SEGMENT_HEADER.size:
+                    break
+                magic, kind, rows, column_count, directory_length, data_length = self.SEGMENT_HEADER.unpack(header)
+                if magic != self.SEGMENT_MAGIC:
+                    log.warning(f"Corrupted segment in {self.path}, stop reading")
+                    break
+                if f.tell() + directory_length + data_length > file_size:
+                    break  # 写入中断的最后一段
+                if kinds is not None and kind not in kinds:
+                    f.seek(directory_length + data_length, os.SEEK_CUR)
+                    index += 1
+                    continue
+
+                directory = f.read(directory_length)
+                (key_length,) = struct.unpack_from("<H", directory, 0)
+                unique_key = directory[2:2 + key_length].decode("utf-8")
+                pos = 2 + key_length
+
+                values = {}
+                for _ in range(column_count):
+                    (name_length,) = struct.unpack_from("<H", directory, pos)
+                    name = directory[pos + 2:pos + 2 + name_length].decode("utf-8")
+                    encoding, has_presence, length = struct.unpack_from("<BBI", directory, pos + 2 + name_length)
+                    pos += 2 + name_length + 6
+
+                    wanted = columns is None or name in columns or (kind != self.KIND_DATA and name == unique_key)
+                    if not wanted:
+                        f.seek(length, os.SEEK_CUR)  # 不需要的列不读取
+                        continue
+                    values[name] = self._decode_column(encoding, has_presence, f.read(length), rows)
+
+                yield index, kind, unique_key, rows, values
+                index += 1
+
+    def _load_changes(self):
+        """
+        读取所有更新段/删除段
+        @return: {unique_key: {key: [(segment_index, values or None), ...]}}  values为None表示删除
+        """
+        changes = {}
+        count = 0
+        for index, kind, unique_key, rows, values in self._iter_segments(kinds=(self.KIND_UPDATE, self.KIND_DELETE)):
+            count += 1
+            keys = values.get(unique_key, [])
+            fields = [(name, column) for name, column in values.items() if name != unique_key]
+            by_key = changes.setdefault(unique_key, {})
+            for i, key in enumerate(keys):
+                if kind == self.KIND_DELETE:
+                    change = None
+                else:
+                    change = {name: column[i] for name, column in fields if column[i] is not self._MISSING}
+                by_key.setdefault(key, []).append((index, change))
+        self._change_segments = count
+        return changes
+
+    def scan(self, columns=None) -> Iterable[Dict]:
+        """
+        按写入顺序读取数据，合并更新、跳过删除的行
+        @param columns: 只读取这些列，如 ("member_link", "status")；None为所有列
+        """
+        changes = self._load_changes()
+        wanted = None
+        if columns is not None:
+            wanted = set(columns) | set(changes)  # 合并更新需要unique_key列
+
+        for index, kind, _, rows, values in self._iter_segments(wanted, kinds=(self.KIND_DATA,)):
+            names = list(values)
+            if not changes and columns is None and values and \
+                    not any(self._MISSING in column for column in values.values()):
+                # 没有更新/删除、也没有缺少字段的行，直接按列组装
+                for row_values in zip(*values.values()):
+                    yield dict(zip(names, row_values))
+                continue
+            if not changes and columns is not None:
+                names = [name for name in columns if name in values]
+                if not names:
+                    for _ in range(rows):
+                        yield {}
+                    continue
+                if not any(self._MISSING in values[name] for name in names):
+                    for row_values in zip(*(values[name] for name in names)):
+                        yield dict(zip(names, row_values))
+                    continue
+                names = list(values)
+
+            for i in range(rows):
+                row = {}
+                for name in names:
+                    value = values[name][i]
+                    if value is not self._MISSING:
+                        row[name] = value
+
+                deleted = False
+                for unique_key, by_key in changes.items():
+                    key = row.get(unique_key)
+                    if key is None or key not in by_key:
+                        continue
+                    for change_index, change in by_key[key]:
+                        if change_index < index:
+                            continue  # 更早的更新/删除不作用于之后写入的行
+                        if change is None:
+                            deleted = True
+                            break
+                        row.update(change)
+                    if deleted:
+                        break
+                if deleted:
+                    continue
+
+                if columns is not None:
+                    row = {name: row[name] for name in columns if name in row}
+                yield row
+
+    def count(self) -> int:
+        return sum(1 for _ in self.scan(columns=()))
+
+    # ------------------------------------------------------------------ 压缩
+
+    def _maybe_compact(self):
+        if self._change_segments is None:
+            self._load_changes()
+        if self._change_segments >= self.COMPACT_THRESHOLD:
+            self.compact()
+
+    def compact(self):
+        """
+        把更新/删除合并到数据中，按ROW_GROUP_SIZE重新分段
+        """
+        with self._lock:
+            if not os.path.exists(self.path):
+                return
+            temp_path = self.path + f".compact_{threading.get_ident()}"
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            temp = SegmentStore(temp_path)
+            batch = []
+            for row in self.scan():
+                batch.append(row)
+                if len(batch) >= self.ROW_GROUP_SIZE:
+                    temp.append(batch)
+                    batch = []
+            temp.append(batch)
+            if not os.path.exists(temp_path):
+                with open(temp_path, "wb") as f:
+                    f.write(self.FILE_HEADER.pack(self.MAGIC, self.VERSION))
+            os.replace(temp_path, self.path)
+            self._change_segments = 0
+            log.debug(f"Compacted segment file: {self.path}")
+
+    def close(self):
+        if self._change_segments is None and os.path.exists(self.path):
+            self._load_changes()
+        if self._change_segments:
+            self.compact()
+
+
+# ---------------------------------------------------------------------- JSONL 导入导出
+
+
+def import_jsonl(jsonl_path, path=None, batch_size=SegmentStore.ROW_GROUP_SIZE) -> int:
+    """
+    把JSONL表文件导入分段存储，追加到已有数据之后
+    @param path: 分段存储文件，默认为表文件对应的 .seg 文件
+    @return: 导入的行数
+    """
+    store = get_segment_store(path or segment_path(jsonl_path))
+    count = 0
+    batch = []
+    with open(jsonl_path, encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\r\n")
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError:
+                row = None
+            if not isinstance(row, dict) or RAW_COLUMN in row:
+                row = {RAW_COLUMN: line}
+            batch.append(row)
+            if len(batch) >= batch_size:
+                store.append(batch)
+                count += len(batch)
+                batch = []
+    store.append(batch)
+    return count + len(batch)
+
+
+def export_jsonl(path, jsonl_path) -> int:
+    """
+    把分段存储导出为JSONL表文件（合并更新，跳过删除的行）
+    @return: 导出的行数
+    """
+    count = 0
+    temp_path = jsonl_path + ".export"
+    with open(temp_path, "w", encoding="utf-8", newline="\n") as f:
+        for row in get_segment_store(path).scan():
+            if RAW_COLUMN in row and len(row) == 1:
+                f.write(row[RAW_COLUMN] + "\n")
+            else:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            count += 1
+    os.replace(temp_path, jsonl_path)
+    return count
+
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def get_segment_store(path) -> SegmentStore:
+    """
+    同一个分段存储文件在进程内共用一个store
+    """
+    path = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = SegmentStore(path)
+        return store
+
+
+def close_segment_stores():
+    with _stores_lock:
+        stores = list(_stores.values())
+    for store in stores:
+        try:
+            store.close()
+        except Exception as e:
+            log.error(f"Error compacting {store.path}: {e}")
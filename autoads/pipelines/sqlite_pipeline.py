@@ -0,0 +1,282 @@
+# -*- coding: utf-8 -*-
+"""
+---------
+@summary: 嵌入式sqlite数据库的pipeline，可代替FilePipeline
+          表名仍是FilePipeline的文件路径（xxx/group1.txt），同一目录下的表存放在 xxx/items.db 中，每个文件对应一张表
+          表中 __unique_key__ 与 __update_key__ 的字段单独成列（唯一索引在__unique_key__上），整行数据以json保存在data列
+          并发: 每个线程每个数据库文件一个WAL连接，每张表一把锁，ItemBuffer的多个写入线程可以同时写不同的表
+          使用方式: ItemBuffer.ITEM_PIPELINES 中加入 "autoads.pipelines.sqlite_pipeline.SqlitePipeline"
+---------
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Tuple
+
+from autoads import tools
+from autoads.item import Item
+from autoads.log import log
+from autoads.pipelines import BasePipeline
+
+SQLITE_FILE = "items.db"
+DATA_COLUMN = "data"
+MAX_VARIABLES = 500  # 老版本sqlite一条语句最多999个参数
+BUSY_TIMEOUT = 30  # 同一个数据库文件同一时刻只有一个写事务，其他连接最多等待的秒数
+
+
+def sqlite_path(table):
+    """
+    表所在目录的数据库文件
+    """
+    return os.path.join(os.path.dirname(tools.abspath(table)), SQLITE_FILE)
+
+
+def sql_table_name(table):
+    """
+    表文件名（不含.txt）作为sqlite的表名
+    """
+    name = os.path.basename(table)
+    if name.endswith(".txt"):
+        name = name[:-4]
+    return name
+
+
+def quote(name):
+    return '"{}"'.format(name.replace('"', '""'))
+
+
+class SqlitePipeline(BasePipeline):
+    """
+    pipeline 是单线程的，批量保存数据的操作，不建议在这里写网络请求代码，如下载图片等
+    """
+
+    def __init__(self):
+        self._local = threading.local()  # 每个线程的写入连接 {数据库文件: 连接}
+        self._connections = []  # 所有线程的连接，close时统一关闭
+        self._columns = {}  # (数据库文件, 表名): [key列]
+        self._indexed = set()  # 已建索引的 (数据库文件, 表名)
+        self._table_locks = {}  # (数据库文件, 表名): 锁，同一张表的建表/补列/写入依次进行
+        self._lock = threading.Lock()  # 保护_connections和_table_locks
+
+    def _connect(self, db_path):
+        connections = getattr(self._local, "connections", None)
+        if connections is None:
+            connections = self._local.connections = {}
+        connection = connections.get(db_path)
+        if connection is None:
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+            # check_same_thread=False: close时由其他线程关闭
+            connection = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")  # 读取时不阻塞写入
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connections[db_path] = connection
+            with self._lock:
+                self._connections.append(connection)
+        return connection
+
+    def _table_lock(self, db_path, name):
+        with self._lock:
+            lock = self._table_locks.get((db_path, name))
+            if lock is None:
+                lock = self._table_locks[(db_path, name)] = threading.RLock()
+            return lock
+
+    def _table_columns(self, connection, db_path, name):
+        """
+        表中已有的key列，表不存在时返回None
+        """
+        columns = self._columns.get((db_path, name))
+        if columns is None:
+            rows = connection.execute(f"PRAGMA table_info({quote(name)})").fetchall()
+            if not rows:
+                return None
+            columns = [row[1] for row in rows if row[1] not in ("id", DATA_COLUMN)]
+            self._columns[(db_path, name)] = columns
+        return columns
+
+    def create_table(self, table, unique_keys=(), update_keys=()):
+        """
+        根据 __unique_key__ 与 __update_key__ 建表，已存在的表补上缺少的列
+        """
+        db_path = sqlite_path(table)
+        name = sql_table_name(table)
+        keys = list(dict.fromkeys(list(unique_keys or ()) + list(update_keys or ())))
+
+        with self._table_lock(db_path, name):
+            connection = self._connect(db_path)
+            columns = self._table_columns(connection, db_path, name)
+            with connection:
+                if columns is None:
+                    # key列不声明类型，保留数据原来的类型
+                    definitions = "".join(f", {quote(key)}" for key in keys)
+                    connection.execute(
+                        f"CREATE TABLE IF NOT EXISTS {quote(name)} "
+                        f"(id INTEGER PRIMARY KEY{definitions}, {DATA_COLUMN} TEXT)"
+                    )
+                    columns = self._columns[(db_path, name)] = keys
+                else:
+                    missing = [key for key in keys if key not in columns]
+                    for key in missing:
+                        connection.execute(f"ALTER TABLE {quote(name)} ADD COLUMN {quote(key)}")
+                    if missing:
+                        # 新加的列从data中回填
+                        rows = connection.execute(f"SELECT id, {DATA_COLUMN} FROM {quote(name)}").fetchall()
+                        values = []
+                        for row_id, data in rows:
+                            data = json.loads(data)
+                            values.append([tools.format_sql_value(data.get(key)) for key in missing] + [row_id])
+                        assignments = ", ".join(f"{quote(key)}=?" for key in missing)
+                        connection.executemany(f"UPDATE {quote(name)} SET {assignments} WHERE id=?", values)
+                        columns.extend(missing)
+
+                if unique_keys and (db_path, name) not in self._indexed:
+                    self._create_index(connection, name, unique_keys)
+                    self._indexed.add((db_path, name))
+        return columns
+
+    @staticmethod
+    def _create_index(connection, name, unique_keys):
+        keys = ", ".join(quote(key) for key in unique_keys)
+        try:
+            connection.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS {quote(name + '_unique')} ON {quote(name)} ({keys})")
+        except sqlite3.IntegrityError:
+            # 建表时不知道唯一键、已经存入了重复数据的表，只建普通索引
+            log.warning(f"Duplicate {unique_keys} in {name}, creating a non-unique index")
+            connection.execute(f"CREATE INDEX IF NOT EXISTS {quote(name + '_key')} ON {quote(name)} ({keys})")
+
+    def save_items(self, table, items: List[Dict]) -> bool:
+        """
+        保存数据，每批数据一个事务，唯一索引冲突的数据忽略
+        """
+        db_path = sqlite_path(table)
+        name = sql_table_name(table)
+        try:
+            with self._table_lock(db_path, name):
+                connection = self._connect(db_path)
+                columns = self._table_columns(connection, db_path, name)
+                if columns is None:
+                    columns = self.create_table(table)
+
+                placeholders = ", ".join(["?"] * (len(columns) + 1))
+                names = ", ".join([quote(column) for column in columns] + [DATA_COLUMN])
+                values = [
+                    [tools.format_sql_value(item.get(column)) for column in columns]
+                    + [json.dumps(item, ensure_ascii=False)]
+                    for item in items
+                ]
+                with connection:
+                    connection.executemany(
+                        f"INSERT OR IGNORE INTO {quote(name)} ({names}) VALUES ({placeholders})", values
+                    )
+            return True
+        except Exception as e:
+            log.error(f"Error in save_items for {table}: {e}")
+            return False
+
+    def update_items(self, table, items: List[Dict], update_keys=Tuple, unique_keys=Tuple) -> bool:
+        """
+        更新数据：更新值相同的数据合并成一条 UPDATE ... WHERE unique_key IN (...)，走唯一索引
+        """
+        if not update_keys:
+            return True
+        unique_key = unique_keys[0] if unique_keys else 'member_link'
+        db_path = sqlite_path(table)
+        name = sql_table_name(table)
+        try:
+            with self._table_lock(db_path, name):
+                connection = self._connect(db_path)
+                if self._table_columns(connection, db_path, name) is None:
+                    log.warning(f"Table not found: {table}")
+                    return True  # Return True to not block pipeline
+                self.create_table(table, unique_keys or (unique_key,), update_keys)
+
+                groups = {}  # 更新的值: [unique_key的值]
+                for item in items:
+                    if item.get(unique_key) is None:
+                        continue
+                    values = tuple(tools.format_sql_value(item.get(key)) for key in update_keys)
+                    groups.setdefault(values, []).append(tools.format_sql_value(item[unique_key]))
+
+                assignments = ", ".join(f"{quote(key)}=?" for key in update_keys)
+                with connection:
+                    for values, keys in groups.items():
+                        for i in range(0, len(keys), MAX_VARIABLES):
+                            chunk = keys[i:i + MAX_VARIABLES]
+                            connection.execute(
+                                f"UPDATE {quote(name)} SET {assignments} "
+                                f"WHERE {quote(unique_key)} IN ({', '.join(['?'] * len(chunk))})",
+                                list(values) + chunk,
+                            )
+        except Exception as e:
+            log.error(f"Error in update_items for {table}: {e}")
+        return True  # Return True to not block pipeline
+
+    def _iter_table(self, db_path, name, begin=0):
+        """
+        按写入顺序读取一张表，key列覆盖data中的旧值
+        """
+        # 读取使用单独的连接，WAL模式下不影响入库线程写入
+        connection = sqlite3.connect(db_path)
+        try:
+            rows = connection.execute(f"PRAGMA table_info({quote(name)})").fetchall()
+            if not rows:
+                return
+            columns = [row[1] for row in rows if row[1] not in ("id", DATA_COLUMN)]
+            names = ", ".join([quote(column) for column in columns] + [DATA_COLUMN])
+            cursor = connection.execute(f"SELECT {names} FROM {quote(name)} ORDER BY id LIMIT -1 OFFSET ?", (begin,))
+            for row in cursor:
+                data = json.loads(row[-1])
+                for column, value in zip(columns, row):
+                    if value != tools.format_sql_value(data.get(column)):
+                        data[column] = value
+                yield data
+        finally:
+            connection.close()
+
+    def load_items(self, item: Item, begin=0):
+        """
+        加载目录中所有表的数据，与FilePipeline.load_items一样每次给出一行json
+        """
+        db_path = os.path.join(tools.abspath(item.table_name), SQLITE_FILE)
+        if not os.path.exists(db_path):
+            log.warning(f"No sqlite database found in {item.table_name}")
+            return
+
+        connection = sqlite3.connect(db_path)
+        try:
+            names = [row[0] for row in connection.execute(
+                "SELECT name FROM sqlite_master WHERE type='table' ORDER BY name")]
+        finally:
+            connection.close()
+
+        index = 1
+        for name in names:
+            for data in self._iter_table(db_path, name):
+                if index > begin:
+                    yield json.dumps(data, ensure_ascii=False) + "\n"
+                index += 1
+
+    def load_items_from_file(self, item: Item, file_path, begin=0):
+        """
+        从指定的表（xxx/group1.txt）加载数据
+        """
+        db_path = sqlite_path(file_path)
+        if not os.path.exists(db_path):
+            log.warning(f'File not found: {db_path}')
+            return
+
+        for data in self._iter_table(db_path, sql_table_name(file_path), begin):
+            yield json.dumps(data, ensure_ascii=False) + "\n"
+
+    def close(self):
+        if callable(self.__pre_close__):
+            self.__pre_close__()
+        with self._lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+            self._local = threading.local()  # 各线程下次使用时重新连接
+            self._columns.clear()
+            self._indexed.clear()
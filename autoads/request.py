@@ -7,6 +7,7 @@ Created on 2018-07-25 11:49:08
 @author: Boris
 @email:  boris_liu@foxmail.com
 """
+import itertools
 import threading
 import autoads.tools as tools
 from autoads.response import Response
@@ -14,8 +15,38 @@ from autoads.log import log
 from autoads.webdriver import WebDriverPool
 from autoads.config import config
 
+_SEQUENCE = itertools.count()  # 创建顺序，同优先级的请求先进先出
+_PRIMITIVE_TYPES = (bytes, bool, float, int, str, type(None))
+
 
 class Request(object):
+    """
+    请求的常用字段放在 __slots__ 中，其他自定义参数（如 group、member、word）放在 extra 中，
+    可以通过 request.group 读取，修改时请使用 request.extra['group'] = xxx
+    """
+
+    __slots__ = (
+        "url",
+        "retry_times",
+        "auto_request",
+        "render",
+        "render_time",
+        "ads_id",
+        "response",
+        "parser_name",
+        "request_sync",
+        "callback",
+        "finished_nums",
+        "driver_count",
+        "is_drop",
+        "stop_event",
+        "index",
+        "_requests_kwargs",
+        "extra",
+        "journal_id",
+        "_sort_key",
+    )
+
     session = None
     webdriver_pool: WebDriverPool = None
 
@@ -53,8 +84,31 @@ class Request(object):
         random_user_agent=True,
         download_midware=None,
         is_abandoned=False,
-        render=False,
-        render_time=0,
+        render=True,
+        render_time=8,
+        ads_id=None,
+        driver_count=1,
+        is_drop=False,
+        finished_nums=0,
+        index=0,
+    )
+
+    # to_dict 中保存的字段，response 和 stop_event 是运行时状态，不保存
+    __DICT_ATTRS__ = (
+        "url",
+        "retry_times",
+        "priority",
+        "parser_name",
+        "auto_request",
+        "request_sync",
+        "render",
+        "render_time",
+        "ads_id",
+        "callback",
+        "finished_nums",
+        "driver_count",
+        "is_drop",
+        "index",
     )
 
     def __init__(
@@ -74,6 +128,7 @@ class Request(object):
             callback=None,
             finished_nums=0,
             stop_event=None,
+            index=0,
             **kwargs,
     ):
         """
@@ -91,8 +146,8 @@ class Request(object):
         :param driver_count:
         :param is_drop: 是否要丢弃这个请求
         :param callback:
-        :param put_back:  被放回的次数和被放回的浏览器
-        :param kwargs:
+        :param index: 当前页面已处理到的数据下标
+        :param kwargs: requests 参数放入 requests_kwargs，其他参数放入 extra
         """
 
         self.url = url
@@ -105,20 +160,18 @@ class Request(object):
         self.parser_name = parser_name
         self.request_sync = request_sync
         self.callback = callback
-        self.priority = priority
+        self._sort_key = (priority, next(_SEQUENCE))
         self.finished_nums = finished_nums
-        self.member_timeout = config.member_timeout
         self.driver_count = driver_count
         self.is_drop = is_drop
-        self.put_back = {}
-        self.stop_event=stop_event
-
-        self.requests_kwargs = {}
-        for key, value in kwargs.items():
-            if key in self.__class__.__REQUEST_ATTRS__:  # 取requests参数
-                self.requests_kwargs[key] = value
+        self.stop_event = stop_event
+        self.index = index
+        self.journal_id = None  # 请求日志中的id，见 autoads.request_journal
 
-            self.__dict__[key] = value
+        self._requests_kwargs = None  # 大部分请求没有requests参数，用到时再创建
+        if not self.__REQUEST_ATTRS__.isdisjoint(kwargs):  # 取requests参数
+            self._requests_kwargs = {key: kwargs.pop(key) for key in self.__REQUEST_ATTRS__.intersection(kwargs)}
+        self.extra = kwargs  # kwargs 每次调用都是新的dict，直接作为扩展字段
 
     def __repr__(self):
         try:
@@ -126,20 +179,37 @@ class Request(object):
         except:
             return "<Request {}>".format(str(self.to_dict)[:40])
 
-    def __setattr__(self, key, value):
+    def __getattr__(self, key):
         """
-        针对 request.xxx = xxx 的形式，更新reqeust及内部参数值
-        @param key:
-        @param value:
-        @return:
+        slots 中没有的属性从 extra 中取
         """
-        self.__dict__[key] = value
-
-        if key in self.__class__.__REQUEST_ATTRS__:
-            self.requests_kwargs[key] = value
+        if key == "extra" or key.startswith("__"):
+            raise AttributeError(key)
+        try:
+            return self.extra[key]
+        except KeyError:
+            raise AttributeError(f"'{self.__class__.__name__}' object has no attribute '{key}'") from None
 
     def __lt__(self, other):
-        return self.priority < other.priority
+        return self._sort_key < other._sort_key
+
+    @property
+    def priority(self):
+        return self._sort_key[0]
+
+    @priority.setter
+    def priority(self, value):
+        self._sort_key = (value, self._sort_key[1])
+
+    @property
+    def member_timeout(self):
+        return config.member_timeout
+
+    @property
+    def requests_kwargs(self):
+        if self._requests_kwargs is None:
+            self._requests_kwargs = {}
+        return self._requests_kwargs
 
     @property
     def _webdriver_pool(self):
@@ -158,23 +228,22 @@ class Request(object):
     def to_dict(self):
         request_dict = {}
 
-        for key, value in self.__dict__.items():
-            if (
-                    key in self.__class__.DEFAULT_KEY_VALUE
-                    and self.__class__.DEFAULT_KEY_VALUE.get(key) == value
-                    or key == "requests_kwargs"
-            ):
+        for key in self.__DICT_ATTRS__:
+            value = getattr(self, key)
+            if key in self.DEFAULT_KEY_VALUE and self.DEFAULT_KEY_VALUE[key] == value:
                 continue
+            if not isinstance(value, _PRIMITIVE_TYPES):
+                value = tools.dumps_obj(value)
+            request_dict[key] = value
 
-            if key in self.__class__.__REQUEST_ATTRS__:
-                if not isinstance(
-                        value, (bytes, bool, float, int, str, tuple, list, dict)
-                ):
-                    value = tools.dumps_obj(value)
-            else:
-                if not isinstance(value, (bytes, bool, float, int, str)):
-                    value = tools.dumps_obj(value)
+        for key, value in (self._requests_kwargs or {}).items():
+            if not isinstance(value, _PRIMITIVE_TYPES + (tuple, list, dict)):
+                value = tools.dumps_obj(value)
+            request_dict[key] = value
 
+        for key, value in self.extra.items():
+            if not isinstance(value, _PRIMITIVE_TYPES):
+                value = tools.dumps_obj(value)
             request_dict[key] = value
 
         return request_dict
@@ -262,4 +331,27 @@ class Request(object):
         return cls(**request_dict)
 
     def copy(self):
-        return self.__class__.from_dict(self.to_dict)
+        request = self.__class__.from_dict(self.to_dict)
+        request.stop_event = self.stop_event
+        return request
+
+
+def _request_kwarg(key):
+    """
+    request.timeout 等 requests 参数直接读写 requests_kwargs
+    """
+
+    def getter(self):
+        try:
+            return self.requests_kwargs[key]
+        except KeyError:
+            raise AttributeError(key) from None
+
+    def setter(self, value):
+        self.requests_kwargs[key] = value
+
+    return property(getter, setter)
+
+
+for _key in Request.__REQUEST_ATTRS__:
+    setattr(Request, _key, _request_kwarg(_key))
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+---------
+@summary: 请求日志：记录请求的入队(add)和处理完成(ack)，程序崩溃或停止后重新启动时恢复未完成的请求
+          {name}.journal  追加写入的操作记录，每行一个json: {"op": "add", "id": 1, "request": {...}} / {"op": "ack", "id": 1}
+          {name}.snapshot 上次合并时还未完成的请求，格式与add记录相同
+          合并: 每ack COMPACT_INTERVAL 次，把快照和日志中未完成的请求写入新快照（临时文件+替换），再清空日志
+          同一个id的add/ack重复应用结果不变，合并中途崩溃时快照和日志一起回放仍然正确
+---------
+"""
+
+import base64
+import json
+import os
+import threading
+
+from autoads.log import log
+from autoads.request import Request
+
+JOURNAL_SUFFIX = ".journal"
+SNAPSHOT_SUFFIX = ".snapshot"
+COMPACT_INTERVAL = 1000  # 每处理完这么多个请求合并一次
+
+
+def _encode(value):
+    # Request.to_dict 中的对象（如GroupItem）是pickle后的bytes
+    if isinstance(value, bytes):
+        return {"__bytes__": base64.b64encode(value).decode("ascii")}
+    return value
+
+
+def _decode(value):
+    if isinstance(value, dict) and "__bytes__" in value:
+        return base64.b64decode(value["__bytes__"])
+    return value
+
+
+class RequestJournal:
+    def __init__(self, path, name, compact_interval=COMPACT_INTERVAL):
+        self.path = path
+        self.journal_path = os.path.join(path, name + JOURNAL_SUFFIX)
+        self.snapshot_path = os.path.join(path, name + SNAPSHOT_SUFFIX)
+        self.compact_interval = compact_interval
+
+        self._lock = threading.Lock()
+        self._file = None
+        self._next_id = 1
+        self._pending_count = 0
+        self._acks_since_compact = 0
+
+    def _iter_records(self):
+        """
+        按写入顺序读取快照和日志中的记录，跳过崩溃时写了一半的行
+        """
+        for file_path in (self.snapshot_path, self.journal_path):
+            if not os.path.exists(file_path):
+                continue
+            with open(file_path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue
+
+    def open(self):
+        """
+        回放快照和日志，返回未完成的请求（按入队顺序）
+        :return: [Request, ...]
+        """
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock:
+            pending = {}
+            for record in self._iter_records():
+                journal_id = record["id"]
+                self._next_id = max(self._next_id, journal_id + 1)
+                if record["op"] == "add":
+                    pending[journal_id] = record["request"]
+                else:
+                    pending.pop(journal_id, None)
+
+            # 合并一次，日志从空文件开始，也去掉了崩溃时写了一半的行
+            self.__compact()
+
+        requests = []
+        for journal_id in sorted(pending):
+            request_dict = {key: _decode(value) for key, value in pending[journal_id].items()}
+            try:
+                request = Request.from_dict(request_dict)
+            except Exception as e:
+                log.error(f"请求日志中的请求{journal_id}无法恢复: {e}")
+                self.ack_id(journal_id)
+                continue
+            request.journal_id = journal_id
+            requests.append(request)
+        return requests
+
+    def add(self, request: Request):
+        """
+        记录请求入队，请求中不能序列化的字段会导致这个请求不被记录
+        """
+        try:
+            request_dict = {key: _encode(value) for key, value in request.to_dict.items()}
+        except Exception as e:
+            log.warning(f"请求{request}不能写入请求日志: {e}")
+            return
+
+        with self._lock:
+            journal_id = self._next_id
+            self._next_id += 1
+            self.__write({"op": "add", "id": journal_id, "request": request_dict})
+            self._pending_count += 1
+        request.journal_id = journal_id
+
+    def ack(self, request: Request):
+        """
+        请求已处理完成（包括丢弃、出错），重启后不再恢复
+        """
+        if request.journal_id is not None:
+            self.ack_id(request.journal_id)
+            request.journal_id = None
+
+    def ack_id(self, journal_id):
+        with self._lock:
+            self.__write({"op": "ack", "id": journal_id})
+            self._pending_count -= 1
+            self._acks_since_compact += 1
+            if self._acks_since_compact >= self.compact_interval:
+                self.__compact()
+
+    def __write(self, record):
+        if self._file is None:
+            self._file = open(self.journal_path, "a", encoding="utf-8")
+        self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        self._file.flush()  # 进程崩溃时不丢失
+
+    def __compact(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+
+        acked = {record["id"] for record in self._iter_records() if record["op"] == "ack"}
+        tmp_path = self.snapshot_path + ".tmp"
+        count = 0
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in self._iter_records():
+                if record["op"] == "add" and record["id"] not in acked:
+                    acked.add(record["id"])  # 快照中已有、崩溃前又回放到日志的add只写一次
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    count += 1
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+        # 快照已包含日志中的全部记录，可以清空日志
+        self._file = open(self.journal_path, "w", encoding="utf-8")
+        self._pending_count = count
+        self._acks_since_compact = 0
+
+    def compact(self):
+        with self._lock:
+            self.__compact()
+
+    def pending_count(self):
+        with self._lock:
+            return self._pending_count
+
+    def close(self):
+        """
+        停止采集时调用，保留未完成的请求供下次恢复
+        """
+        with self._lock:
+            self.__compact()
+            self._file.close()
+            self._file = None
+
+    def clear(self):
+        """
+        所有请求都已完成，删除日志和快照
+        """
+        with self._lock:
+            if self._file:
+                self._file.close()
+                self._file = None
+            for file_path in (self.journal_path, self.snapshot_path):
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+            self._pending_count = 0
+            self._acks_since_compact = 0
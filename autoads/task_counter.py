@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+---------
+@summary: 未完成任务计数器，代替轮询判断爬虫是否结束
+          计数覆盖：请求队列中的请求 + 正在处理的请求 + ItemBuffer中未入库的数据
+---------
+"""
+import threading
+
+
+class TaskCounter:
+    def __init__(self):
+        self._count = 0
+        self._lock = threading.Lock()
+        self._done_event = threading.Event()  # 计数归零时置位
+        self._done_event.set()
+
+    @property
+    def count(self):
+        return self._count
+
+    def add(self, n=1):
+        """
+        增加未完成任务数
+        :param n: 任务数
+        :return:
+        """
+        if n <= 0:
+            return
+
+        with self._lock:
+            self._count += n
+            self._done_event.clear()
+
+    def done(self, n=1):
+        """
+        完成任务，计数归零时通知所有等待的线程
+        :param n: 任务数
+        :return:
+        """
+        if n <= 0:
+            return
+
+        with self._lock:
+            self._count = max(0, self._count - n)
+            if self._count == 0:
+                self._done_event.set()
+
+    def reset(self):
+        with self._lock:
+            self._count = 0
+            self._done_event.set()
+
+    def is_done(self):
+        return self._done_event.is_set()
+
+    def wait_done(self, timeout=None):
+        """
+        阻塞等待所有任务完成
+        :param timeout: 超时时间（秒），None为一直等待
+        :return: 是否已完成
+        """
+        return self._done_event.wait(timeout)
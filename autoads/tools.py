@@ -47,6 +47,9 @@ import threading
 from datetime import datetime
 from autoads.config import config
 from autoads import ads_api
+from autoads.pipelines.file_store import LINE_KEY, get_store
+from autoads.pipelines.consolidate import consolidate, unique_files
+from autoads.ui_message_bus import ui_message_bus
 import glob
 try:
     import wmi
@@ -485,17 +488,12 @@ def setTextBrowserObjectName(ui=None, grid_layout=None):
 
 
 def send_message_to_ui(ms=None, ui=None, message=None):
+    """
+    把消息显示到当前线程对应的 QTextBrowser
+    消息经过 ui_message_bus 合并后按固定帧率发送，不会每条消息都发送一次信号
+    """
     if ms and ui and message:
-        thread_name = threading.current_thread().name
-        # print(f'thread_name={thread_name}')
-        text_browsers = ui.findChildren(QTextBrowser, thread_name)
-        if len(text_browsers) == 0:
-            # print(f'__name__={threading.current_thread().__class__.__name__}')
-            text_browsers = ui.findChildren(QTextBrowser,
-                                            'textBrowser' + threading.current_thread().__class__.__name__)
-
-        if len(text_browsers) > 0:
-            ms.text_print.emit(text_browsers[0], message)
+        ui_message_bus.send(ms, ui, message)
 
 
 def clear_queue(q: Queue):
@@ -2724,7 +2722,7 @@ def abspath(path):
     return os.path.abspath(path)
 
 
-def unique_member(dir, unique_key=None):
+def unique_member(dir, unique_key=None, workers=1, incremental=False):
     """
     对目录中的成员文件进行去重
     Deduplicate member files in a directory
@@ -2735,89 +2733,30 @@ def unique_member(dir, unique_key=None):
     
     :param dir: 目录路径
     :param unique_key: JSON格式时的唯一键名 (如 'member_link')
+    :param workers: 解析/改写文件的进程数
+    :param incremental: 增量去重，只处理上次去重后新追加的行
     :return: 去重后的总数量
     """
     table = abspath(dir)
     # 使用跨平台的 glob 模式
-    files = glob.glob(os.path.join(table, '*.txt'))
+    files = [abspath(f) for f in glob.glob(os.path.join(table, '*.txt'))]
     
     if not files:
         log.info(f"No files found in {table} for deduplication")
         return 0
     
-    all_seen = set()  # 全局去重集合
-    total_removed = 0
-    total_kept = 0
+    try:
+        result = unique_files(files, unique_key, workers=workers, incremental=incremental)
+    except Exception as e:
+        log.error(f"去重目录 {table} 时出错: {e}")
+        return 0
     
-    for file_path in files:
-        # 跳过临时文件
-        if '_temp' in file_path:
-            continue
-            
-        file_path = abspath(file_path)
-        is_links_file = file_path.endswith('_links.txt')
-        
-        # 构建临时文件路径
-        split_index = file_path.rfind('.')
-        temp_file = file_path[:split_index] + '_temp_dedup' + file_path[split_index:]
-        
-        file_removed = 0
-        file_kept = 0
-        
-        try:
-            with codecs.open(file_path, 'r', encoding='utf-8') as fi, \
-                    codecs.open(temp_file, 'w', encoding='utf-8') as fo:
-                
-                for line in fi:
-                    line = line.strip()
-                    if not line:
-                        continue
-                    
-                    # 提取唯一标识符
-                    if is_links_file:
-                        # 纯URL文件
-                        identifier = line
-                    else:
-                        # JSON文件
-                        try:
-                            dictobj = json.loads(line)
-                            if unique_key:
-                                identifier = dictobj.get(unique_key, line)
-                            else:
-                                # 尝试常见的键名
-                                identifier = dictobj.get('member_link') or dictobj.get('group_link') or dictobj.get('url') or line
-                        except json.JSONDecodeError:
-                            # 不是有效的JSON，当作纯文本
-                            identifier = line
-                    
-                    if identifier in all_seen:
-                        file_removed += 1
-                    else:
-                        all_seen.add(identifier)
-                        fo.write(line + '\n')
-                        file_kept += 1
-            
-            # 替换原文件
-            os.remove(file_path)
-            os.rename(temp_file, file_path)
-            
-            total_removed += file_removed
-            total_kept += file_kept
-            
-            if file_removed > 0:
-                log.info(f"去重文件 {os.path.basename(file_path)}: 保留 {file_kept}, 删除重复 {file_removed}")
-                
-        except Exception as e:
-            log.error(f"去重文件 {file_path} 时出错: {e}")
-            # 清理临时文件
-            if os.path.exists(temp_file):
-                try:
-                    os.remove(temp_file)
-                except:
-                    pass
+    for file_path, (file_kept, file_removed) in result['files'].items():
+        if file_removed > 0:
+            log.info(f"去重文件 {os.path.basename(file_path)}: 保留 {file_kept}, 删除重复 {file_removed}")
     
-    log.info(f"去重完成: 共保留 {total_kept} 条, 删除重复 {total_removed} 条")
-    return total_kept
+    log.info(f"去重完成: 共保留 {result['kept']} 条, 删除重复 {result['removed']} 条")
+    return result['kept']
 
 
 def delete_entry_from_file(file_path, unique_key_or_url, unique_value=None):
@@ -2829,100 +2768,17 @@ def delete_entry_from_file(file_path, unique_key_or_url, unique_value=None):
     1. JSON mode: delete_entry_from_file(file_path, 'member_link', 'https://...')
     2. Plain URL mode: delete_entry_from_file(file_path, 'https://...')
     
+    按索引找到条目所在的行原地清空并记录墓碑，不再重写整个文件；墓碑积累多了在后台压缩
+    _links.txt 文件每行一个链接，JSON模式下也按整行匹配；其他文件中不是JSON的行在JSON模式下同样按整行匹配
+    
     :param file_path: 文件路径
     :param unique_key_or_url: 用于识别条目的键名 (JSON模式) 或直接是要删除的URL (纯URL模式)
     :param unique_value: 要删除的条目的值 (JSON模式), None表示纯URL模式
     :return: True 如果删除成功, False 如果失败
     """
-    import time
-    max_retries = 3
-    retry_delay = 0.5
-    
-    for attempt in range(max_retries):
-        try:
-            file_path = abspath(file_path)
-            if not os.path.exists(file_path):
-                log.warning(f"File not found: {file_path}")
-                return False
-            
-            # Determine mode: JSON or plain URL
-            is_plain_url_mode = unique_value is None
-            if is_plain_url_mode:
-                target_url = unique_key_or_url.strip()
-            else:
-                unique_key = unique_key_or_url
-                target_value = unique_value
-            
-            # 创建临时文件 with thread-safe naming
-            import threading
-            thread_id = threading.current_thread().ident or 0
-            split_index = file_path.rfind('.')
-            temp_file = file_path[:split_index] + f'_temp_{thread_id}' + file_path[split_index:]
-            
-            deleted = False
-            with codecs.open(file_path, 'r', encoding='utf-8') as fi, \
-                    codecs.open(temp_file, 'w', encoding='utf-8') as fo:
-                for line in fi:
-                    line_stripped = line.strip()
-                    if not line_stripped:
-                        continue
-                    
-                    # Try JSON parsing first
-                    try:
-                        dictobj = json.loads(line_stripped)
-                        # JSON mode
-                        if not is_plain_url_mode and dictobj.get(unique_key) == target_value:
-                            deleted = True
-                            log.info(f"Deleted entry: {target_value} from {file_path}")
-                            continue  # 跳过这行，不写入新文件
-                        fo.write(line)
-                    except json.JSONDecodeError:
-                        # Line is not JSON - could be plain URL
-                        # Check if it matches our target (either in plain URL mode or JSON mode with URL value)
-                        if is_plain_url_mode and line_stripped == target_url:
-                            deleted = True
-                            log.info(f"Deleted entry (plain URL mode): {target_url} from {file_path}")
-                            continue  # 跳过这行，不写入新文件
-                        elif not is_plain_url_mode and line_stripped == target_value:
-                            # JSON mode but file contains plain URLs - still delete if URL matches
-                            deleted = True
-                            log.info(f"Deleted entry (URL in JSON mode): {target_value} from {file_path}")
-                            continue  # 跳过这行，不写入新文件
-                        fo.write(line)
-            
-            # 替换原文件 - use os.replace for atomic operation
-            try:
-                os.replace(temp_file, file_path)
-            except PermissionError:
-                # On Windows, sometimes need to remove first
-                os.remove(file_path)
-                os.rename(temp_file, file_path)
-            
-            return deleted
-        except PermissionError as e:
-            if attempt < max_retries - 1:
-                log.warning(f"File locked, retry {attempt + 1}/{max_retries}: {file_path}")
-                time.sleep(retry_delay * (attempt + 1))  # Exponential backoff
-                continue
-            log.error(f"Permission denied after {max_retries} attempts: {file_path}")
-            # Clean up temp file if it exists
-            if 'temp_file' in locals() and os.path.exists(temp_file):
-                try:
-                    os.remove(temp_file)
-                except:
-                    pass
-            return False
-        except Exception as e:
-            log.error(f"Error deleting entry from file: {e}")
-            # Clean up temp file if it exists
-            if 'temp_file' in locals() and os.path.exists(temp_file):
-                try:
-                    os.remove(temp_file)
-                except:
-                    pass
-            return False
-    
-    return False  # All retries exhausted
+    if unique_value is None:
+        return delete_entries_batch(file_path, LINE_KEY, [unique_key_or_url.strip()]) > 0
+    return delete_entries_batch(file_path, unique_key_or_url, [unique_value]) > 0
 
 
 def cleanup_temp_files(directory=None):
@@ -2972,43 +2828,39 @@ def delete_entries_batch(file_path, unique_key, unique_values):
     Batch delete processed entries from a file
     
     :param file_path: 文件路径
-    :param unique_key: 用于识别条目的键名
+    :param unique_key: 用于识别条目的键名，LINE_KEY 表示每行一个链接
     :param unique_values: 要删除的条目值列表
     :return: 删除的条目数量
     """
-    try:
-        file_path = abspath(file_path)
-        if not os.path.exists(file_path):
-            log.warning(f"File not found: {file_path}")
-            return 0
-        
-        values_set = set(unique_values)
-        split_index = file_path.rfind('.')
-        temp_file = file_path[:split_index] + '_temp' + file_path[split_index:]
-        
-        deleted_count = 0
-        with codecs.open(file_path, 'r', encoding='utf-8') as fi, \
-                codecs.open(temp_file, 'w', encoding='utf-8') as fo:
-            for line in fi:
-                if not line.strip():
-                    continue
-                try:
-                    dictobj = json.loads(line)
-                    if dictobj.get(unique_key) in values_set:
-                        deleted_count += 1
-                        continue
-                    fo.write(line)
-                except json.JSONDecodeError:
-                    fo.write(line)
-        
-        os.remove(file_path)
-        os.rename(temp_file, file_path)
-        
-        log.info(f"Batch deleted {deleted_count} entries from {file_path}")
-        return deleted_count
-    except Exception as e:
-        log.error(f"Error batch deleting entries: {e}")
+    import time
+    max_retries = 3
+    retry_delay = 0.5
+    
+    file_path = abspath(file_path)
+    if not os.path.exists(file_path):
+        log.warning(f"File not found: {file_path}")
         return 0
+    
+    if file_path.endswith('_links.txt'):
+        unique_key = LINE_KEY
+    
+    for attempt in range(max_retries):
+        try:
+            deleted_count = get_store(file_path).delete(unique_values, unique_key)
+            if deleted_count:
+                log.info(f"Deleted {deleted_count} entries from {file_path}")
+            return deleted_count
+        except PermissionError:
+            if attempt < max_retries - 1:
+                log.warning(f"File locked, retry {attempt + 1}/{max_retries}: {file_path}")
+                time.sleep(retry_delay * (attempt + 1))  # Exponential backoff
+                continue
+            log.error(f"Permission denied after {max_retries} attempts: {file_path}")
+        except Exception as e:
+            log.error(f"Error deleting entries from file: {e}")
+            break
+    
+    return 0
 
 
 def export_clean_links(source_file, target_file=None, link_key='member_link'):
@@ -3058,13 +2910,15 @@ def export_clean_links(source_file, target_file=None, link_key='member_link'):
         return 0
 
 
-def export_all_member_links(member_dir='./fb/member/', output_file='./member_links.txt'):
+def export_all_member_links(member_dir='./fb/member/', output_file='./member_links.txt', workers=1, use_bloom=None):
     """
     从所有成员文件导出干净的链接列表到单个文件
     Export all member links from member directory to a single file
     
     :param member_dir: 成员文件目录
     :param output_file: 输出文件路径
+    :param workers: 解析文件的进程数
+    :param use_bloom: 是否用磁盘上的布隆过滤器去重，None时按数据量自动选择
     :return: 导出的链接总数
     """
     try:
@@ -3075,31 +2929,16 @@ def export_all_member_links(member_dir='./fb/member/', output_file='./member_lin
             log.warning(f"Member directory not found: {member_dir}")
             return 0
         
-        all_links = []
         files = glob.glob(member_dir + '/*.txt') + glob.glob(member_dir + '\\*.txt')
+        files = sorted(f for f in files if '_links' not in f)  # Skip already exported link files
         
-        for file_path in files:
-            if '_links' in file_path:  # Skip already exported link files
-                continue
-            with codecs.open(file_path, 'r', encoding='utf-8') as fi:
-                for line in fi:
-                    if not line.strip():
-                        continue
-                    try:
-                        dictobj = json.loads(line)
-                        link = dictobj.get('member_link')
-                        if link and link not in all_links:
-                            all_links.append(link)
-                    except json.JSONDecodeError:
-                        continue
-        
-        # Write all links to output file
-        with codecs.open(output_file, 'w', encoding='utf-8') as fo:
-            for link in all_links:
-                fo.write(link + '\n')
+        # 边读边写出，按链接去重
+        stats = consolidate(files, links_file=output_file, unique_key='member_link',
+                            workers=workers, use_bloom=use_bloom)
         
-        log.info(f"Exported {len(all_links)} unique member links to {output_file}")
-        return len(all_links)
+        log.info(f"Exported {stats['unique']} unique member links to {output_file} "
+                 f"({stats['lines']} lines, {stats['lines_per_second']:.0f} lines/s)")
+        return stats['unique']
     except Exception as e:
         log.error(f"Error exporting all member links: {e}")
         return 0
@@ -3120,7 +2959,8 @@ def save_clean_link(file_path, link):
         if not os.path.isdir(file_dir):
             os.makedirs(file_dir)
         
-        with codecs.open(file_path, 'a+', encoding='utf-8') as f:
+        # 持有store的锁追加，避免后台压缩重写文件时丢失数据
+        with get_store(file_path).lock, codecs.open(file_path, 'a+', encoding='utf-8') as f:
             f.write(link + '\n')
     except Exception as e:
         log.error(f"Error saving clean link: {e}")
@@ -3170,13 +3010,16 @@ def extract_user_name_from_url(url):
         return None
 
 
-def create_consolidated_member_file(member_dir='./fb/member/', output_file='./fb/member/all_members.txt'):
+def create_consolidated_member_file(member_dir='./fb/member/', output_file='./fb/member/all_members.txt',
+                                    workers=1, use_bloom=None):
     """
     将所有成员文件合并为一个统一的文件
     Consolidate all member files into a single file
     
     :param member_dir: 成员文件目录
     :param output_file: 输出文件路径
+    :param workers: 解析文件的进程数
+    :param use_bloom: 是否用磁盘上的布隆过滤器去重，None时按数据量自动选择
     :return: 合并的成员总数
     """
     try:
@@ -3187,45 +3030,18 @@ def create_consolidated_member_file(member_dir='./fb/member/', output_file='./fb
             log.warning(f"Member directory not found: {member_dir}")
             return 0
         
-        all_members = []
-        seen_links = set()  # Deduplication
         files = glob.glob(member_dir + '/*.txt') + glob.glob(member_dir + '\\*.txt')
+        # Skip already consolidated files and link files
+        files = sorted(f for f in files if 'all_members' not in f and '_links' not in f)
         
-        for file_path in files:
-            # Skip already consolidated files and link files
-            if 'all_members' in file_path or '_links' in file_path:
-                continue
-            
-            with codecs.open(file_path, 'r', encoding='utf-8') as fi:
-                for line in fi:
-                    if not line.strip():
-                        continue
-                    try:
-                        dictobj = json.loads(line)
-                        link = dictobj.get('member_link')
-                        
-                        # Deduplication based on member_link
-                        if link and link not in seen_links:
-                            seen_links.add(link)
-                            all_members.append(line)
-                    except json.JSONDecodeError:
-                        continue
-        
-        # Write all members to output file
-        with codecs.open(output_file, 'w', encoding='utf-8') as fo:
-            for member in all_members:
-                if not member.endswith('\n'):
-                    member += '\n'
-                fo.write(member)
-        
-        # Also create a _links.txt version for convenience
+        # 边读边写出，同时生成 _links.txt 版本
         links_file = output_file.replace('.txt', '_links.txt')
-        with codecs.open(links_file, 'w', encoding='utf-8') as fo:
-            for link in seen_links:
-                fo.write(link + '\n')
+        stats = consolidate(files, output_file=output_file, links_file=links_file, unique_key='member_link',
+                            workers=workers, use_bloom=use_bloom)
         
-        log.info(f"Consolidated {len(all_members)} unique members to {output_file}")
-        return len(all_members)
+        log.info(f"Consolidated {stats['unique']} unique members to {output_file} "
+                 f"({stats['lines']} lines, {stats['lines_per_second']:.0f} lines/s)")
+        return stats['unique']
     except Exception as e:
         log.error(f"Error creating consolidated member file: {e}")
         return 0
@@ -0,0 +1,149 @@
+# -*- coding: utf-8 -*-
+"""
+---------
+@summary: 界面消息总线，tools.send_message_to_ui 通过它把消息显示到各线程的 QTextBrowser
+          1. 每个线程只查找一次自己的 QTextBrowser
+          2. 消息先进入队列，连续重复的消息合并为一条
+          3. 后台线程按固定帧率把每个 QTextBrowser 积压的消息合成一次信号发送，积压超过上限时丢弃最早的消息
+---------
+"""
+
+import collections
+import threading
+import time
+
+import pyside2_compat
+from PySide2.QtWidgets import QTextBrowser
+
+from autoads.log import log
+
+FRAME_INTERVAL = 0.1  # 每个 QTextBrowser 最多每0.1秒刷新一次
+MAX_BACKLOG = 200  # 每个 QTextBrowser 最多积压的消息条数
+
+# 与界面 print_to_tui 的时间格式一致，合并发送时第二条起的消息自带时间
+TIME_PREFIX = '<font color="#66CC00">{}</font><font color="#CD0000"> | </font>'
+
+
+class _Backlog:
+    __slots__ = ("ms", "browser", "messages", "dropped")
+
+    def __init__(self, ms, browser):
+        self.ms = ms
+        self.browser = browser
+        self.messages = collections.deque()  # [消息, 重复次数, 时间]
+        self.dropped = 0
+
+    def render(self):
+        lines = []
+        if self.dropped:
+            lines.append(f'<font color="#999999">界面消息过多，省略了{self.dropped}条</font>')
+        for message, count, created in self.messages:
+            if count > 1:
+                message = f'{message} <font color="#999999">(×{count})</font>'
+            if lines:
+                message = TIME_PREFIX.format(time.strftime('%H:%M:%S', time.localtime(created))) + message
+            lines.append(message)
+        return '<br>'.join(lines)
+
+
+class UiMessageBus:
+    def __init__(self, frame_interval=FRAME_INTERVAL, max_backlog=MAX_BACKLOG):
+        self.frame_interval = frame_interval
+        self.max_backlog = max_backlog
+        self._local = threading.local()  # 每个线程缓存 (ui, QTextBrowser)
+        self._condition = threading.Condition()
+        self._backlogs = {}  # id(QTextBrowser): _Backlog
+        self._thread = None
+        self._emitting = False
+        self._stats = {
+            "messages": 0,  # send收到的消息数
+            "merged": 0,  # 与上一条相同被合并的消息数
+            "dropped": 0,  # 积压超过上限被丢弃的消息数
+            "signals": 0,  # 实际发送到界面的信号数
+            "lookups": 0,  # findChildren 查找次数
+        }
+
+    def find_browser(self, ui):
+        """
+        当前线程的 QTextBrowser，找到后缓存在线程中
+        """
+        local = self._local
+        if getattr(local, "ui", None) is ui:
+            return local.browser
+
+        thread = threading.current_thread()
+        self._stats["lookups"] += 1
+        text_browsers = ui.findChildren(QTextBrowser, thread.name)
+        if len(text_browsers) == 0:
+            text_browsers = ui.findChildren(QTextBrowser, 'textBrowser' + thread.__class__.__name__)
+        if len(text_browsers) == 0:
+            return None  # 还没有分配 QTextBrowser，下次再找
+
+        local.ui = ui
+        local.browser = text_browsers[0]
+        return local.browser
+
+    def send(self, ms, ui, message):
+        browser = self.find_browser(ui)
+        if browser is None:
+            return
+
+        with self._condition:
+            self._stats["messages"] += 1
+            backlog = self._backlogs.get(id(browser))
+            if backlog is None:
+                backlog = self._backlogs[id(browser)] = _Backlog(ms, browser)
+
+            messages = backlog.messages
+            if messages and messages[-1][0] == message:
+                messages[-1][1] += 1
+                self._stats["merged"] += 1
+            else:
+                if len(messages) >= self.max_backlog:
+                    messages.popleft()
+                    backlog.dropped += 1
+                    self._stats["dropped"] += 1
+                messages.append([message, 1, time.time()])
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="ui_message_bus", daemon=True)
+                self._thread.start()
+            self._condition.notify_all()
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._backlogs:
+                    self._condition.wait()
+                backlogs, self._backlogs = self._backlogs, {}
+                self._emitting = True
+
+            for backlog in backlogs.values():
+                try:
+                    backlog.ms.text_print.emit(backlog.browser, backlog.render())
+                    self._stats["signals"] += 1
+                except Exception as e:
+                    log.debug(f"send message to ui failed: {e}")
+
+            with self._condition:
+                self._emitting = False
+                self._condition.notify_all()
+
+            # 限制刷新帧率，这段时间内的消息在下一帧合并发送
+            time.sleep(self.frame_interval)
+
+    def flush(self, timeout=5):
+        """
+        等待积压的消息发送到界面
+        """
+        with self._condition:
+            return self._condition.wait_for(lambda: not self._backlogs and not self._emitting, timeout)
+
+    def get_stats(self):
+        with self._condition:
+            stats = dict(self._stats)
+            stats["pending"] = sum(len(backlog.messages) for backlog in self._backlogs.values())
+        return stats
+
+
+ui_message_bus = UiMessageBus()
@@ -378,7 +378,6 @@ class WebDriverPool:
         self.queue_chrome = {}  # 给每个chrome浏览器配置位置和大小
         self.queue_size_param = MemoryDB()
         self.queue_expried_ads = []
-        self.queue_drop_res = {}
         
         # Check browser type and get appropriate service URL
         self.browser_type = getattr(config, 'browser_type', 'adspower') if hasattr(config, 'browser_type') else 'adspower'
@@ -513,29 +512,6 @@ class WebDriverPool:
     def expried(self, ads_id):
         return ads_id in self.queue_expried_ads
 
-    def get_drop_res(self, ads_id):
-        with self.lock:
-            if ads_id and ads_id in self.queue_drop_res:
-                res_list = self.queue_drop_res[ads_id]
-                if len(res_list) > 0:
-                    res = res_list.pop(-1)
-                    return res
-                    # self.queue_drop_res[ads_id]=res_list
-
-            return None
-
-    def add_drop_res(self, res):
-        with self.lock:
-            ads_id = res.ads_id
-            if ads_id and res:
-                if ads_id not in self.queue_drop_res:
-                    self.queue_drop_res[ads_id] = []
-
-                if res not in self.queue_drop_res[ads_id]:
-                    self.queue_drop_res[ads_id].append(res)
-
-            log.info(self.queue_drop_res)
-
     def remove(self, ads_id, pre_remove=None, force_close=False):
         """
         Remove browser from pool
@@ -0,0 +1,217 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Consolidation Benchmark
+Measures create_consolidated_member_file / export_all_member_links / unique_member throughput
+on a generated member corpus
+
+Usage:
+    python benchmark_consolidate.py                     # 1M lines in 2000 group files
+    python benchmark_consolidate.py --lines 100000 --files 200 --workers 4
+"""
+
+import argparse
+import codecs
+import glob
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Set up paths
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+from autoads.config import config
+config.name = 'config.ini'
+
+from autoads import tools
+
+LEGACY_EXPORT_LIMIT = 50000  # 改动前的导出是O(n²)，超过该行数不再测量
+
+
+def make_corpus(lines, files):
+    """每个群组文件中一半成员与其他群组重复"""
+    member_dir = tempfile.mkdtemp()
+    per_file = lines // files
+    for group in range(files):
+        with open(os.path.join(member_dir, f'group{group}.txt'), 'w', encoding='utf-8') as f:
+            for i in range(per_file):
+                member_id = group * per_file // 2 + i
+                f.write(json.dumps({
+                    'group_name': f'测试群组{group}',
+                    'group_link': f'https://www.facebook.com/groups/{group}',
+                    'member_name': f'成员{member_id}',
+                    'member_link': f'https://www.facebook.com/profile.php?id={100000 + member_id}',
+                    'role_type': 'member',
+                    'ads_id': 'k1abc',
+                    'status': 'init',
+                }, ensure_ascii=False) + '\n')
+    return member_dir
+
+
+def legacy_consolidate(member_dir, output_file):
+    """
+    改动前的 create_consolidated_member_file：所有行读入内存后再写出
+    """
+    all_members = []
+    seen_links = set()
+    for file_path in glob.glob(member_dir + '/*.txt'):
+        if 'all_members' in file_path or '_links' in file_path:
+            continue
+        with codecs.open(file_path, 'r', encoding='utf-8') as fi:
+            for line in fi:
+                if not line.strip():
+                    continue
+                link = json.loads(line).get('member_link')
+                if link and link not in seen_links:
+                    seen_links.add(link)
+                    all_members.append(line)
+    with codecs.open(output_file, 'w', encoding='utf-8') as fo:
+        fo.writelines(all_members)
+    with codecs.open(output_file.replace('.txt', '_links.txt'), 'w', encoding='utf-8') as fo:
+        for link in seen_links:
+            fo.write(link + '\n')
+    return len(all_members)
+
+
+def legacy_export(member_dir, output_file):
+    """
+    改动前的 export_all_member_links：在list中查重
+    """
+    all_links = []
+    for file_path in glob.glob(member_dir + '/*.txt'):
+        if '_links' in file_path:
+            continue
+        with codecs.open(file_path, 'r', encoding='utf-8') as fi:
+            for line in fi:
+                if not line.strip():
+                    continue
+                link = json.loads(line).get('member_link')
+                if link and link not in all_links:
+                    all_links.append(link)
+    with codecs.open(output_file, 'w', encoding='utf-8') as fo:
+        for link in all_links:
+            fo.write(link + '\n')
+    return len(all_links)
+
+
+def legacy_unique(member_dir, unique_key='member_link'):
+    """
+    改动前的 unique_member：每次重写所有文件，全局set中存完整的标识
+    """
+    all_seen = set()
+    total_kept = 0
+    for file_path in glob.glob(os.path.join(member_dir, '*.txt')):
+        temp_file = file_path[:-4] + '_temp_dedup.txt'
+        with codecs.open(file_path, 'r', encoding='utf-8') as fi, codecs.open(temp_file, 'w', encoding='utf-8') as fo:
+            for line in fi:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    identifier = json.loads(line).get(unique_key, line)
+                except json.JSONDecodeError:
+                    identifier = line
+                if identifier not in all_seen:
+                    all_seen.add(identifier)
+                    fo.write(line + '\n')
+                    total_kept += 1
+        os.remove(file_path)
+        os.rename(temp_file, file_path)
+    return total_kept
+
+
+def append_members(member_dir, count):
+    """模拟采集到新成员：追加到一个群组文件"""
+    with open(os.path.join(member_dir, 'group0.txt'), 'a', encoding='utf-8') as f:
+        for i in range(count):
+            f.write(json.dumps({'member_link': f'https://www.facebook.com/profile.php?id=new{i}'}) + '\n')
+
+
+def bench_unique(member_dir, lines, workers):
+    for engine, func, kwargs in [
+        ('legacy', legacy_unique, {}),
+        ('full', tools.unique_member, {'unique_key': 'member_link'}),
+        (f'full {workers} workers', tools.unique_member, {'unique_key': 'member_link', 'workers': workers}),
+    ]:
+        work_dir = tempfile.mkdtemp()
+        try:
+            for name in os.listdir(member_dir):
+                shutil.copy(os.path.join(member_dir, name), work_dir)
+            unique, seconds = timed(func, work_dir, **kwargs)
+            print_row('unique', engine, f"{unique:,}", f"{seconds:.2f}", f"{lines / seconds:,.0f}")
+        finally:
+            shutil.rmtree(work_dir)
+
+    work_dir = tempfile.mkdtemp()
+    try:
+        for name in os.listdir(member_dir):
+            shutil.copy(os.path.join(member_dir, name), work_dir)
+        unique, seconds = timed(tools.unique_member, work_dir, 'member_link', incremental=True)
+        print_row('unique', 'incr. first run', f"{unique:,}", f"{seconds:.2f}", f"{lines / seconds:,.0f}")
+        append_members(work_dir, 1000)
+        unique, seconds = timed(tools.unique_member, work_dir, 'member_link', incremental=True)
+        print_row('unique', 'incr. +1000 lines', f"{unique:,}", f"{seconds:.3f}", "-")
+    finally:
+        shutil.rmtree(work_dir)
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return result, time.perf_counter() - started
+
+
+def print_row(*columns):
+    print("  " + "".join(f"{column:>18}" for column in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--lines', type=int, default=1000000)
+    parser.add_argument('--files', type=int, default=2000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 2)
+    args = parser.parse_args()
+
+    member_dir = make_corpus(args.lines, args.files)
+    output_dir = tempfile.mkdtemp()
+    try:
+        output_file = os.path.join(output_dir, 'all_members.txt')
+        links_file = os.path.join(output_dir, 'member_links.txt')
+
+        print("=" * 80)
+        print(f"📊 Consolidation Benchmark - {args.lines:,} lines in {args.files:,} files")
+        print("=" * 80)
+        print_row("action", "engine", "unique", "seconds", "lines/s")
+
+        runs = [
+            ('consolidate', 'legacy', legacy_consolidate, {}),
+            ('consolidate', 'hash set', tools.create_consolidated_member_file, {'use_bloom': False}),
+            ('consolidate', 'bloom', tools.create_consolidated_member_file, {'use_bloom': True}),
+            ('consolidate', f'{args.workers} workers', tools.create_consolidated_member_file,
+             {'use_bloom': False, 'workers': args.workers}),
+            ('export', 'legacy', legacy_export, {}),
+            ('export', 'hash set', tools.export_all_member_links, {'use_bloom': False}),
+            ('export', 'bloom', tools.export_all_member_links, {'use_bloom': True}),
+            ('export', f'{args.workers} workers', tools.export_all_member_links,
+             {'use_bloom': False, 'workers': args.workers}),
+        ]
+        for action, engine, func, kwargs in runs:
+            if func is legacy_export and args.lines > LEGACY_EXPORT_LIMIT:
+                print_row(action, engine, "-", "skipped (O(n²))", "-")
+                continue
+            unique, seconds = timed(func, member_dir, output_file if action == 'consolidate' else links_file,
+                                    **kwargs)
+            print_row(action, engine, f"{unique:,}", f"{seconds:.2f}", f"{args.lines / seconds:,.0f}")
+
+        bench_unique(member_dir, args.lines, args.workers)
+    finally:
+        shutil.rmtree(member_dir)
+        shutil.rmtree(output_dir)
+
+
+if __name__ == '__main__':
+    main()
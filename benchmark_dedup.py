@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Dedup Benchmark
+Measures keys/sec of the bloom filter used by ItemBuffer.dedup
+
+Usage:
+    python benchmark_dedup.py                 # 1k, 100k, 1M fingerprints
+    python benchmark_dedup.py --sizes 1000 100000
+    python benchmark_dedup.py --sizes 1000 --batch-sizes 1000 10000 --duplicate-ratio 0.3
+    python benchmark_dedup.py --sizes 1000 --capacities 10000000
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Set up paths
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+from autoads.config import config
+config.name = 'config.ini'
+
+from autoads.tools import get_md5
+from autoads.dedup import Dedup
+from autoads.dedup.bloomfilter import BloomFilter, ScalableBloomFilter
+
+BATCH_SIZE = 1000  # 与 ItemBuffer 的 UPLOAD_BATCH_MAX_SIZE 一致
+
+
+def make_fingerprints(count, prefix='member'):
+    return [get_md5(f'https://www.facebook.com/{prefix}/{i}') for i in range(count)]
+
+
+def batches(keys, size=BATCH_SIZE):
+    for i in range(0, len(keys), size):
+        yield keys[i:i + size]
+
+
+def bench_hash_and_bits(fingerprints, vectorized):
+    """
+    ItemBuffer.flush 的热点：ScalableBloomFilter 内部 BloomFilter 的 get + add(skip_check)
+    """
+    default_vectorized = BloomFilter.vectorized
+    BloomFilter.vectorized = vectorized
+    try:
+        sbf = ScalableBloomFilter(name='benchmark', initial_capacity=10000000)
+        sbf.check_filter_capacity()
+        current_filter = sbf.filters[-1]
+
+        started = time.perf_counter()
+        for batch in batches(fingerprints):
+            current_filter.get(batch, to_list=True)
+            sbf.add(batch, skip_check=True)
+        elapsed = time.perf_counter() - started
+    finally:
+        BloomFilter.vectorized = default_vectorized
+
+    return len(fingerprints) * 2 / elapsed
+
+
+def make_flush_batches(batch_size, batch_count, duplicate_ratio):
+    """
+    模拟采集时的批次：一部分是之前批次已入库的数据，一部分是同一批次内的重复数据
+    """
+    random.seed(batch_size)
+    seen = []
+    result = []
+    next_id = 0
+    for _ in range(batch_count):
+        batch = []
+        for _ in range(batch_size):
+            roll = random.random()
+            if roll < duplicate_ratio / 2 and seen:
+                batch.append(random.choice(seen))  # 之前批次出现过
+            elif roll < duplicate_ratio and batch:
+                batch.append(random.choice(batch))  # 同批次内重复
+            else:
+                batch.append(get_md5(f'https://www.facebook.com/member/{next_id}'))
+                next_id += 1
+        seen.extend(batch)
+        result.append(batch)
+    return result
+
+
+def bench_flush(batch_size, batch_count=20, duplicate_ratio=0.3):
+    """
+    ScalableBloomFilter.get / add 整体耗时（包含把检查结果映射回每个key）
+    """
+    flush_batches = make_flush_batches(batch_size, batch_count, duplicate_ratio)
+
+    dedup = Dedup(to_md5=False, name='benchmark')
+    get_elapsed = 0
+    started = time.perf_counter()
+    for batch in flush_batches:
+        get_started = time.perf_counter()
+        dedup.get(batch)
+        get_elapsed += time.perf_counter() - get_started
+        dedup.add(batch)
+    elapsed = time.perf_counter() - started
+
+    return get_elapsed / batch_count * 1000, (elapsed - get_elapsed) / batch_count * 1000
+
+
+def bench_startup(initial_capacity, item_count, **kwargs):
+    """
+    创建去重过滤器并写入少量数据（短任务）的耗时及内存
+    @return: 创建ms, 首次写入ms, 写入后占用内存MB
+    """
+    fingerprints = make_fingerprints(item_count)
+
+    tracemalloc.start()
+    try:
+        started = time.perf_counter()
+        dedup = Dedup(to_md5=False, initial_capacity=initial_capacity, **kwargs)
+        create_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        dedup.get(fingerprints)
+        dedup.add(fingerprints)
+        first_add_ms = (time.perf_counter() - started) * 1000
+
+        memory_mb = tracemalloc.get_traced_memory()[0] / 1024 / 1024
+    finally:
+        tracemalloc.stop()
+
+    dedup.close()
+    return create_ms, first_add_ms, memory_mb
+
+
+def bench_open(capacity):
+    """
+    已有快照时打开mmap过滤器的耗时：只映射文件，不分配和清零
+    """
+    with tempfile.TemporaryDirectory() as path:
+        kwargs = dict(to_md5=False, initial_capacity=capacity, bitarray_type=ScalableBloomFilter.BASE_MMAP, path=path)
+
+        dedup = Dedup(**kwargs)
+        started = time.perf_counter()
+        dedup.get('open')
+        create_ms = (time.perf_counter() - started) * 1000
+        dedup.add(make_fingerprints(10000))
+        dedup.close()
+
+        dedup = Dedup(**kwargs)
+        started = time.perf_counter()
+        dedup.get('open')
+        reopen_ms = (time.perf_counter() - started) * 1000
+        dedup.close()
+
+    return create_ms, reopen_ms
+
+
+def print_row(*columns):
+    print("  " + "".join(f"{column:>18}" for column in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 100000, 1000000])
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1000, 10000])
+    parser.add_argument('--duplicate-ratio', type=float, default=0.3)
+    parser.add_argument('--capacities', type=int, nargs='+', default=[1000000, 10000000])
+    parser.add_argument('--startup-items', type=int, default=500)
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("📊 Dedup Benchmark - bloom filter hashing and bit access (keys/sec)")
+    print("=" * 80)
+    print_row("fingerprints", "python keys/s", "numpy keys/s", "speedup")
+
+    for size in args.sizes:
+        fingerprints = make_fingerprints(size)
+        python_rate = bench_hash_and_bits(fingerprints, vectorized=False)
+        numpy_rate = bench_hash_and_bits(fingerprints, vectorized=True)
+        print_row(f"{size:,}", f"{python_rate:,.0f}", f"{numpy_rate:,.0f}", f"{numpy_rate / python_rate:.2f}x")
+
+    print()
+    print("=" * 80)
+    print(f"📊 Dedup Benchmark - ScalableBloomFilter get/add per batch ({args.duplicate_ratio:.0%} duplicates)")
+    print("=" * 80)
+    print_row("batch size", "get ms/batch", "add ms/batch")
+
+    for batch_size in args.batch_sizes:
+        get_ms, add_ms = bench_flush(batch_size, duplicate_ratio=args.duplicate_ratio)
+        print_row(f"{batch_size:,}", f"{get_ms:.2f}", f"{add_ms:.2f}")
+
+    print()
+    print("=" * 80)
+    print("📊 Dedup Benchmark - mmap snapshot open time (ms)")
+    print("=" * 80)
+    print_row("capacity", "mmap create", "mmap reopen")
+
+    for capacity in args.capacities:
+        create_ms, reopen_ms = bench_open(capacity)
+        print_row(f"{capacity:,}", f"{create_ms:.2f}", f"{reopen_ms:.2f}")
+
+    print()
+    print("=" * 80)
+    print(f"📊 Dedup Benchmark - startup with {args.startup_items:,} items (short job)")
+    print("=" * 80)
+    print_row("filter", "create ms", "first add ms", "memory MB")
+
+    for label, initial_capacity in (("eager 10M", 10000000), ("lazy 100k x4", 100000)):
+        create_ms, first_add_ms, memory_mb = bench_startup(initial_capacity, args.startup_items)
+        print_row(label, f"{create_ms:.2f}", f"{first_add_ms:.2f}", f"{memory_mb:.2f}")
+
+
+if __name__ == '__main__':
+    main()
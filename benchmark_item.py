@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Item Benchmark
+Measures construction, memory per item, to_dict, fingerprint and ItemBuffer flush of the slotted
+MemberItem / GroupItem against the previous __dict__ based, uncached implementation
+(flush uses a pipeline that discards the data, so only the item handling is measured)
+
+Usage:
+    python benchmark_item.py                  # 100k items
+    python benchmark_item.py --items 500000
+"""
+
+import argparse
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+# Set up paths
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+from autoads.config import config
+config.name = 'config.ini'
+
+from autoads import tools
+from autoads.dedup import Dedup
+from autoads.item import Item
+from autoads.item_buffer import ItemBuffer
+from autoads.items.group_item import GroupItem
+from autoads.items.member_item import MemberItem
+from autoads.log import log
+from autoads.pipelines import BasePipeline
+
+
+class LegacyMemberItem(Item):
+    """
+    改动前的 MemberItem：字段在 __dict__ 中，每个成员一个unique_key列表
+    """
+    __table_name__ = MemberItem.__table_name__
+    __update_key__ = ('status',)
+
+    def __init__(self):
+        self.group_name = None
+        self.group_link = None
+        self.member_name = None
+        self.member_link = None
+        self.unique_key = ['member_link']
+        self.role_type = None
+        self.ads_id = None
+        self.priority = 300
+        self.status = 'init'
+
+
+class LegacyGroupItem(Item):
+    """
+    改动前的 GroupItem
+    """
+    __table_name__ = GroupItem.__table_name__
+    __update_key__ = ('status', 'last_apply_time', 'apply_nums')
+
+    def __init__(self):
+        self.word = None
+        self.group_name = None
+        self.group_link = None
+        self.unique_key = ('group_link',)
+        self.ads_id = None
+        self.create_time = None
+        self.last_apply_time = ''
+        self.apply_nums = 0
+        self.status = 'unknown'
+        self.priority = 300
+
+
+class DiscardPipeline(BasePipeline):
+    def save_items(self, table, items):
+        return True
+
+
+def legacy_to_dict(item):
+    """
+    改动前的 Item.to_dict：每次过滤内部字段并处理私有属性名
+    """
+    propertys = {}
+    for key, value in item.__dict__.items():
+        if key not in (
+                "__name__",
+                "__table_name__",
+                "__name_underline__",
+                "__update_key__",
+                "__unique_key__",
+        ):
+            if key.startswith(f"_{item.__class__.__name__}"):
+                key = key.replace(f"_{item.__class__.__name__}", "")
+            propertys[key] = value
+    return propertys
+
+
+def legacy_fingerprint(item):
+    """
+    改动前的 Item.fingerprint：每次调用都重新计算，对每个字段调用unique_key
+    """
+    args = []
+    for key, value in legacy_to_dict(item).items():
+        if value:
+            if (item.unique_key and key in item.unique_key) or not item.unique_key:
+                args.append(str(value))
+    if args:
+        return tools.get_md5(*sorted(args))
+    return None
+
+
+def make_member(i, cls=MemberItem):
+    item = cls()
+    item.group_name = '测试群组'
+    item.group_link = 'https://www.facebook.com/groups/123456'
+    item.member_name = f'成员{i}'
+    item.member_link = f'https://www.facebook.com/profile.php?id={100000 + i}'
+    item.ads_id = 'k1abc'
+    return item
+
+
+def make_group(i, cls=GroupItem):
+    item = cls()
+    item.word = '测试'
+    item.group_name = f'测试群组{i}'
+    item.group_link = f'https://www.facebook.com/groups/{i}'
+    item.ads_id = 'k1abc'
+    return item
+
+
+def timed(func, items):
+    started = time.perf_counter()
+    result = [func(item) for item in items]
+    return result, time.perf_counter() - started
+
+
+def measure_memory(make, count):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    items = [make(i) for i in range(count)]
+    memory = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del items
+    return memory
+
+
+def bench_flush(make, count):
+    """
+    新建的item经过 ItemBuffer.flush（fingerprint去重、按表分组、to_dict）
+    """
+    items = [make(i) for i in range(count)]
+    ItemBuffer.dedup = Dedup(to_md5=False)
+    buffer = ItemBuffer()
+    buffer._pipelines = [DiscardPipeline()]
+    for item in items:
+        buffer._buffer.append(item)
+    started = time.perf_counter()
+    buffer.flush()
+    seconds = time.perf_counter() - started
+    if buffer._writer_pool:
+        buffer._writer_pool.shutdown()
+    return seconds
+
+
+def print_row(*columns):
+    print("  " + f"{columns[0]:<18}" + "".join(f"{column:>12}" for column in columns[1:]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--items', type=int, default=100000)
+    args = parser.parse_args()
+
+    log.setLevel(logging.WARNING)  # flush中的入库日志不计入
+    print("=" * 80)
+    print(f"📊 Item Benchmark - {args.items:,} items (µs per item)")
+    print("=" * 80)
+    print_row("item", "construct", "bytes/item", "to_dict", "fingerprint", "cached fp", "flush")
+
+    for name, make, legacy_cls in (('MemberItem', make_member, LegacyMemberItem),
+                                   ('GroupItem', make_group, LegacyGroupItem)):
+        legacy_make = lambda i: make(i, legacy_cls)
+        legacy_items, legacy_construct = timed(legacy_make, range(args.items))
+        legacy_dicts, legacy_dict_seconds = timed(legacy_to_dict, legacy_items)
+        legacy_fps, legacy_fp_seconds = timed(legacy_fingerprint, legacy_items)
+
+        items, construct = timed(make, range(args.items))
+        dicts, dict_seconds = timed(lambda item: item.to_dict, items)
+        fps, fp_seconds = timed(lambda item: item.fingerprint, items)
+        _, cached_seconds = timed(lambda item: item.fingerprint, items)
+        assert dicts == legacy_dicts and fps == legacy_fps
+
+        for row, row_make, seconds in ((f'legacy {name}', legacy_make,
+                                        (legacy_construct, legacy_dict_seconds, legacy_fp_seconds, legacy_fp_seconds)),
+                                       (name, make, (construct, dict_seconds, fp_seconds, cached_seconds))):
+            memory = measure_memory(row_make, args.items)
+            flush_seconds = bench_flush(row_make, args.items)
+            per_item = [value * 1e6 / args.items for value in seconds + (flush_seconds,)]
+            print_row(row, f"{per_item[0]:.2f}", f"{memory / args.items:.0f}", *(f"{value:.2f}" for value in per_item[1:]))
+
+if __name__ == '__main__':
+    main()
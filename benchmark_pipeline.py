@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pipeline Benchmark
+Measures FilePipeline.update_items for a single member status update
+and tools.delete_entry_from_file for a single processed member,
+reading member_link/status from JSONL vs the columnar segment store,
+and SqlitePipeline bulk insert / indexed status update
+
+Usage:
+    python benchmark_pipeline.py                  # 10k, 100k, 1M lines
+    python benchmark_pipeline.py --sizes 10000 100000
+"""
+
+import argparse
+import codecs
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+# Set up paths
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+from autoads.config import config
+config.name = 'config.ini'
+
+from autoads import tools
+from autoads.pipelines.file_pipeline import FilePipeline
+from autoads.pipelines.file_store import IndexedFileStore
+from autoads.pipelines.segment_store import get_segment_store, import_jsonl, segment_path
+from autoads.pipelines.sqlite_pipeline import SqlitePipeline
+
+UNIQUE_KEYS = ('member_link',)
+UPDATE_KEYS = ('status',)
+
+
+def make_table(path, count):
+    table = os.path.join(path, 'benchmark_table.txt')
+    with open(table, 'w', encoding='utf-8') as f:
+        for i in range(count):
+            f.write(json.dumps({
+                'group_name': '测试群组',
+                'group_link': 'https://www.facebook.com/groups/123456',
+                'member_name': f'成员{i}',
+                'member_link': f'https://www.facebook.com/profile.php?id={100000 + i}',
+                'role_type': 'member',
+                'ads_id': 'k1abc',
+                'status': 'init',
+            }, ensure_ascii=False) + '\n')
+    return table
+
+
+def full_rewrite_update(table, items, update_keys, unique_keys):
+    """
+    改动前的 update_items：每次把整个表文件重写一遍
+    """
+    unique_key = unique_keys[0]
+    keys = [item.get(unique_key, '') for item in items]
+    new_table = table + '.temp'
+    with codecs.open(table, 'r', encoding='utf-8') as fi, codecs.open(new_table, 'w', encoding='utf-8') as fo:
+        for line in fi:
+            dictobj = json.loads(line)
+            if dictobj.get(unique_key) in keys:
+                item = items[keys.index(dictobj[unique_key])]
+                for uk in update_keys:
+                    dictobj[uk] = item.get(uk, dictobj.get(uk))
+                fo.write(json.dumps(dictobj, ensure_ascii=False) + '\n')
+            else:
+                fo.write(line)
+    os.replace(new_table, table)
+
+
+def status_update(i, status='send'):
+    return [{'member_link': f'https://www.facebook.com/profile.php?id={100000 + i}', 'status': status}]
+
+
+def bench(count, updates=100):
+    path = tempfile.mkdtemp()
+    try:
+        table = make_table(path, count)
+
+        started = time.perf_counter()
+        full_rewrite_update(table, status_update(count // 2), UPDATE_KEYS, UNIQUE_KEYS)
+        rewrite_ms = (time.perf_counter() - started) * 1000
+
+        pipeline = FilePipeline()
+        started = time.perf_counter()
+        pipeline.update_items(table, status_update(0), UPDATE_KEYS, UNIQUE_KEYS)
+        build_ms = (time.perf_counter() - started) * 1000
+
+        # 新的进程：从索引文件加载，不再扫描表文件
+        started = time.perf_counter()
+        IndexedFileStore(table).update(status_update(1), UPDATE_KEYS, UNIQUE_KEYS[0])
+        reopen_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        for i in range(updates):
+            pipeline.update_items(table, status_update(i * (count // updates)), UPDATE_KEYS, UNIQUE_KEYS)
+        update_ms = (time.perf_counter() - started) * 1000 / updates
+
+        # 删除：原地清空并记录墓碑
+        started = time.perf_counter()
+        for i in range(updates):
+            tools.delete_entry_from_file(table, UNIQUE_KEYS[0], status_update(i * (count // updates) + 1)[0]['member_link'])
+        delete_ms = (time.perf_counter() - started) * 1000 / updates
+
+        return rewrite_ms, build_ms, reopen_ms, update_ms, delete_ms
+    finally:
+        shutil.rmtree(path)
+
+
+def bench_segment(count):
+    path = tempfile.mkdtemp()
+    try:
+        table = make_table(path, count)
+        started = time.perf_counter()
+        import_jsonl(table)
+        import_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        with open(table, encoding='utf-8') as f:
+            jsonl_rows = [(row['member_link'], row['status']) for row in map(json.loads, f)]
+        jsonl_ms = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        store = get_segment_store(segment_path(table))
+        segment_rows = [(row['member_link'], row['status']) for row in store.scan(('member_link', 'status'))]
+        projection_ms = (time.perf_counter() - started) * 1000
+        assert segment_rows == jsonl_rows
+
+        size_ratio = os.path.getsize(segment_path(table)) / os.path.getsize(table)
+        return import_ms, jsonl_ms, projection_ms, size_ratio
+    finally:
+        shutil.rmtree(path)
+
+
+def bench_sqlite(count, updates=100, batch_size=1000):
+    path = tempfile.mkdtemp()
+    pipeline = SqlitePipeline()
+    try:
+        table = make_table(path, count)
+        with open(table, encoding='utf-8') as f:
+            rows = [json.loads(line) for line in f]
+
+        pipeline.create_table(table, UNIQUE_KEYS, UPDATE_KEYS)
+        started = time.perf_counter()
+        for i in range(0, count, batch_size):
+            pipeline.save_items(table, rows[i:i + batch_size])
+        insert_rate = count / (time.perf_counter() - started)
+
+        started = time.perf_counter()
+        for i in range(updates):
+            pipeline.update_items(table, status_update(i * (count // updates)), UPDATE_KEYS, UNIQUE_KEYS)
+        update_ms = (time.perf_counter() - started) * 1000 / updates
+
+        # 一批1000条状态更新
+        started = time.perf_counter()
+        pipeline.update_items(table, [status_update(i)[0] for i in range(batch_size)], UPDATE_KEYS, UNIQUE_KEYS)
+        batch_ms = (time.perf_counter() - started) * 1000
+        return insert_rate, update_ms, batch_ms
+    finally:
+        pipeline.close()
+        shutil.rmtree(path)
+
+
+def print_row(*columns):
+    print("  " + "".join(f"{column:>18}" for column in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000])
+    args = parser.parse_args()
+
+    print("=" * 80)
+    print("📊 Pipeline Benchmark - update / delete one member (ms)")
+    print("=" * 80)
+    print_row("lines", "full rewrite", "index build", "index reopen", "indexed update", "tombstone delete")
+
+    for count in args.sizes:
+        rewrite_ms, build_ms, reopen_ms, update_ms, delete_ms = bench(count)
+        print_row(f"{count:,}", f"{rewrite_ms:.2f}", f"{build_ms:.2f}", f"{reopen_ms:.2f}", f"{update_ms:.3f}",
+                  f"{delete_ms:.3f}")
+
+    print()
+    print("📊 Read member_link/status (ms)")
+    print_row("lines", "jsonl import", "jsonl read", "segment read", "size vs jsonl")
+    for count in args.sizes:
+        import_ms, jsonl_ms, projection_ms, size_ratio = bench_segment(count)
+        print_row(f"{count:,}", f"{import_ms:.2f}", f"{jsonl_ms:.2f}", f"{projection_ms:.2f}", f"{size_ratio:.0%}")
+
+    print()
+    print("📊 SqlitePipeline")
+    print_row("lines", "insert rows/s", "update one (ms)", "update 1000 (ms)")
+    for count in args.sizes:
+        insert_rate, update_ms, batch_ms = bench_sqlite(count)
+        print_row(f"{count:,}", f"{insert_rate:,.0f}", f"{update_ms:.3f}", f"{batch_ms:.2f}")
+
+
+if __name__ == '__main__':
+    main()
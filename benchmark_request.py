@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Request Benchmark
+Measures construction cost, memory per request and heap ordering of the slotted Request
+against the previous __dict__ based implementation (groups are built beforehand and not counted)
+
+Usage:
+    python benchmark_request.py                  # 100k requests
+    python benchmark_request.py --requests 500000
+"""
+
+import argparse
+import heapq
+import os
+import sys
+import time
+import tracemalloc
+
+# Set up paths
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+from autoads.config import config
+config.name = 'config.ini'
+
+from autoads.items.group_item import GroupItem
+from autoads.request import Request
+
+
+class LegacyRequest(object):
+    """
+    改动前的 Request：属性在 __dict__ 中，每次赋值经过 __setattr__，每个请求读取一次 member_timeout
+    """
+    __REQUEST_ATTRS__ = Request.__REQUEST_ATTRS__
+
+    def __init__(self, url="", retry_times=0, priority=300, parser_name=None, auto_request=True,
+                 request_sync=False, render=True, render_time=8, ads_id=None, response=None,
+                 driver_count=1, is_drop=False, callback=None, finished_nums=0, stop_event=None, **kwargs):
+        self.url = url
+        self.retry_times = retry_times
+        self.auto_request = auto_request
+        self.render = render
+        self.render_time = render_time
+        self.ads_id = ads_id
+        self.response = response
+        self.parser_name = parser_name
+        self.request_sync = request_sync
+        self.callback = callback
+        self.priority = priority
+        self.finished_nums = finished_nums
+        self.member_timeout = config.member_timeout
+        self.driver_count = driver_count
+        self.is_drop = is_drop
+        self.stop_event = stop_event
+
+        self.requests_kwargs = {}
+        for key, value in kwargs.items():
+            if key in self.__class__.__REQUEST_ATTRS__:
+                self.requests_kwargs[key] = value
+
+            self.__dict__[key] = value
+
+    def __setattr__(self, key, value):
+        self.__dict__[key] = value
+
+        if key in self.__class__.__REQUEST_ATTRS__:
+            self.requests_kwargs[key] = value
+
+    def __lt__(self, other):
+        return self.priority < other.priority
+
+
+def make_groups(count):
+    groups = []
+    for i in range(count):
+        group = GroupItem()
+        group.group_name = f'测试群组{i}'
+        group.group_link = f'https://www.facebook.com/groups/{i}'
+        group.priority = (i % 50) * 10
+        groups.append(group)
+    return groups
+
+
+def construct(cls, groups):
+    return [cls(url=group.group_link + '/members', ads_id=f'k{i % 8}', index=0, priority=group.priority,
+                group=group, driver_count=8, stop_event=None) for i, group in enumerate(groups)]
+
+
+def bench(cls, groups):
+    started = time.perf_counter()
+    construct(cls, groups)
+    construct_seconds = time.perf_counter() - started
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    requests = construct(cls, groups)
+    memory = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    started = time.perf_counter()
+    heap = []
+    for request in requests:
+        heapq.heappush(heap, request)
+    while heap:
+        request = heapq.heappop(heap)
+        request.index = 1
+    heap_seconds = time.perf_counter() - started
+    return construct_seconds, memory, heap_seconds
+
+
+def print_row(*columns):
+    print("  " + "".join(f"{column:>18}" for column in columns))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=100000)
+    args = parser.parse_args()
+
+    groups = make_groups(args.requests)
+
+    print("=" * 80)
+    print(f"📊 Request Benchmark - {args.requests:,} requests carrying a GroupItem")
+    print("=" * 80)
+    print_row("request", "construct µs", "bytes/request", "heap push+pop µs")
+    for name, cls in (('legacy', LegacyRequest), ('slotted', Request)):
+        construct_seconds, memory, heap_seconds = bench(cls, groups)
+        print_row(name, f"{construct_seconds * 1e6 / args.requests:.2f}", f"{memory / args.requests:.0f}",
+                  f"{heap_seconds * 1e6 / args.requests:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -480,7 +480,7 @@ class MainWindow(QMainWindow):
                     # 显示选择结果 - Show selection result to user
                     try:
                         with open(file_name, 'r', encoding='utf-8') as f:
-                            line_count = sum(1 for _ in f)
+                            line_count = sum(1 for line in f if line.strip())
                         base_name = os.path.basename(file_name)
                         QMessageBox.information(self, "文件已选择", 
                             f"✅ 已选择群组文件:\n\n{base_name}\n\n📊 包含 {line_count} 条记录\n\n启动采集成员后将使用此文件")
@@ -559,7 +559,7 @@ class MainWindow(QMainWindow):
                 # 显示选择结果 - Show selection result to user  
                 try:
                     with open(file_name, 'r', encoding='utf-8') as f:
-                        line_count = sum(1 for _ in f)
+                        line_count = sum(1 for line in f if line.strip())
                     base_name = os.path.basename(file_name)
                     QMessageBox.information(self, "文件已选择", 
                         f"✅ 已选择成员文件:\n\n{base_name}\n\n📊 包含 {line_count} 条成员\n\n启动私信后将向这些成员发送消息")
@@ -586,7 +586,7 @@ class MainWindow(QMainWindow):
                     if os.path.exists(text):
                         file_size = os.path.getsize(text)
                         with open(text, 'r', encoding='utf-8') as f:
-                            line_count = sum(1 for _ in f)
+                            line_count = sum(1 for line in f if line.strip())
                         self.statusBar().showMessage(f"📁 已选择: {os.path.basename(text)} ({line_count}条记录, {file_size/1024:.1f}KB)", 5000)
                 except:
                     pass
@@ -609,7 +609,7 @@ class MainWindow(QMainWindow):
                     if os.path.exists(text):
                         file_size = os.path.getsize(text)
                         with open(text, 'r', encoding='utf-8') as f:
-                            line_count = sum(1 for _ in f)
+                            line_count = sum(1 for line in f if line.strip())
                         self.statusBar().showMessage(f"📨 已选择私信文件: {os.path.basename(text)} ({line_count}条成员, {file_size/1024:.1f}KB)", 5000)
                 except:
                     pass
@@ -771,12 +771,14 @@ class MainWindow(QMainWindow):
             try:
                 res = requests.get(url).json()
                 if res['flag'] and res['version'] != config.version:
-                    config.set_option('main', 'version', res['version'])
-                    json_config = res['config']
-                    for key in json_config.keys():
-                        for item in json_config[key]:
-                            for key_item in item.keys():
-                                config.set_option(key, key_item, item[key_item])
+                    # 远程配置一次写入，中途出错不会留下一半新一半旧的配置
+                    with config.transaction():
+                        config.set_option('main', 'version', res['version'])
+                        json_config = res['config']
+                        for key in json_config.keys():
+                            for item in json_config[key]:
+                                for key_item in item.keys():
+                                    config.set_option(key, key_item, item[key_item])
             except Exception as e:
                 log.error(e)
 
@@ -2399,7 +2401,7 @@ class MainWindow(QMainWindow):
         if self.ui.stackedPages.currentIndex() == 2:
             # 执行清理重复成员链接的功能
             def run():
-                tools.unique_member(dir=config.members_table, unique_key='member_link')
+                tools.unique_member(dir=config.members_table, unique_key='member_link', incremental=True)
 
             # 使用单独的线程来做这个清理的事情
             Thread(target=run).start()
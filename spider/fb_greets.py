@@ -119,13 +119,6 @@ class GreetsSpider(autoads.AirSpider):
                     # Skip non-init members (only for JSON-based members)
                     if hasattr(member, 'status') and member.status and member.status != 'init':
                         continue
-                    
-                    # 云端去重复检查 - Cloud deduplication check
-                    if cloud_dedup.enabled and cloud_dedup.is_processed(member.member_link, 'message'):
-                        tools.send_message_to_ui(ms=self.ms, ui=self.ui, 
-                            message=f'跳过已处理成员(云端去重): {member.member_name}')
-                        log.info(f'Skipping already processed member (cloud dedup): {member.member_link}')
-                        continue
 
                     member.priority = (i + 1) * 5
                     request_dict[ads_id].append(member)
@@ -137,6 +130,11 @@ class GreetsSpider(autoads.AirSpider):
                 log.error(f'Error loading member: {e}')
                 continue
 
+        # 云端去重复检查：所有待发送的成员一次批量查询，remote模式下不再每个成员请求一次
+        # Cloud deduplication check - one batched lookup for all candidate members
+        if cloud_dedup.enabled:
+            self._skip_processed_members(request_dict)
+
         count = 0
         total_members = sum(len(m) for m in request_dict.values())
         log.info(f'Total members to process: {total_members}')
@@ -156,6 +154,24 @@ class GreetsSpider(autoads.AirSpider):
                                       driver_count=tools.get_greet_threading_count(config_from_newest=self.config),
                                       stop_event=self.stop_event)
 
+    def _skip_processed_members(self, request_dict):
+        """
+        从request_dict中去掉云端去重记录中已处理过的成员
+        """
+        links = [member.member_link for members in request_dict.values() for member in members]
+        processed = dict(zip(links, cloud_dedup.is_processed_many(links, 'message')))
+
+        for ads_id, members in request_dict.items():
+            remaining = []
+            for member in members:
+                if processed[member.member_link]:
+                    tools.send_message_to_ui(ms=self.ms, ui=self.ui,
+                        message=f'跳过已处理成员(云端去重): {member.member_name}')
+                    log.info(f'Skipping already processed member (cloud dedup): {member.member_link}')
+                else:
+                    remaining.append(member)
+            request_dict[ads_id] = remaining
+
     def parse(self, request, response):
         browser = response.browser
 
@@ -500,6 +516,8 @@ class GreetsSpider(autoads.AirSpider):
             with codecs.open(finished_table, 'r', encoding='utf-8') as fq:
                 # 根据每一行的group_name,组织成{group_name:[unique_key,]}
                 for line in fq:
+                    if not line.strip():
+                        continue  # 已删除的行
                     dictobj = json.loads(line)
                     member: MemberItem = self.pipeline.dictToObj(dictobj, member_template)
 
@@ -523,6 +541,8 @@ class GreetsSpider(autoads.AirSpider):
                         codecs.open(new_table, 'w', encoding='utf-8') as fo:
                     # 把原来表中的数据，一行一行写入新的临时文件中，碰到今天已经处理过的数据，就直接不写入，这样达到删除的效果
                     for line in fi:
+                        if not line.strip():
+                            continue  # 已删除的行，不写入新文件
                         dictobj = json.loads(line)
                         if dictobj[unique_key] in keys:
                             continue
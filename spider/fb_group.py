@@ -150,6 +150,8 @@ class GroupSpider(autoads.AirSpider):
         with codecs.open(table, 'r', encoding='utf-8') as fi, \
                 codecs.open(user, 'w', encoding='utf-8') as fo:
             for line in fi:
+                if not line.strip():
+                    continue  # 已删除的行
                 dictobj = json.loads(line)
                 fo.write(dictobj[unique_key] + '\n')
 
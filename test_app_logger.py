@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+App Logger Testing
+Tests the bounded in-memory views of AppLogger and save_logs / export_for_support
+streaming the whole session from the JSONL spill file
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+# Set up paths
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+from autoads.config import config
+config.name = 'config.ini'
+
+from autoads.app_logger import JsonlSpill, RingBuffer, TeeOutput, app_logger
+
+
+def reset_capture(path, **kwargs):
+    app_logger._setup_capture(path, **kwargs)
+
+
+def test_ring_buffer_keeps_latest_and_slices():
+    buffer = RingBuffer(maxlen=3)
+    for i in range(10):
+        buffer.append(i)
+    assert list(buffer) == [7, 8, 9] and buffer[-2:] == [8, 9] and buffer[0] == 7
+
+
+def test_memory_bounded_but_save_logs_has_whole_session():
+    path = tempfile.mkdtemp()
+    devnull = open(os.devnull, 'w')
+    try:
+        reset_capture(path, max_actions=20, max_errors=5, max_terminal_lines=10)
+        capture = TeeOutput(devnull, app_logger._capture)
+
+        def work(n):
+            for i in range(250):
+                app_logger.log_action("DATA_COLLECT", f"worker{n} {i}", {"i": i})
+                capture.write(f"worker{n} line {i}\n")
+
+        threads = [threading.Thread(target=work, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for i in range(8):
+            app_logger.log_error("TEST_ERROR", f"error {i}", context={"obj": object()})  # 不能序列化的值转成字符串
+
+        assert len(app_logger.actions) == 20 and len(app_logger.errors) == 5 and len(app_logger.terminal_output) == 10
+        assert [error['message'] for error in app_logger.get_errors()] == [f"error {i}" for i in range(3, 8)]
+
+        summary = app_logger.get_session_summary()
+        assert summary['total_actions'] == 1008 and summary['total_errors'] == 8
+        assert summary['total_terminal_output'] == 1000 and summary['dropped_entries'] == 0
+        assert summary['event_counts'] == {"DATA_COLLECT": 1000, "ERROR": 8}
+
+        log_file, json_file = app_logger.save_logs(path)
+        with open(json_file, encoding='utf-8') as f:
+            data = json.load(f)
+        assert len(data['actions']) == 1008 and len(data['errors']) == 8 and len(data['terminal_output']) == 1000
+        for n in range(4):
+            names = [action['action'] for action in data['actions'] if action.get('action', '').startswith(f"worker{n} ")]
+            assert names == [f"worker{n} {i}" for i in range(250)]
+        assert 'kind' not in data['actions'][0] and data['errors'][0]['context']['obj'].startswith('<object')
+        with open(log_file, encoding='utf-8') as f:
+            assert f.read().count('] [stderr] worker') == 1000
+
+        with open(app_logger.export_for_support(path), encoding='utf-8') as f:
+            export = f.read()
+        assert export.count('TEST_ERROR: error') == 8 and export.count('[DATA_COLLECT] worker') == 1000
+    finally:
+        devnull.close()
+        reset_capture(app_logger.default_log_dir)
+        shutil.rmtree(path)
+
+
+def test_spill_drops_instead_of_blocking():
+    path = tempfile.mkdtemp()
+    spill = JsonlSpill(os.path.join(path, 'session.jsonl'), max_queue_size=5)
+    release = threading.Event()
+    writelines = spill._file.writelines
+    spill._file.writelines = lambda lines: release.wait(5) and writelines(lines)  # 磁盘很慢
+    try:
+        for i in range(50):
+            spill.put({"i": i})  # 不会阻塞
+        assert spill.dropped >= 40
+        release.set()
+        spill.flush()
+        assert len(list(spill)) == 50 - spill.dropped
+    finally:
+        release.set()
+        spill.close()
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    print("=" * 80)
+    print("🧪 App Logger Testing")
+    print("=" * 80)
+
+    failed = 0
+    for name, func in list(globals().items()):
+        if name.startswith('test_') and callable(func):
+            try:
+                func()
+                print(f"✅ PASS | {name}")
+            except Exception as e:
+                failed += 1
+                print(f"❌ FAIL | {name} | {e!r}")
+
+    sys.exit(0 if failed == 0 else 1)
@@ -0,0 +1,351 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Cloud Deduplication Testing
+Tests batch check/mark, per-thread WAL connections, the recent-hash cache, the bloom filter
+and the bulk-sync protocol of remote mode against the local stand-in server
+"""
+
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import types
+
+# Set up paths
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+from autoads.config import config
+config.name = 'config.ini'
+
+from autoads import tools
+from autoads.air_spider import AirSpider
+from autoads.cloud_dedup import CloudDeduplication
+from autoads.cloud_dedup_server import DedupServer
+from autoads.pipelines.file_pipeline import FilePipeline
+from spider.fb_greets import GreetsSpider
+
+
+def make_dedup(db_name='test_batch'):
+    """单例，测试前切换到临时目录下的数据库"""
+    dedup = CloudDeduplication()
+    dedup.close()
+    dedup._forget_all()
+    dedup._reset_bloom()
+    for key in dedup._bloom_stats:
+        dedup._bloom_stats[key] = 0
+    dedup._pending_count = 0
+    dedup._remote_retry_time = 0
+    dedup._remote_recovered = False
+    dedup._bulk_supported = True
+    dedup.enabled = True
+    dedup.mode = 'local'
+    dedup.remote_url = ''
+    dedup.db_name = db_name
+    dedup.local_db_path = tempfile.mkdtemp()
+    return dedup
+
+
+def make_remote_dedup(server):
+    dedup = make_dedup('test_remote')
+    dedup.mode = 'remote'
+    dedup.remote_url = server.url
+    return dedup
+
+
+def cleanup(dedup):
+    dedup.enabled = False  # 不再向远程推送
+    dedup.close()
+    shutil.rmtree(dedup.local_db_path, ignore_errors=True)
+
+
+def test_batch_check_and_mark():
+    dedup = make_dedup()
+    try:
+        assert dedup.is_processed_many(['a', 'b', 'c']) == [False, False, False]
+        assert dedup.mark_processed_many(['a', 'c', 'a'], source='ads1')
+        assert dedup.is_processed_many(['a', 'b', 'c', 'a']) == [True, False, True, True]
+        assert dedup.is_processed_many(['a'], item_type='group') == [False]
+        assert dedup.is_processed('c') and not dedup.is_processed('b')
+        assert dedup.get_stats()['total'] == 2
+
+        # 超过单条SQL参数上限时分批查询
+        keys = [f'member{i}' for i in range(2000)]
+        dedup.mark_processed_many(keys[::2])
+        dedup._forget_all()
+        assert dedup.is_processed_many(keys) == [i % 2 == 0 for i in range(2000)]
+    finally:
+        cleanup(dedup)
+
+
+def test_wal_mode_and_concurrent_marks():
+    dedup = make_dedup()
+    try:
+        def worker(n):
+            for i in range(100):
+                assert dedup.mark_processed(f'{n}-{i}', source=str(n))
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert len(dedup._connections) == 8  # 每个线程一个连接
+        assert dedup.get_stats()['total'] == 800
+        journal_mode = dedup._get_local_db().execute('PRAGMA journal_mode').fetchone()[0]
+        assert journal_mode == 'wal'
+    finally:
+        cleanup(dedup)
+
+
+def test_recent_cache_skips_database():
+    dedup = make_dedup()
+    try:
+        dedup.mark_processed_many(['x', 'y'])
+        db_file = os.path.join(dedup.local_db_path, f'{dedup.db_name}.db')
+        conn = sqlite3.connect(db_file)
+        conn.execute('DELETE FROM processed_items')
+        conn.commit()
+        conn.close()
+
+        # 已确认处理过的hash直接由缓存返回
+        assert dedup.is_processed_many(['x', 'y']) == [True, True]
+        dedup._forget_all()
+        assert dedup.is_processed_many(['x', 'y']) == [False, False]
+    finally:
+        cleanup(dedup)
+
+
+def test_bloom_filter_answers_definite_misses():
+    dedup = make_dedup()
+    try:
+        dedup.mark_processed_many([f'old{i}' for i in range(100)])
+        # 模拟重启：布隆过滤器从processed_items重新加载
+        dedup._forget_all()
+        dedup._reset_bloom()
+
+        assert dedup.is_processed_many(['old1', 'old2']) == [True, True]
+        assert dedup.is_processed_many([f'new{i}' for i in range(1000)]) == [False] * 1000
+
+        stats = dedup.get_stats()
+        assert stats['bloom_misses'] - stats['bloom_false_positives'] == 2
+        assert stats['bloom_hits'] + stats['bloom_false_positives'] == 1000
+        assert stats['bloom_false_positives'] < 10
+
+        # 标记后布隆过滤器同步更新
+        dedup.mark_processed('new1')
+        dedup._forget_all()
+        assert dedup.is_processed('new1')
+    finally:
+        cleanup(dedup)
+
+
+def test_remote_bulk_check_and_mark():
+    server = DedupServer().start()
+    dedup = make_remote_dedup(server)
+    try:
+        # 其他实例标记过的数据
+        server.mark_many({'db_name': 'test_remote', 'items': [
+            {'item_hash': dedup._hash_item(f'other{i}')} for i in range(10)
+        ]})
+
+        keys = [f'other{i}' for i in range(10)] + [f'new{i}' for i in range(1990)]
+        assert dedup.is_processed_many(keys) == [True] * 10 + [False] * 1990
+        assert server.requests['/check_many'] == 2  # 每个请求最多REMOTE_BATCH_SIZE个hash
+
+        for i in range(500):
+            assert dedup.mark_processed(f'new{i}', source='ads1')
+        # 每积累REMOTE_PUSH_SIZE条推送一次，剩余的在队列中
+        assert server.requests['/mark_many'] == 2
+        assert dedup.get_stats()['pending_sync'] == 100
+
+        assert dedup.sync()
+        assert dedup.get_stats()['pending_sync'] == 0
+        assert len(server.databases['test_remote']) == 510
+        assert server.requests['/mark_many'] == 3
+        assert server.requests['/check'] == server.requests['/mark'] == 0
+
+        # 本地已标记的不再请求远程
+        dedup._forget_all()
+        assert dedup.is_processed_many([f'new{i}' for i in range(500)]) == [True] * 500
+        assert server.requests['/check_many'] == 2
+    finally:
+        cleanup(dedup)
+        server.stop()
+
+
+def test_remote_outage_queues_and_reconciles():
+    server = DedupServer().start()
+    dedup = make_remote_dedup(server)
+    dedup.REMOTE_RETRY_INTERVAL = 0
+    try:
+        assert dedup.mark_processed_many(['a', 'b'])
+        assert dedup.sync()
+        server.stop()
+
+        # 远程不可用：标记记录在本地队列，检查使用本地数据
+        assert dedup.mark_processed_many([f'offline{i}' for i in range(50)])
+        assert dedup.is_processed_many(['a', 'offline1', 'unknown']) == [True, True, False]
+        assert not dedup.sync()
+        assert dedup.get_stats()['pending_sync'] == 50
+
+        # 远程恢复后第一次请求时把积累的标记推送上去
+        recovered = DedupServer().start()
+        dedup.remote_url = recovered.url
+        try:
+            assert dedup.is_processed_many(['unknown']) == [False]
+            assert dedup.get_stats()['pending_sync'] == 0
+            assert len(recovered.databases['test_remote']) == 50
+            assert recovered.requests['/mark_many'] == 1
+        finally:
+            recovered.stop()
+    finally:
+        del dedup.REMOTE_RETRY_INTERVAL
+        cleanup(dedup)
+
+
+def test_remote_without_bulk_endpoints_falls_back_to_per_item():
+    server = DedupServer(bulk=False).start()
+    dedup = make_remote_dedup(server)
+    try:
+        server.mark({'db_name': 'test_remote', 'item_hash': dedup._hash_item('other')})
+        assert dedup.is_processed_many(['other', 'new1', 'new2']) == [True, False, False]
+        # 批量接口404后只尝试一次，不当作远程故障
+        assert server.requests['/check_many'] == 1 and server.requests['/check'] == 3
+        assert dedup._remote_retry_time == 0
+
+        assert dedup.mark_processed_many(['new1', 'new2'])
+        assert dedup.sync() and dedup.get_stats()['pending_sync'] == 0
+        assert server.requests['/mark_many'] == 0 and server.requests['/mark'] == 2
+        assert len(server.databases['test_remote']) == 3
+
+        dedup._forget_all()
+        assert dedup.is_processed_many(['unknown']) == [False]
+        assert server.requests['/check_many'] == 1 and server.requests['/check'] == 4
+    finally:
+        cleanup(dedup)
+        server.stop()
+
+
+def test_remote_results_are_kept_locally():
+    server = DedupServer().start()
+    dedup = make_remote_dedup(server)
+    try:
+        server.mark({'db_name': 'test_remote', 'item_hash': dedup._hash_item('other')})
+        assert dedup.is_processed_many(['other', 'new']) == [True, False]
+        server.stop()
+
+        # 远程不可用时，之前从远程查询到的记录仍然有效，且不会推送回远程
+        dedup._forget_all()
+        assert dedup.is_processed_many(['other', 'new']) == [True, False]
+        assert dedup.get_stats()['pending_sync'] == 0
+    finally:
+        cleanup(dedup)
+
+
+def wait_for(condition, timeout=3):
+    deadline = time.time() + timeout
+    while not condition() and time.time() < deadline:
+        time.sleep(0.05)
+    return condition()
+
+
+def test_pusher_pushes_without_further_marks():
+    server = DedupServer().start()
+    dedup = make_remote_dedup(server)
+    dedup.REMOTE_PUSH_INTERVAL = 0.1
+    try:
+        assert dedup.mark_processed_many(['a', 'b', 'c'])
+        assert dedup.get_stats()['pending_sync'] == 3
+        # 不再有新的标记，后台线程也会推送
+        assert wait_for(lambda: len(server.databases.get('test_remote', {})) == 3)
+        assert wait_for(lambda: dedup.get_stats()['pending_sync'] == 0)
+    finally:
+        cleanup(dedup)
+        del dedup.REMOTE_PUSH_INTERVAL
+        server.stop()
+
+
+class EmptySpider(AirSpider):
+    def start_requests(self):
+        yield from ()
+
+
+def test_air_spider_end_pushes_pending_marks():
+    server = DedupServer().start()
+    dedup = make_remote_dedup(server)
+    try:
+        assert dedup.mark_processed_many([f'm{i}' for i in range(5)])
+        assert 'test_remote' not in server.databases
+
+        spider = EmptySpider(request_journal=False)
+        spider.start()
+        spider.join()
+        assert len(server.databases['test_remote']) == 5
+        assert dedup.get_stats()['pending_sync'] == 0
+    finally:
+        cleanup(dedup)
+        server.stop()
+
+
+def test_greets_spider_checks_members_in_one_request():
+    server = DedupServer().start()
+    dedup = make_remote_dedup(server)
+    member_file = os.path.join(dedup.local_db_path, 'members.txt')
+    get_ads_id = tools.get_ads_id
+    tools.get_ads_id = lambda size=1000: ['k1', 'k2']
+    try:
+        with open(member_file, 'w', encoding='utf-8') as f:
+            for i in range(6):
+                f.write(json.dumps({'member_link': f'https://fb.com/m{i}', 'member_name': f'成员{i}',
+                                    'group_name': '群组', 'status': 'init'}, ensure_ascii=False) + '\n')
+        server.mark_many({'db_name': 'test_remote', 'items': [
+            {'item_hash': dedup._hash_item(f'https://fb.com/m{i}', 'message')} for i in (1, 4)
+        ]})
+
+        spider = GreetsSpider(config=types.SimpleNamespace(members_selected_file=member_file, members_nums=3,
+                                                           account_nums=2))
+        requests = list(spider.start_requests())
+        # 每个账号取members_nums个成员，云端已处理过的跳过，所有成员只查询一次远程
+        assert sorted(request.url for request in requests) == [f'https://fb.com/m{i}' for i in (0, 2, 3, 5)]
+        assert {request.url: request.ads_id for request in requests}['https://fb.com/m5'] == 'k2'
+        assert server.requests['/check_many'] == 1 and server.requests['/check'] == 0
+    finally:
+        tools.get_ads_id = get_ads_id
+        FilePipeline().close()
+        cleanup(dedup)
+        server.stop()
+
+
+def test_disabled_dedup():
+    dedup = make_dedup()
+    try:
+        dedup.enabled = False
+        assert dedup.is_processed_many(['a', 'b']) == [False, False]
+        assert dedup.mark_processed_many(['a'])
+    finally:
+        cleanup(dedup)
+
+
+if __name__ == '__main__':
+    print("=" * 80)
+    print("🧪 Cloud Deduplication Testing")
+    print("=" * 80)
+
+    failed = 0
+    for name, func in list(globals().items()):
+        if name.startswith('test_') and callable(func):
+            try:
+                func()
+                print(f"✅ PASS | {name}")
+            except Exception as e:
+                failed += 1
+                print(f"❌ FAIL | {name} | {e!r}")
+
+    sys.exit(0 if failed == 0 else 1)
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Config Testing
+Tests the typed config snapshot, batched atomic writes and change notifications
+"""
+
+import configparser
+import os
+import shutil
+import stat
+import sys
+import tempfile
+
+# Set up paths
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+from autoads.config import Config
+
+CONFIG_INI = '''[main]
+max_thread_count = 4
+screen_width = abc
+
+[members]
+xpath_public_user = ["//div[@role='list']", "//a[@role='link']"]
+save_links_only = True
+texts = ["hi"]
+discount = 50%%
+'''
+
+
+def make_config(path):
+    config_path = os.path.join(path, 'config.ini')
+    with open(config_path, 'w', encoding='utf-8') as f:
+        f.write(CONFIG_INI)
+    _config = Config()
+    _config.name = config_path
+    return _config, config_path
+
+
+def read_parser(config_path):
+    parser = configparser.ConfigParser()
+    parser.read(config_path, encoding='utf-8')
+    return parser
+
+
+def test_snapshot_pre_decodes_values():
+    path = tempfile.mkdtemp()
+    try:
+        _config, _ = make_config(path)
+        xpaths = _config.members_xpath_public_user
+        assert xpaths == ("//div[@role='list']", "//a[@role='link']")
+        assert _config.members_xpath_public_user is xpaths  # 不再每次 json.loads
+
+        assert _config.max_thread_count == 4
+        assert _config.screen_width == 1920 and _config.screen_height == 1080  # 不合法或缺失时用默认值
+        assert _config.members_save_links_only is True and _config.keep_browser_open is True
+        assert _config.members_texts == ['hi'] and _config.get_option('members', 'discount') == '50%'
+
+        for section, option, error in (('nope', 'x', configparser.NoSectionError),
+                                       ('main', 'nope', configparser.NoOptionError)):
+            try:
+                _config.get_option(section, option)
+                assert False, 'should raise'
+            except error:
+                pass
+    finally:
+        shutil.rmtree(path)
+
+
+def test_transaction_writes_once_and_notifies():
+    path = tempfile.mkdtemp()
+    try:
+        _config, config_path = make_config(path)
+        os.chmod(config_path, 0o644)
+        snapshots = []
+        _config.subscribe(snapshots.append)
+        old = _config.snapshot
+
+        writes = []
+        replace = os.replace
+        os.replace = lambda src, dst: writes.append(dst) or replace(src, dst)
+        try:
+            with _config.transaction():
+                _config.set_option('main', 'max_thread_count', '8')
+                with _config.transaction():
+                    _config.set_option('ip_pool', 'enabled', 'True')  # 新的section
+                assert _config.max_thread_count == 8  # 事务内读取到新值
+                assert not snapshots and read_parser(config_path).get('main', 'max_thread_count') == '4'
+        finally:
+            os.replace = replace
+
+        assert writes == [config_path] and len(snapshots) == 1
+        assert snapshots[0] is _config.snapshot and snapshots[0].get_bool('ip_pool', 'enabled', False)
+        assert old.get_int('main', 'max_thread_count', 0) == 4  # 旧快照不变
+        parser = read_parser(config_path)
+        assert parser.get('main', 'max_thread_count') == '8' and parser.get('ip_pool', 'enabled') == 'True'
+        assert sorted(os.listdir(path)) == ['config.ini']
+        assert stat.S_IMODE(os.stat(config_path).st_mode) == 0o644
+
+        _config.remove_option('ip_pool', 'enabled')  # 不在事务中，立即写入
+        assert len(snapshots) == 2 and not read_parser(config_path).has_option('ip_pool', 'enabled')
+    finally:
+        shutil.rmtree(path)
+
+
+def test_failed_transaction_rolls_back():
+    path = tempfile.mkdtemp()
+    try:
+        _config, config_path = make_config(path)
+        snapshots = []
+        _config.subscribe(snapshots.append)
+        try:
+            with _config.transaction():
+                _config.set_option('main', 'max_thread_count', '8')
+                _config.remove_section('members')
+                raise RuntimeError('remote config broken')
+        except RuntimeError:
+            pass
+
+        assert not snapshots and _config.max_thread_count == 4
+        assert _config.members_xpath_public_user == ("//div[@role='list']", "//a[@role='link']")
+        with open(config_path, encoding='utf-8') as f:
+            assert f.read() == CONFIG_INI
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    print("=" * 80)
+    print("🧪 Config Testing")
+    print("=" * 80)
+
+    failed = 0
+    for name, func in list(globals().items()):
+        if name.startswith('test_') and callable(func):
+            try:
+                func()
+                print(f"✅ PASS | {name}")
+            except Exception as e:
+                failed += 1
+                print(f"❌ FAIL | {name} | {e!r}")
+
+    sys.exit(0 if failed == 0 else 1)
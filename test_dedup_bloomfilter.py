@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Dedup / BloomFilter Testing
+Tests the vectorized bloom filter path against the per-key path
+"""
+
+import os
+import random
+import sys
+import tempfile
+
+# Set up paths
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+from autoads.config import config
+config.name = 'config.ini'
+
+from autoads.dedup import Dedup
+from autoads.dedup.bitarray import MemoryBitArray, MmapBitArray
+from autoads.dedup.bloomfilter import BloomFilter, ScalableBloomFilter, make_batch_hashfuncs, make_hashfuncs
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def test_batch_hashes_match_per_key_hashes():
+    if np is None:
+        return
+
+    keys = [f'https://www.facebook.com/user/{i}' for i in range(100)] + [12345, '成员']
+    for bits_per_slice in (1000, 70000, 3000000000):
+        hashes = make_hashfuncs(17, bits_per_slice)
+        batch_hashes = make_batch_hashfuncs(17, bits_per_slice)
+        assert batch_hashes(keys).tolist() == [list(hashes(key)) for key in keys]
+
+
+def test_set_batch_matches_sequential_set():
+    if np is None:
+        return
+
+    offsets = np.array([3, 5, 3, 99, 5, 0], dtype=np.int64)
+    batch_bits = MemoryBitArray(100)
+    bits = MemoryBitArray(100)
+
+    assert batch_bits.set_batch(offsets, 1).tolist() == bits.set(offsets.tolist(), 1)
+    assert batch_bits.get_batch(offsets).tolist() == bits.get(offsets.tolist())
+    assert batch_bits.set_batch(offsets, 0).tolist() == bits.set(offsets.tolist(), 0)
+    assert batch_bits.bitarray == bits.bitarray
+
+
+def test_vectorized_filter_matches_python_filter():
+    vectorized_filter = BloomFilter(5000)
+    python_filter = BloomFilter(5000)
+    python_filter.vectorized = False
+
+    random.seed(7)
+    keys = [str(random.randint(0, 3000)) for _ in range(2000)]
+    for i in range(0, len(keys), 100):
+        batch = keys[i:i + 100]
+        assert vectorized_filter.get(batch) == python_filter.get(batch)
+        assert vectorized_filter.add(batch) == python_filter.add(batch)
+
+    assert vectorized_filter.bitarray.bitarray == python_filter.bitarray.bitarray
+    assert vectorized_filter.bit_count == vectorized_filter.bitarray.count()
+    assert python_filter.bit_count == python_filter.bitarray.count()
+
+
+def test_scalable_filter_first_occurrence():
+    sbf = ScalableBloomFilter(initial_capacity=10000)
+    sbf.add(['a', 'b'])
+
+    keys = ['a', 'c', 'c', 'd', 'b', 'd', 'c']
+    # get: 只有第一次出现的不存在的key记为0
+    assert sbf.get(keys) == [1, 0, 1, 0, 1, 1, 1]
+    assert keys == ['a', 'c', 'c', 'd', 'b', 'd', 'c']  # 不修改传入的列表
+    # add: 只有第一次出现的不存在的key记为1
+    assert sbf.add(keys) == [0, 1, 0, 1, 0, 0, 0]
+    assert sbf.get(keys) == [1] * len(keys)
+    assert sbf.get('e') == 0
+    assert sbf.add('e') == 1
+
+
+def test_dedup_keeps_caller_list():
+    dedup = Dedup(to_md5=False, initial_capacity=10000)
+    fingerprints = ['x', 'y', 'x']
+    assert dedup.get(fingerprints) == [0, 0, 1]
+    assert fingerprints == ['x', 'y', 'x']
+
+
+def test_mmap_filter_survives_reopen():
+    with tempfile.TemporaryDirectory() as path:
+        bloom = BloomFilter(5000, bitarray_type=BloomFilter.BASE_MMAP, name='test:mmap', path=path)
+        assert bloom.add(['a', 'b', 'a']) == [1, 1, 0]
+        bit_count = bloom.bit_count
+        bloom.close()
+
+        # 容量参数以快照文件头为准
+        reopened = BloomFilter(10, bitarray_type=BloomFilter.BASE_MMAP, name='test:mmap', path=path)
+        assert reopened.capacity == 5000
+        assert reopened.get(['a', 'b', 'c']) == [1, 1, 0]
+        assert reopened.bit_count == bit_count
+        reopened.close()
+
+
+def test_mmap_matches_memory_filter():
+    with tempfile.TemporaryDirectory() as path:
+        memory_filter = BloomFilter(5000)
+        mmap_filter = BloomFilter(5000, bitarray_type=BloomFilter.BASE_MMAP, name='test', path=path)
+
+        keys = [str(i % 700) for i in range(1000)]
+        assert mmap_filter.add(keys) == memory_filter.add(keys)
+        assert mmap_filter.get(keys) == memory_filter.get(keys)
+        assert mmap_filter.bitarray.bitarray[:mmap_filter.num_bits] == memory_filter.bitarray.bitarray
+        # 文件头中记录的置1位数与实际一致
+        assert mmap_filter.bitarray.count() == memory_filter.bitarray.count()
+
+        mmap_filter.vectorized = False
+        mmap_filter.add([str(i) for i in range(2000)])
+        assert mmap_filter.bitarray.count() == mmap_filter.bitarray.bitarray.count()
+        mmap_filter.close()
+
+
+def test_mmap_header_validation():
+    with tempfile.TemporaryDirectory() as path:
+        file_path = os.path.join(path, 'broken' + MmapBitArray.FILE_SUFFIX)
+        with open(file_path, 'wb') as f:
+            f.write(b'not a bloom filter' * 10)
+
+        try:
+            BloomFilter(100, bitarray_type=BloomFilter.BASE_MMAP, name='broken', path=path)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('broken snapshot should be rejected')
+
+
+def test_scalable_mmap_filter_reloads_chained_filters():
+    with tempfile.TemporaryDirectory() as path:
+        dedup = Dedup(to_md5=False, initial_capacity=100, absolute_name='chain',
+                      bitarray_type=ScalableBloomFilter.BASE_MMAP, path=path)
+        for i in range(5):
+            dedup.add([f'{i}-{j}' for j in range(100)])
+        capacities = [f.capacity for f in dedup.dedup.filters]
+        assert len(capacities) > 1
+        dedup.close()
+
+        reopened = Dedup(to_md5=False, initial_capacity=100, absolute_name='chain',
+                         bitarray_type=ScalableBloomFilter.BASE_MMAP, path=path)
+        assert reopened.get(['0-0', '4-99', 'new']) == [1, 1, 0]
+        # 最后一个filter已满时会继续扩展
+        assert [f.capacity for f in reopened.dedup.filters][:len(capacities)] == capacities
+        reopened.close()
+
+
+def test_scalable_filter_allocates_lazily_and_grows():
+    sbf = ScalableBloomFilter(initial_capacity=100, growth_factor=4)
+    assert sbf.filters == []  # 首次使用前不分配
+
+    assert sbf.get('a') == 0
+    assert len(sbf.filters) == 1
+
+    keys = [str(i) for i in range(1000)]
+    for i in range(0, len(keys), 50):
+        sbf.add(keys[i:i + 50])
+
+    capacities = [f.capacity for f in sbf.filters]
+    assert capacities == [100 * 4 ** i for i in range(len(capacities))]
+    assert len(capacities) > 1
+    assert sbf.get(keys) == [1] * len(keys)
+
+
+def test_scalable_filter_overall_error_rate_is_bounded():
+    sbf = ScalableBloomFilter(initial_capacity=1000, error_rate=0.01, growth_factor=2)
+    keys = [f'in-{i}' for i in range(30000)]
+    for i in range(0, len(keys), 500):
+        sbf.add(keys[i:i + 500])
+
+    error_rates = [f.error_rate for f in sbf.filters]
+    assert len(error_rates) >= 4
+    assert all(later < earlier for earlier, later in zip(error_rates, error_rates[1:]))
+    assert sum(error_rates) < 0.01
+
+    # 链上有多个filter时，不存在的key被误判为已存在的比例仍不超过error_rate
+    false_positives = sum(sbf.get([f'out-{i}' for i in range(50000)]))
+    assert false_positives / 50000 < 0.01
+
+
+def test_mmap_filter_is_not_created_until_used():
+    with tempfile.TemporaryDirectory() as path:
+        dedup = Dedup(to_md5=False, absolute_name='lazy', bitarray_type=ScalableBloomFilter.BASE_MMAP, path=path)
+        assert os.listdir(path) == []
+        dedup.add('a')
+        assert os.listdir(path) == ['lazy0' + MmapBitArray.FILE_SUFFIX]
+        dedup.close()
+
+
+if __name__ == '__main__':
+    print("=" * 80)
+    print("🧪 Dedup / BloomFilter Testing")
+    print("=" * 80)
+
+    failed = 0
+    for name, func in list(globals().items()):
+        if name.startswith('test_') and callable(func):
+            try:
+                func()
+                print(f"✅ PASS | {name}")
+            except Exception as e:
+                failed += 1
+                print(f"❌ FAIL | {name} | {e!r}")
+
+    sys.exit(0 if failed == 0 else 1)
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Item Testing
+Tests the compiled to_dict layout, slotted items and the cached fingerprint
+"""
+
+import copy
+import os
+import pickle
+import sys
+
+# Set up paths
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+from autoads.config import config
+config.name = 'config.ini'
+
+from autoads import tools
+from autoads.item import Item
+from autoads.items.group_item import GroupItem
+from autoads.items.member_item import MemberItem
+
+
+class SlottedMemberItem(Item):
+    __slots__ = ('member_link', '__secret')
+
+    def __init__(self, link):
+        self.member_link = link
+        self.__secret = 'x'
+        self.status = 'init'
+        self.unique_key = ('member_link',)
+
+
+def member(link):
+    item = MemberItem()
+    item.member_link = link
+    item.member_name = '成员'
+    return item
+
+
+def test_to_dict_skips_internal_keys_and_renames_private():
+    item = member('https://fb.com/1')
+    item.table_name = './fb/member/group.txt'
+    item.item_name = 'member'
+    item._MemberItem__note = 'private'
+    data = item.to_dict
+    assert data['member_link'] == 'https://fb.com/1' and data['__note'] == 'private'
+    assert not any(key in data for key in ('__table_name__', '__name__', '__unique_key__', '_fingerprint'))
+
+    # 返回的是新的dict，修改不影响item
+    data['status'] = 'send'
+    assert item.to_dict['status'] == 'init'
+
+
+def test_slotted_item_fields_in_to_dict():
+    item = SlottedMemberItem('https://fb.com/1')
+    assert item.to_dict == {'status': 'init', 'member_link': 'https://fb.com/1', '__secret': 'x'}
+    assert item.fingerprint == tools.get_md5('https://fb.com/1')
+    item.member_link = 'https://fb.com/2'
+    assert item.fingerprint == tools.get_md5('https://fb.com/2')
+
+
+def test_fingerprint_cached_until_unique_value_changes():
+    item = member('https://fb.com/1')
+    fingerprint = item.fingerprint
+    assert fingerprint == tools.get_md5('https://fb.com/1')
+    assert item._fingerprint[1] == fingerprint
+
+    item.member_name = '改名'  # 非唯一键不影响
+    assert item.fingerprint == fingerprint
+
+    item.member_link = 'https://fb.com/2'
+    assert item.fingerprint == tools.get_md5('https://fb.com/2')
+    item['member_link'] = 'https://fb.com/3'
+    assert item.fingerprint == tools.get_md5('https://fb.com/3')
+
+    item.unique_key = ('member_link', 'member_name')
+    assert item.fingerprint == tools.get_md5(*sorted(['https://fb.com/3', '改名']))
+
+    duplicate = copy.copy(item)
+    duplicate['member_link'] = 'https://fb.com/4'
+    assert duplicate.fingerprint != item.fingerprint
+
+
+def test_fingerprint_without_unique_key_or_values():
+    item = Item(a='1', b='', c=2)
+    assert item.fingerprint == tools.get_md5('1', '2')
+    item['b'] = '0'
+    assert item.fingerprint == tools.get_md5('0', '1', '2')
+
+    group = GroupItem()
+    assert group.fingerprint is None  # group_link为空
+    group.group_link = 'https://fb.com/groups/1'
+    assert group.fingerprint == tools.get_md5('https://fb.com/groups/1')
+
+
+def test_member_and_group_items_are_slotted():
+    item = member('https://fb.com/1')
+    assert item.__dict__ == {} and item.unique_key == ('member_link',)
+    assert list(item.to_dict) == ['group_name', 'group_link', 'member_name', 'member_link', 'role_type', 'ads_id',
+                                  'priority', 'status']
+
+    # item[key] 读写slot中的字段，其他字段仍在__dict__中
+    item['status'] = 'send'
+    item['note'] = '备注'
+    assert item.status == 'send' and item['member_link'] == 'https://fb.com/1' and item.__dict__ == {'note': '备注'}
+    assert item.to_dict['note'] == '备注'
+
+    update_item = item.to_UpdateItem()
+    assert update_item.to_dict == item.to_dict and update_item.unique_key == ('member_link',)
+    assert update_item.update_key == ('status',)
+
+    group = pickle.loads(pickle.dumps(GroupItem()))
+    assert group.to_dict == GroupItem().to_dict
+
+    # 改为slots之前pickle的GroupItem，字段在__dict__中
+    legacy = GroupItem.__new__(GroupItem)
+    legacy.__setstate__({'group_name': '群组', 'group_link': 'https://fb.com/groups/1', '__unique_key__': ('group_link',)})
+    assert legacy.group_link == 'https://fb.com/groups/1' and legacy.__dict__ == {'__unique_key__': ('group_link',)}
+
+
+if __name__ == '__main__':
+    print("=" * 80)
+    print("🧪 Item Testing")
+    print("=" * 80)
+
+    failed = 0
+    for name, func in list(globals().items()):
+        if name.startswith('test_') and callable(func):
+            try:
+                func()
+                print(f"✅ PASS | {name}")
+            except Exception as e:
+                failed += 1
+                print(f"❌ FAIL | {name} | {e!r}")
+
+    sys.exit(0 if failed == 0 else 1)
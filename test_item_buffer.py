@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+ItemBuffer Testing
+Tests the size/age triggered, double-buffered flush and its backpressure metrics
+"""
+
+import os
+import sys
+import threading
+import time
+import uuid
+
+# Set up paths
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+from autoads.config import config
+config.name = 'config.ini'
+
+from autoads import item_buffer
+from autoads.item import Item
+from autoads.item_buffer import ItemBuffer
+from autoads.pipelines import BasePipeline
+from autoads.task_counter import TaskCounter
+
+
+class MemberLinkItem(Item):
+    __table_name__ = './test_item_buffer/members.txt'
+
+    def __init__(self, link):
+        self.member_link = link
+        self.unique_key = ('member_link',)
+        self.status = 'init'
+
+
+class RecordingPipeline(BasePipeline):
+    def __init__(self):
+        self.saved = []
+        self.release = threading.Event()
+        self.release.set()
+        self.writing = threading.Event()
+
+    def save_items(self, table, items):
+        self.writing.set()
+        self.release.wait(5)
+        self.saved.extend(item['member_link'] for item in items)
+        return True
+
+
+class TableWritersPipeline(BasePipeline):
+    """每个表的写入等待其他表的写入同时进行，fail_table的写入失败"""
+
+    def __init__(self, tables, fail_table=None):
+        self.barrier = threading.Barrier(tables, timeout=5)
+        self.fail_table = fail_table
+        self.saved = []
+        self.threads = set()
+
+    def save_items(self, table, items):
+        self.barrier.wait()
+        self.threads.add(threading.current_thread().name)
+        if table == self.fail_table:
+            return False
+        self.saved.extend(item['member_link'] for item in items)
+        return True
+
+
+def make_buffer(pipeline=None):
+    counter = TaskCounter()
+    buffer = ItemBuffer(task_counter=counter)
+    pipeline = pipeline or RecordingPipeline()
+    buffer._pipelines = [pipeline]
+    buffer.start()
+    return buffer, pipeline, counter
+
+
+def new_items(count):
+    return [MemberLinkItem(f'https://fb.com/{uuid.uuid4().hex}') for _ in range(count)]
+
+
+def test_flush_by_age_and_by_size():
+    buffer, pipeline, counter = make_buffer()
+    try:
+        # 数据不足FLUSH_ITEM_COUNT条时，等待FLUSH_INTERVAL秒后入库
+        started = time.monotonic()
+        for item in new_items(3):
+            buffer.put_item(item)
+        assert counter.wait_done(5)
+        assert time.monotonic() - started >= item_buffer.FLUSH_INTERVAL * 0.9
+        assert len(pipeline.saved) == 3
+
+        # 达到FLUSH_ITEM_COUNT条时立即入库
+        started = time.monotonic()
+        for item in new_items(item_buffer.FLUSH_ITEM_COUNT):
+            buffer.put_item(item)
+        assert counter.wait_done(5)
+        assert time.monotonic() - started < item_buffer.FLUSH_INTERVAL
+        assert len(pipeline.saved) == 3 + item_buffer.FLUSH_ITEM_COUNT
+
+        stats = buffer.get_stats()
+        assert stats['flushed_items'] == 3 + item_buffer.FLUSH_ITEM_COUNT and stats['queue_depth'] == 0
+        assert stats['blocked_puts'] == 0 and stats['avg_flush_ms'] > 0
+    finally:
+        buffer.stop()
+
+
+def test_collect_into_second_buffer_and_block_when_full():
+    max_item_count = item_buffer.MAX_ITEM_COUNT
+    item_buffer.MAX_ITEM_COUNT = 10
+    buffer, pipeline, counter = make_buffer()
+    try:
+        pipeline.release.clear()
+        buffer.put_item(new_items(1)[0])
+        assert pipeline.writing.wait(5)  # 第一个缓存正在入库
+
+        # 入库期间继续写入第二个缓存，写满后阻塞
+        producer = threading.Thread(target=lambda: [buffer.put_item(item) for item in new_items(11)])
+        producer.start()
+        time.sleep(0.3)
+        assert producer.is_alive() and buffer.get_items_count() == 11
+
+        pipeline.release.set()
+        producer.join(5)
+        assert counter.wait_done(5) and len(pipeline.saved) == 12
+
+        stats = buffer.get_stats()
+        assert stats['blocked_puts'] == 1 and stats['blocked_seconds'] >= 0.2
+        assert stats['max_queue_depth'] == 10 and stats['max_flush_ms'] >= 300
+    finally:
+        item_buffer.MAX_ITEM_COUNT = max_item_count
+        pipeline.release.set()
+        buffer.stop()
+
+
+def table_items(tables, count=2):
+    items = new_items(tables * count)
+    for i, item in enumerate(items):
+        item.table_name = f'./test_item_buffer/group{i % tables}.txt'
+    return items
+
+
+def test_tables_written_in_parallel():
+    buffer, pipeline, counter = make_buffer(TableWritersPipeline(3))
+    try:
+        items = table_items(3)
+        for item in items:
+            buffer.put_item(item)
+        assert counter.wait_done(10)
+        assert sorted(pipeline.saved) == sorted(item.member_link for item in items)
+        assert len(pipeline.threads) == 3
+    finally:
+        buffer.stop()
+
+
+def test_failed_table_skips_dedup_commit():
+    buffer, pipeline, counter = make_buffer(TableWritersPipeline(2, fail_table='./test_item_buffer/group1.txt'))
+    try:
+        items = table_items(2)
+        for item in items:
+            buffer.put_item(item)
+        assert counter.wait_done(10)
+        assert pipeline.saved == [item.member_link for item in items if item.table_name.endswith('group0.txt')]
+
+        # 有一个表失败，本批数据都没有写入去重库，再次采集到时仍会入库
+        pipeline.fail_table = None
+        for item in items:
+            buffer.put_item(item)
+        assert counter.wait_done(10)
+        assert len(pipeline.saved) == 2 + 4
+    finally:
+        buffer.stop()
+
+
+if __name__ == '__main__':
+    print("=" * 80)
+    print("🧪 ItemBuffer Testing")
+    print("=" * 80)
+
+    failed = 0
+    for name, func in list(globals().items()):
+        if name.startswith('test_') and callable(func):
+            try:
+                func()
+                print(f"✅ PASS | {name}")
+            except Exception as e:
+                failed += 1
+                print(f"❌ FAIL | {name} | {e!r}")
+
+    sys.exit(0 if failed == 0 else 1)
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Log Handler Testing
+Tests byte-tracked rollover of RotatingFileHandler and the background QueueWriterHandler
+"""
+
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+# Set up paths
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+from autoads.log import QueueWriterHandler, RotatingFileHandler
+
+
+def record(msg, *args, level=logging.INFO):
+    return logging.LogRecord('test', level, __file__, 1, msg, args, None)
+
+
+def make_handler(path, **kwargs):
+    handler = RotatingFileHandler(os.path.join(path, 'spider.log'), encoding='utf8', **kwargs)
+    handler.setFormatter(logging.Formatter('%(message)s'))
+    return handler
+
+
+def read(path, name='spider.log'):
+    with open(os.path.join(path, name), encoding='utf8') as f:
+        return f.read()
+
+
+def test_rollover_by_tracked_bytes():
+    path = tempfile.mkdtemp()
+    try:
+        handler = make_handler(path, max_bytes=1000, backup_count=3)
+        for i in range(100):
+            handler.emit(record('采集成员 %05d ' + 'x' * 20, i))  # 每行40字节
+        handler.close()
+
+        names = sorted(os.listdir(path))
+        assert names == ['spider.log', 'spider1.log', 'spider2.log', 'spider3.log']
+        for name in names:
+            size = os.path.getsize(os.path.join(path, name))
+            assert 0 < size < 1000
+            assert size % 40 == 0  # 不会把一行拆到两个文件里
+        assert read(path).splitlines()[-1].startswith('采集成员 00099')
+        assert handler.bytes_written == os.path.getsize(os.path.join(path, 'spider.log'))
+    finally:
+        shutil.rmtree(path)
+
+
+def test_append_mode_starts_from_file_size():
+    path = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(path, 'spider.log'), 'w', encoding='utf8') as f:
+            f.write('x' * 90 + '\n')
+        handler = make_handler(path, mode='a', max_bytes=100, backup_count=2)
+        assert handler.bytes_written == 91
+        handler.emit(record('y' * 20))
+        handler.close()
+        assert read(path) == 'y' * 20 + '\n' and read(path, 'spider1.log') == 'x' * 90 + '\n'
+    finally:
+        shutil.rmtree(path)
+
+
+def test_queue_writer_keeps_all_records_in_order():
+    path = tempfile.mkdtemp()
+    handler = QueueWriterHandler(make_handler(path))
+    try:
+        values = ['before']
+        handler.emit(record('%s', values))
+        values[0] = 'after'  # 参数在emit时已合并
+
+        def work(n):
+            for i in range(500):
+                handler.emit(record('worker%d %d', n, i))
+
+        threads = [threading.Thread(target=work, args=(n,)) for n in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        handler.flush()
+
+        lines = read(path).splitlines()
+        assert lines[0] == "['before']" and len(lines) == 2001 and handler.dropped == 0
+        for n in range(4):
+            assert [line for line in lines if line.startswith(f'worker{n} ')] == [f'worker{n} {i}' for i in range(500)]
+    finally:
+        handler.close()
+        shutil.rmtree(path)
+
+
+def test_queue_writer_drops_when_full_and_reports():
+    path = tempfile.mkdtemp()
+    target = make_handler(path)
+    release = threading.Event()
+    write = target.write
+    target.write = lambda record: release.wait(5) and write(record)  # 磁盘很慢
+    handler = QueueWriterHandler(target, max_queue_size=5)
+    try:
+        for i in range(50):
+            handler.emit(record('line %d', i))  # 不会阻塞
+        assert handler.dropped >= 40
+        release.set()
+        handler.flush()
+
+        lines = read(path).splitlines()
+        assert len(lines) == 50 - handler.dropped + 1
+        assert lines[-1] == f'日志队列已满，丢弃了{handler.dropped}条日志（共{handler.dropped}条）'
+    finally:
+        release.set()
+        handler.close()
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    print("=" * 80)
+    print("🧪 Log Handler Testing")
+    print("=" * 80)
+
+    failed = 0
+    for name, func in list(globals().items()):
+        if name.startswith('test_') and callable(func):
+            try:
+                func()
+                print(f"✅ PASS | {name}")
+            except Exception as e:
+                failed += 1
+                print(f"❌ FAIL | {name} | {e!r}")
+
+    sys.exit(0 if failed == 0 else 1)
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Member Consolidation Testing
+Tests the streaming consolidation/export and the incremental dedup of member files
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+# Set up paths
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+from autoads.config import config
+config.name = 'config.ini'
+
+from autoads import tools
+from autoads.pipelines.consolidate import UNIQUE_KEYS_FILE, UNIQUE_STATE_FILE, unique_files
+
+
+def member(i, group=0):
+    return {'group_name': f'群组{group}', 'member_name': f'成员{i}',
+            'member_link': f'https://www.facebook.com/profile.php?id={i}', 'status': 'init'}
+
+
+def make_member_dir(groups=6, members=50):
+    """每个群组文件中的成员和下一个群组有一半重复"""
+    member_dir = tempfile.mkdtemp()
+    for group in range(groups):
+        with open(os.path.join(member_dir, f'group{group}.txt'), 'w', encoding='utf-8') as f:
+            for i in range(group * members // 2, group * members // 2 + members):
+                f.write(json.dumps(member(i, group), ensure_ascii=False) + '\n')
+            f.write('\n')  # 已删除的行
+    # 已导出的文件不参与合并
+    with open(os.path.join(member_dir, 'group0_links.txt'), 'w', encoding='utf-8') as f:
+        f.write('https://www.facebook.com/profile.php?id=999999\n')
+    return member_dir
+
+
+def read_lines(path):
+    with open(path, encoding='utf-8') as f:
+        return f.read().splitlines()
+
+
+def test_consolidated_file_keeps_first_occurrence():
+    member_dir = make_member_dir()
+    try:
+        output_file = os.path.join(member_dir, 'all_members.txt')
+        assert tools.create_consolidated_member_file(member_dir, output_file) == 175
+
+        rows = [json.loads(line) for line in read_lines(output_file)]
+        assert [row['member_link'] for row in rows] == [member(i)['member_link'] for i in range(175)]
+        # 保留第一次出现的原始行
+        assert rows[30]['group_name'] == '群组0' and rows[60]['group_name'] == '群组1'
+        assert read_lines(output_file.replace('.txt', '_links.txt')) == [row['member_link'] for row in rows]
+
+        # 再次合并时跳过 all_members*.txt
+        assert tools.create_consolidated_member_file(member_dir, output_file) == 175
+    finally:
+        shutil.rmtree(member_dir)
+
+
+def test_bloom_and_process_pool_match_hash_set():
+    member_dir = make_member_dir(groups=20)
+    try:
+        outputs = {}
+        for name, kwargs in {'set': {}, 'bloom': {'use_bloom': True}, 'pool': {'workers': 2},
+                             'pool_bloom': {'workers': 2, 'use_bloom': True}}.items():
+            output_file = os.path.join(member_dir, f'{name}_export.out')
+            assert tools.export_all_member_links(member_dir, output_file, **kwargs) == 525
+            outputs[name] = read_lines(output_file)
+
+        assert outputs['set'] == outputs['bloom'] == outputs['pool'] == outputs['pool_bloom']
+        assert len(set(outputs['set'])) == 525
+    finally:
+        shutil.rmtree(member_dir)
+
+
+def test_missing_directory():
+    assert tools.export_all_member_links('/nonexistent/member/dir', '/nonexistent/out.txt') == 0
+    assert tools.create_consolidated_member_file('/nonexistent/member/dir', '/nonexistent/out.txt') == 0
+
+
+def test_unique_member_keeps_first_occurrence_across_files():
+    member_dir = tempfile.mkdtemp()
+    try:
+        with open(os.path.join(member_dir, 'a.txt'), 'w', encoding='utf-8') as f:
+            f.write(json.dumps(member(1)) + '\n\n' + json.dumps(member(2)) + '\n' + json.dumps(member(1, 5)) + '\n')
+        with open(os.path.join(member_dir, 'b_links.txt'), 'w', encoding='utf-8') as f:
+            f.write(' https://x/1 \r\nhttps://x/1\n' + member(2)['member_link'] + '\nnot json')
+
+        assert tools.unique_member(member_dir, 'member_link', workers=2) == 4
+        a_lines = read_lines(os.path.join(member_dir, 'a.txt'))
+        b_lines = read_lines(os.path.join(member_dir, 'b_links.txt'))
+        assert a_lines[0] == json.dumps(member(1)) and json.dumps(member(1, 5)) not in a_lines
+        assert b_lines[:1] == ['https://x/1'] and b_lines[-1] == 'not json'
+        # json的unique_key值与_links.txt中的整行内容在同一个集合中去重，按文件顺序保留第一次出现的
+        assert (json.dumps(member(2)) in a_lines) != (member(2)['member_link'] in b_lines)
+    finally:
+        shutil.rmtree(member_dir)
+
+
+def test_incremental_unique_member_only_reads_appended_lines():
+    member_dir = make_member_dir(groups=3)
+    files = sorted(os.path.join(member_dir, name) for name in os.listdir(member_dir))
+    try:
+        assert unique_files(files, 'member_link', incremental=True)['kept'] == 101
+        # 每个保留的key只存64位hash
+        assert os.path.getsize(os.path.join(member_dir, UNIQUE_KEYS_FILE)) == 101 * 8
+        state_mtime = os.path.getmtime(os.path.join(member_dir, UNIQUE_STATE_FILE))
+
+        # 没有变化的文件不再读取
+        result = unique_files(files, 'member_link', incremental=True)
+        assert result['files'] == {} and result['kept'] == 101
+
+        group1 = os.path.join(member_dir, 'group1.txt')
+        size = os.path.getsize(group1)
+        with open(group1, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(member(0)) + '\n' + json.dumps(member(1000)) + '\n')
+        result = unique_files(files, 'member_link', incremental=True)
+        assert result['files'] == {group1: (1, 1)} and result['kept'] == 102
+        with open(group1, encoding='utf-8') as f:
+            f.seek(size)
+            assert f.read().splitlines() == [json.dumps(member(1000))]
+        assert os.path.getmtime(os.path.join(member_dir, UNIQUE_STATE_FILE)) >= state_mtime
+
+        # group0 被改写后，group1 中与它重复的行要删除，group2 与前面的文件没有重复，不再读取
+        group0 = os.path.join(member_dir, 'group0.txt')
+        with open(group0, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(member(1000)) + '\n')
+        result = unique_files(files, 'member_link', incremental=True)
+        assert result['files'] == {group0: (1, 0), group1: (25, 1)} and result['kept'] == 52
+    finally:
+        shutil.rmtree(member_dir)
+
+
+def test_incremental_unique_member_matches_full_pass():
+    member_dir = make_member_dir(groups=4)
+    full_dir = tempfile.mkdtemp()
+    files = sorted(os.path.join(member_dir, name) for name in os.listdir(member_dir))
+    try:
+        unique_files(files, 'member_link', incremental=True)
+
+        def edit(name, func):
+            with open(os.path.join(member_dir, name), 'r+b') as f:
+                func(f)
+            stat = os.stat(os.path.join(member_dir, name))
+            os.utime(os.path.join(member_dir, name), (stat.st_atime, stat.st_mtime + 1))
+
+        # 原地删除（改写为空格）、改写开头但文件没有变短、追加与前面文件重复的行
+        edit('group1.txt', lambda f: f.write(b' ' * len(f.readline().rstrip(b'\n'))))
+        edit('group2.txt', lambda f: f.write(json.dumps(member(5000)).ljust(len(f.readline()) - 1).encode()))
+        edit('group3.txt', lambda f: (f.seek(0, 2), f.write((json.dumps(member(30)) + '\n').encode())))
+
+        for name in os.listdir(member_dir):
+            if not name.startswith('.'):
+                shutil.copy(os.path.join(member_dir, name), full_dir)
+        incremental = unique_files(files, 'member_link', incremental=True)
+        full = unique_files(sorted(os.path.join(full_dir, name) for name in os.listdir(full_dir)), 'member_link')
+
+        assert incremental['kept'] == full['kept']
+        for name in os.listdir(full_dir):
+            if name.startswith('.'):
+                continue
+            assert read_lines(os.path.join(member_dir, name)) == read_lines(os.path.join(full_dir, name)), name
+        # 水位与全量去重后的文件一致，再次增量去重不会改动文件
+        assert unique_files(files, 'member_link', incremental=True) == {'kept': full['kept'], 'removed': 0, 'files': {}}
+    finally:
+        shutil.rmtree(member_dir)
+        shutil.rmtree(full_dir)
+
+
+if __name__ == '__main__':
+    print("=" * 80)
+    print("🧪 Member Consolidation Testing")
+    print("=" * 80)
+
+    failed = 0
+    for name, func in list(globals().items()):
+        if name.startswith('test_') and callable(func):
+            try:
+                func()
+                print(f"✅ PASS | {name}")
+            except Exception as e:
+                failed += 1
+                print(f"❌ FAIL | {name} | {e!r}")
+
+    sys.exit(0 if failed == 0 else 1)
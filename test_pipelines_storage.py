@@ -0,0 +1,405 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Pipeline Storage Testing
+Tests the FilePipeline indexed update store and tombstone deletes, the concurrent SqlitePipeline
+and the columnar SegmentPipeline store
+"""
+
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+# Set up paths
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+from autoads.config import config
+config.name = 'config.ini'
+
+from autoads.pipelines.file_pipeline import FilePipeline
+from autoads import tools
+from autoads.pipelines.file_store import IndexedFileStore, get_store
+from autoads.pipelines.segment_pipeline import SegmentPipeline
+from autoads.pipelines.segment_store import SegmentStore, export_jsonl, import_jsonl, segment_path
+from autoads.pipelines.sqlite_pipeline import SqlitePipeline, sqlite_path
+
+
+def make_table(rows):
+    path = tempfile.mkdtemp()
+    table = os.path.join(path, 'test_table.txt')
+    FilePipeline().save_items(table, rows)
+    return table
+
+
+def read_rows(table):
+    with open(table, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_rows(table):
+    return [json.loads(line) for line in FilePipeline().load_items_from_file(None, table)]
+
+
+def rows(count, status='init'):
+    return [{'link': f'https://fb.com/{i}', 'name': f'成员{i}', 'status': status} for i in range(count)]
+
+
+def test_update_in_place():
+    table = make_table(rows(5))
+    try:
+        size = os.path.getsize(table)
+        pipeline = FilePipeline()
+        pipeline.update_items(table, [{'link': 'https://fb.com/3', 'status': 'send'}], ('status',), ('link',))
+
+        # 新内容不比原行长：原地改写，不写更新日志
+        assert os.path.getsize(table) == size
+        assert not os.path.exists(table + IndexedFileStore.UPDATES_SUFFIX)
+        assert [row['status'] for row in read_rows(table)] == ['init', 'init', 'init', 'send', 'init']
+
+        pipeline.update_items(table, [{'link': 'https://fb.com/3', 'status': 'ok'}], ('status',), ('link',))
+        assert read_rows(table)[3]['status'] == 'ok'
+        assert os.path.getsize(table) == size
+    finally:
+        shutil.rmtree(os.path.dirname(table))
+
+
+def test_longer_update_goes_to_log_until_compaction():
+    table = make_table(rows(5))
+    try:
+        pipeline = FilePipeline()
+        pipeline.update_items(table, [{'link': 'https://fb.com/1', 'status': 'already_sent'}], ('status',), ('link',))
+        pipeline.update_items(table, [{'link': 'https://fb.com/1', 'status': 'ok'}], ('status',), ('link',))
+
+        assert os.path.exists(table + IndexedFileStore.UPDATES_SUFFIX)
+        assert read_rows(table)[1]['status'] == 'init'  # 表文件还未改动
+        assert load_rows(table)[1]['status'] == 'ok'  # 读取时合并更新日志
+
+        pipeline.close()
+        assert not os.path.exists(table + IndexedFileStore.UPDATES_SUFFIX)
+        assert [row['status'] for row in read_rows(table)] == ['init', 'ok', 'init', 'init', 'init']
+    finally:
+        shutil.rmtree(os.path.dirname(table))
+
+
+def test_compaction_threshold():
+    table = make_table(rows(20))
+    store = get_store(table)
+    store.COMPACT_THRESHOLD = 10
+    try:
+        pipeline = FilePipeline()
+        for i in range(10):
+            pipeline.update_items(table, [{'link': f'https://fb.com/{i}', 'status': 'a much longer status'}],
+                                  ('status',), ('link',))
+        assert not os.path.exists(table + IndexedFileStore.UPDATES_SUFFIX)
+        assert [row['status'] for row in read_rows(table)] == ['a much longer status'] * 10 + ['init'] * 10
+    finally:
+        shutil.rmtree(os.path.dirname(table))
+
+
+def test_index_follows_appends_and_rewrites():
+    table = make_table(rows(3))
+    try:
+        pipeline = FilePipeline()
+        pipeline.update_items(table, [{'link': 'https://fb.com/0', 'status': 'send'}], ('status',), ('link',))
+
+        # 追加数据后增量索引
+        pipeline.save_items(table, [{'link': 'https://fb.com/new', 'name': 'new', 'status': 'init'}])
+        pipeline.update_items(table, [{'link': 'https://fb.com/new', 'status': 'send'}], ('status',), ('link',))
+        assert read_rows(table)[-1]['status'] == 'send'
+
+        # 表文件被其他地方改写（删除了第一行）后重建索引
+        with open(table, encoding='utf-8') as f:
+            lines = f.readlines()
+        with open(table, 'w', encoding='utf-8') as f:
+            f.writelines(lines[1:] + [lines[0]])
+        pipeline.update_items(table, [{'link': 'https://fb.com/2', 'status': 'send'}], ('status',), ('link',))
+        assert [row['status'] for row in read_rows(table)] == ['init', 'send', 'send', 'send']
+    finally:
+        shutil.rmtree(os.path.dirname(table))
+
+
+def test_duplicate_keys_all_updated():
+    table = make_table(rows(2) + rows(1))
+    try:
+        FilePipeline().update_items(table, [{'link': 'https://fb.com/0', 'status': 'send'}], ('status',), ('link',))
+        assert [row['status'] for row in read_rows(table)] == ['send', 'init', 'send']
+    finally:
+        shutil.rmtree(os.path.dirname(table))
+
+
+def test_delete_entry_leaves_tombstone_until_compaction():
+    table = make_table(rows(5))
+    try:
+        size = os.path.getsize(table)
+        assert tools.delete_entry_from_file(table, 'link', 'https://fb.com/2')
+        assert not tools.delete_entry_from_file(table, 'link', 'https://fb.com/2')  # 已删除
+
+        # 原地清空，不重写表文件；直接读取文件的地方跳过空行即可
+        assert os.path.getsize(table) == size
+        assert os.path.exists(table + IndexedFileStore.TOMBSTONES_SUFFIX)
+        assert [row['link'] for row in read_rows(table)] == [f'https://fb.com/{i}' for i in (0, 1, 3, 4)]
+        assert [row['link'] for row in load_rows(table)] == [f'https://fb.com/{i}' for i in (0, 1, 3, 4)]
+
+        # 删除后的更新不会写回已删除的行，没有匹配的行也算更新成功
+        assert FilePipeline().update_items(table, [{'link': 'https://fb.com/2', 'status': 'send'}],
+                                           ('status',), ('link',))
+        assert len(load_rows(table)) == 4
+
+        FilePipeline().close()
+        assert not os.path.exists(table + IndexedFileStore.TOMBSTONES_SUFFIX)
+        assert os.path.getsize(table) < size
+        with open(table, encoding='utf-8') as f:
+            assert len(f.readlines()) == 4
+    finally:
+        shutil.rmtree(os.path.dirname(table))
+
+
+def test_delete_entries_batch_and_links_file():
+    table = make_table(rows(6))
+    links_file = os.path.join(os.path.dirname(table), 'test_links.txt')
+    try:
+        assert tools.delete_entries_batch(table, 'link', ['https://fb.com/1', 'https://fb.com/4', 'missing']) == 2
+        assert [row['link'] for row in load_rows(table)] == [f'https://fb.com/{i}' for i in (0, 2, 3, 5)]
+
+        for i in range(4):
+            tools.save_clean_link(links_file, f'https://fb.com/{i}')
+        assert tools.delete_entry_from_file(links_file, 'https://fb.com/1')
+        # _links.txt 在JSON模式下也按整行匹配
+        assert tools.delete_entry_from_file(links_file, 'member_link', 'https://fb.com/2')
+        FilePipeline().update_items(links_file, [{'member_link': 'https://fb.com/3'}], ('status',), ('member_link',))
+
+        with open(links_file, encoding='utf-8') as f:
+            assert [line.strip() for line in f if line.strip()] == ['https://fb.com/0']
+    finally:
+        shutil.rmtree(os.path.dirname(table))
+
+
+def test_delete_plain_url_from_json_mode_file():
+    path = tempfile.mkdtemp()
+    try:
+        # fb_greets 也接受每行一个链接、文件名不以 _links.txt 结尾的输入文件
+        urls_file = os.path.join(path, 'members.txt')
+        with open(urls_file, 'w', encoding='utf-8') as f:
+            f.write('https://fb.com/0\n{"member_link": "https://fb.com/1"}\nhttps://fb.com/2\n')
+
+        # 不是json的行没有字段可更新，不会被改写
+        assert FilePipeline().update_items(urls_file, [{'member_link': 'https://fb.com/0', 'status': 'send'}],
+                                           ('status',), ('member_link',))
+        with open(urls_file, encoding='utf-8') as f:
+            assert f.readline() == 'https://fb.com/0\n'
+
+        assert tools.delete_entry_from_file(urls_file, 'member_link', 'https://fb.com/2')
+        assert tools.delete_entries_batch(urls_file, 'member_link', ['https://fb.com/1', 'https://fb.com/0']) == 2
+        assert not tools.delete_entry_from_file(urls_file, 'member_link', 'https://fb.com/2')
+        with open(urls_file, encoding='utf-8') as f:
+            assert [line for line in f if line.strip()] == []
+    finally:
+        FilePipeline().close()
+        shutil.rmtree(path)
+
+
+def test_update_items_reports_store_failure():
+    path = tempfile.mkdtemp()
+    try:
+        table = os.path.join(path, 'broken_table.txt')
+        os.mkdir(table)  # 表文件无法打开
+        assert not FilePipeline().update_items(table, [{'link': 'https://fb.com/0', 'status': 'send'}],
+                                               ('status',), ('link',))
+    finally:
+        shutil.rmtree(path)
+
+
+def test_tombstones_compact_in_background_without_losing_appends():
+    table = make_table(rows(30))
+    store = get_store(table)
+    store.COMPACT_THRESHOLD = 10
+    try:
+        pipeline = FilePipeline()
+        tools.delete_entries_batch(table, 'link', [f'https://fb.com/{i}' for i in range(10)])
+        pipeline.save_items(table, [{'link': 'https://fb.com/new', 'name': 'new', 'status': 'init'}])
+        store._compactor.join()
+
+        assert not os.path.exists(table + IndexedFileStore.TOMBSTONES_SUFFIX)
+        assert [row['link'] for row in read_rows(table)] == \
+            [f'https://fb.com/{i}' for i in range(10, 30)] + ['https://fb.com/new']
+
+        # 压缩后索引重建，继续删除/更新
+        assert tools.delete_entry_from_file(table, 'link', 'https://fb.com/new')
+        pipeline.update_items(table, [{'link': 'https://fb.com/29', 'status': 'send'}], ('status',), ('link',))
+        assert load_rows(table)[-1] == {'link': 'https://fb.com/29', 'name': '成员29', 'status': 'send'}
+    finally:
+        shutil.rmtree(os.path.dirname(table))
+
+
+def members(count, status='init'):
+    return [{'group_name': '测试群组', 'group_link': 'https://fb.com/groups/1', 'member_name': f'成员{i}',
+             'member_link': f'https://fb.com/{i}', 'ads_id': 'k1abc', 'status': status} for i in range(count)]
+
+
+def test_segment_jsonl_round_trip():
+    path = tempfile.mkdtemp()
+    try:
+        jsonl = os.path.join(path, 'members.txt')
+        rows = members(3) + [{'member_link': 'https://fb.com/x', 'apply_nums': 2, 'tags': ['a', None], 'status': None},
+                             {'member_name': '只有名字'}]
+        with open(jsonl, 'w', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False) + '\n')
+            f.write('\nhttps://fb.com/plain\n[1, 2]\n')
+
+        assert import_jsonl(jsonl, batch_size=2) == 7
+        exported = os.path.join(path, 'exported.txt')
+        assert export_jsonl(segment_path(jsonl), exported) == 7
+        with open(exported, encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        assert [json.loads(line) for line in lines[:5]] == rows  # 缺少的字段、非字符串的值不丢失
+        assert lines[5:] == ['https://fb.com/plain', '[1, 2]']  # 不是json对象的行原样保存
+    finally:
+        shutil.rmtree(path)
+
+
+def test_segment_projection_updates_and_deletes():
+    path = tempfile.mkdtemp()
+    store = SegmentStore(os.path.join(path, 'members.seg'))
+    try:
+        store.append(members(1000))
+        jsonl_size = sum(len(json.dumps(row, ensure_ascii=False)) + 1 for row in members(1000))
+        assert os.path.getsize(store.path) < jsonl_size / 2  # 重复的字段字典编码
+
+        store.update([{'member_link': 'https://fb.com/1', 'status': 'send'}], ('status',), 'member_link')
+        store.delete(['https://fb.com/2'], 'member_link')
+        store.append([{'member_link': 'https://fb.com/2', 'status': 'init'}])  # 删除后重新采集
+
+        rows = list(store.scan(columns=('member_link', 'status')))
+        assert rows[:3] == [{'member_link': 'https://fb.com/0', 'status': 'init'},
+                            {'member_link': 'https://fb.com/1', 'status': 'send'},
+                            {'member_link': 'https://fb.com/3', 'status': 'init'}]
+        assert rows[-1] == {'member_link': 'https://fb.com/2', 'status': 'init'}
+        assert list(store.scan(columns=('status',)))[1] == {'status': 'send'}
+        assert store.count() == 1000
+
+        # 写入中断的最后一段被忽略
+        with open(store.path, 'ab') as f:
+            f.write(SegmentStore.SEGMENT_HEADER.pack(b'RG', 0, 10, 1, 100, 100) + b'partial')
+        assert store.count() == 1000
+
+        # 压缩后只剩数据段
+        store.close()
+        assert [kind for _, kind, _, _, _ in store._iter_segments()] == [SegmentStore.KIND_DATA]
+        assert list(store.scan())[1]['status'] == 'send' and store.count() == 1000
+    finally:
+        shutil.rmtree(path)
+
+
+def test_segment_pipeline_save_update_load():
+    path = tempfile.mkdtemp()
+    table = os.path.join(path, 'group1.txt')
+    pipeline = SegmentPipeline()
+    try:
+        assert pipeline.save_items(table, members(5))
+        assert pipeline.update_items(table, [{'member_link': 'https://fb.com/4', 'status': 'send'}],
+                                     ('status',), ('member_link',))
+        assert not os.path.exists(table)  # 只写分段存储文件
+
+        rows = [json.loads(line) for line in pipeline.load_items_from_file(None, table, begin=3)]
+        assert rows == [members(5)[3], dict(members(5)[4], status='send')]
+        rows = [json.loads(line) for line in pipeline.load_items_from_file(None, table, columns=('member_link',))]
+        assert rows[0] == {'member_link': 'https://fb.com/0'}
+    finally:
+        pipeline.close()
+        shutil.rmtree(path)
+
+
+def test_sqlite_pipeline_save_update_load():
+    path = tempfile.mkdtemp()
+    table = os.path.join(path, 'group1.txt')
+    pipeline = SqlitePipeline()
+    try:
+        pipeline.create_table(table, unique_keys=('member_link',), update_keys=('status',))
+        assert pipeline.save_items(table, members(5))
+        assert pipeline.save_items(table, [dict(members(5)[0], status='send')])  # 唯一键冲突的忽略
+        assert pipeline.save_items(os.path.join(path, 'group2.txt'), members(2))
+        assert os.path.exists(sqlite_path(table)) and not os.path.exists(table)
+
+        updates = [{'member_link': f'https://fb.com/{i}', 'status': 'send'} for i in (1, 3, 9)]
+        assert pipeline.update_items(table, updates, ('status',), ('member_link',))
+        rows = [json.loads(line) for line in pipeline.load_items_from_file(None, table)]
+        assert [row['status'] for row in rows] == ['init', 'send', 'init', 'send', 'init']
+        assert rows[0] == members(5)[0]  # 其他字段和字段顺序不变
+
+        rows = [json.loads(line) for line in pipeline.load_items_from_file(None, table, begin=3)]
+        assert [row['member_link'] for row in rows] == ['https://fb.com/3', 'https://fb.com/4']
+
+        class Template:
+            table_name = path
+        assert len(list(pipeline.load_items(Template(), begin=1))) == 6
+    finally:
+        pipeline.close()
+        shutil.rmtree(path)
+
+
+def test_sqlite_pipeline_adds_key_columns_to_existing_table():
+    path = tempfile.mkdtemp()
+    table = os.path.join(path, 'group1.txt')
+    pipeline = SqlitePipeline()
+    try:
+        # 没有建表信息时只保存data列，更新时补上key列并从data回填
+        assert pipeline.save_items(table, members(3) + members(1))
+        assert pipeline.update_items(table, [{'member_link': 'https://fb.com/0', 'status': 'send'}],
+                                     ('status',), ('member_link',))
+        rows = [json.loads(line) for line in pipeline.load_items_from_file(None, table)]
+        assert [row['status'] for row in rows] == ['send', 'init', 'init', 'send']
+    finally:
+        pipeline.close()
+        shutil.rmtree(path)
+
+
+def test_sqlite_pipeline_writes_tables_in_parallel():
+    path = tempfile.mkdtemp()
+    tables = [os.path.join(path, f'group{i}.txt') for i in range(4)]
+    pipeline = SqlitePipeline()
+    try:
+        pipeline.create_table(tables[0], unique_keys=('member_link',))
+        # 持有group0的锁时，其他线程仍可以写同一个数据库中的其他表
+        with pipeline._table_lock(sqlite_path(tables[0]), 'group0'):
+            writer = threading.Thread(target=pipeline.save_items, args=(tables[1], members(3)))
+            writer.start()
+            writer.join(5)
+            assert not writer.is_alive()
+
+        results = []
+        threads = [threading.Thread(target=lambda table=table: results.append(pipeline.save_items(table, members(50))))
+                   for table in tables for _ in range(2)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == [True] * len(threads) and len(pipeline._connections) > 1
+
+        counts = [len(list(pipeline.load_items_from_file(None, table))) for table in tables]
+        assert counts == [50, 103, 100, 100]  # 只有group0有唯一索引
+    finally:
+        pipeline.close()
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    print("=" * 80)
+    print("🧪 Pipeline Storage Testing")
+    print("=" * 80)
+
+    failed = 0
+    for name, func in list(globals().items()):
+        if name.startswith('test_') and callable(func):
+            try:
+                func()
+                print(f"✅ PASS | {name}")
+            except Exception as e:
+                failed += 1
+                print(f"❌ FAIL | {name} | {e!r}")
+
+    sys.exit(0 if failed == 0 else 1)
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Request Testing
+Tests the slotted Request: extension fields, requests kwargs, FIFO ordering within a priority
+and the to_dict / from_dict round trip
+"""
+
+import heapq
+import os
+import sys
+import threading
+
+# Set up paths
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+from autoads.config import config
+config.name = 'config.ini'
+
+from autoads.items.group_item import GroupItem
+from autoads.memory_db import MemoryDB
+from autoads.request import Request
+
+
+def make_group(i):
+    group = GroupItem()
+    group.group_name = f'群组{i}'
+    group.group_link = f'https://www.facebook.com/groups/{i}'
+    return group
+
+
+def test_extension_fields_and_request_kwargs():
+    group = make_group(1)
+    request = Request(url='https://fb.com/groups/1/members', ads_id='k1', group=group, timeout=5, headers={'a': 1})
+    assert not hasattr(request, '__dict__')
+    assert request.group is group and request.extra == {'group': group}
+    assert getattr(request, 'post_content', ['Hello!']) == ['Hello!']
+
+    assert request.requests_kwargs == {'timeout': 5, 'headers': {'a': 1}} and request.timeout == 5
+    request.verify = False
+    assert request.requests_kwargs['verify'] is False and not hasattr(request, 'cookies')
+
+    request.index = 3
+    request.extra['member'] = 'm'
+    assert request.index == 3 and request.member == 'm'
+    try:
+        request.member = 'x'  # 扩展字段需要通过 extra 修改
+        assert False, 'should raise'
+    except AttributeError:
+        pass
+
+    assert request.member_timeout == config.member_timeout
+
+
+def test_same_priority_is_fifo():
+    requests = [Request(url=str(i), priority=i % 3) for i in range(30)]
+    heap = []
+    for request in reversed(requests):
+        heapq.heappush(heap, request)
+    urls = [heapq.heappop(heap).url for _ in range(30)]
+    assert urls == [str(i) for p in range(3) for i in range(30) if i % 3 == p]
+
+    db = MemoryDB()
+    requests[5].priority = -1  # 修改优先级时保留创建顺序
+    requests[2].priority = 1
+    for request in requests[:6]:
+        request.ads_id = 'A'
+        db.add(request)
+    assert [db.get('A').url for _ in range(6)] == ['5', '0', '3', '1', '2', '4']
+
+
+def test_default_fields_and_priority_update():
+    request = Request(url='x', priority=5)
+    assert request.render is True and request.auto_request is True and request.is_drop is False
+    assert request.retry_times == 0 and request.render_time == 8 and request.callback is None
+    sort_key = request._sort_key
+    request.priority = 1  # 修改优先级时刷新排序键，保留创建顺序
+    assert request._sort_key == (1, sort_key[1]) and request.priority == 1
+
+    request.is_drop = True
+    request.render = False
+    request.retry_times += 1
+    assert request.is_drop is True and request.render is False and request.auto_request is True
+    assert request.retry_times == 1 and request.render_time == 8
+
+    copied = request.copy()
+    assert copied.is_drop is True and copied.render is False and copied.retry_times == 1
+    assert Request(url='x', render_time=0, callback='parse_detail').to_dict == {
+        'url': 'x', 'render_time': 0, 'callback': 'parse_detail'}
+
+
+def test_to_dict_round_trip():
+    stop_event = threading.Event()
+    request = Request(url='https://fb.com/groups/1/members', ads_id='k1', priority=20, render=False, index=2,
+                      group=make_group(1), word='测试', timeout=5, stop_event=stop_event)
+    data = request.to_dict
+    assert 'stop_event' not in data and 'response' not in data and 'requests_kwargs' not in data
+    assert data['render'] is False and data['word'] == '测试' and isinstance(data['group'], bytes)
+
+    copied = request.copy()
+    assert copied.to_dict.keys() == data.keys() and copied.stop_event is stop_event
+    assert copied.render is False and copied.index == 2 and copied.priority == 20
+    assert copied.group.group_link == 'https://www.facebook.com/groups/1' and copied.timeout == 5
+    assert request < copied  # 同优先级先创建的在前
+
+    assert Request(url='x').to_dict == {'url': 'x'}
+
+
+if __name__ == '__main__':
+    print("=" * 80)
+    print("🧪 Request Testing")
+    print("=" * 80)
+
+    failed = 0
+    for name, func in list(globals().items()):
+        if name.startswith('test_') and callable(func):
+            try:
+                func()
+                print(f"✅ PASS | {name}")
+            except Exception as e:
+                failed += 1
+                print(f"❌ FAIL | {name} | {e!r}")
+
+    sys.exit(0 if failed == 0 else 1)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Request Journal Testing
+Tests add/ack replay, snapshot compaction, torn writes and AirSpider resuming from the journal
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import threading
+
+# Set up paths
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+from autoads.config import config
+config.name = 'config.ini'
+
+from autoads.air_spider import AirSpider
+from autoads.items.group_item import GroupItem
+from autoads.request import Request
+from autoads.request_journal import RequestJournal
+
+
+def make_request(i):
+    group = GroupItem()
+    group.group_name = f'群组{i}'
+    group.group_link = f'https://www.facebook.com/groups/{i}'
+    return Request(url=group.group_link + '/members', ads_id=f'k{i % 2}', priority=i % 3, group=group,
+                   render=False, timeout=5)
+
+
+def count_lines(file_path):
+    with open(file_path, encoding='utf-8') as f:
+        return sum(1 for _ in f)
+
+
+def test_replay_unacked_requests_in_order():
+    path = tempfile.mkdtemp()
+    try:
+        journal = RequestJournal(path, 'MembersSpider')
+        assert journal.open() == []
+        requests = [make_request(i) for i in range(6)]
+        for request in requests:
+            journal.add(request)
+        journal.ack(requests[1])
+        journal.ack(requests[4])
+        assert requests[1].journal_id is None and journal.pending_count() == 4
+        # 模拟崩溃：不调用close，直接重新打开
+
+        restored = RequestJournal(path, 'MembersSpider').open()
+        assert [request.url for request in restored] == [requests[i].url for i in (0, 2, 3, 5)]
+        for request, original in zip(restored, (requests[i] for i in (0, 2, 3, 5))):
+            assert request.journal_id == original.journal_id and request.to_dict.keys() == original.to_dict.keys()
+            assert request.group.group_link == original.group.group_link and request.render is False
+            assert request.timeout == 5 and request.priority == original.priority
+    finally:
+        shutil.rmtree(path)
+
+
+def test_compaction_and_torn_write():
+    path = tempfile.mkdtemp()
+    try:
+        journal = RequestJournal(path, 'GroupSpider', compact_interval=3)
+        journal.open()
+        requests = [make_request(i) for i in range(10)]
+        for request in requests:
+            journal.add(request)
+        for request in requests[:7]:
+            journal.ack(request)  # 第3、6次ack时合并
+
+        assert count_lines(journal.snapshot_path) == 4 and count_lines(journal.journal_path) == 1
+        journal._file.write('{"op": "ack", "id"')  # 崩溃时写了一半的行
+        journal._file.flush()
+
+        journal = RequestJournal(path, 'GroupSpider', compact_interval=3)
+        assert [request.url for request in journal.open()] == [request.url for request in requests[7:]]
+        assert count_lines(journal.journal_path) == 0 and journal.pending_count() == 3
+
+        journal.add(make_request(10))  # id继续增长，不与恢复的请求冲突
+        journal.close()
+        assert sorted(request.journal_id for request in RequestJournal(path, 'GroupSpider').open()) == [8, 9, 10, 11]
+
+        journal.clear()
+        assert os.listdir(path) == []
+    finally:
+        shutil.rmtree(path)
+
+
+class JournalSpider(AirSpider):
+    def __init__(self, path, **kwargs):
+        super().__init__(**kwargs)
+        self._journal = RequestJournal(path, self.__class__.__name__)
+        self.start_requests_calls = 0
+
+    def start_requests(self):
+        self.start_requests_calls += 1
+        for i in range(5):
+            yield make_request(i)
+
+
+def test_air_spider_resumes_from_journal():
+    path = tempfile.mkdtemp()
+    try:
+        spider = JournalSpider(path, request_journal=True)
+        spider.distribute_task()
+        assert spider.start_requests_calls == 1 and spider._memory_db.size() == 5
+        for _ in range(2):  # 处理了两个请求后崩溃
+            spider._journal.ack(spider._memory_db.get())
+
+        resumed = JournalSpider(path, request_journal=True)
+        resumed.distribute_task()
+        assert resumed.start_requests_calls == 0 and resumed._memory_db.size() == 3
+        request = resumed._memory_db.get()
+        assert request.parser_name == resumed.name and request.journal_id is not None
+    finally:
+        shutil.rmtree(path)
+
+
+def test_resume_then_stop_keeps_pending_requests():
+    path = tempfile.mkdtemp()
+    try:
+        spider = JournalSpider(path, request_journal=True)
+        spider.distribute_task()
+        spider._journal.ack(spider._memory_db.get())
+
+        stop_event = threading.Event()
+        resumed = JournalSpider(path, request_journal=True, stop_event=stop_event)
+        resumed.distribute_task()
+        request = resumed._memory_db.get()
+        # 恢复的请求要能响应停止
+        assert request.stop_event is stop_event
+
+        stop_event.set()
+        assert resumed.all_thread_is_done()
+        resumed._journal.close()  # 停止时保留未完成的请求，取出但没处理完的也不丢
+        assert len(RequestJournal(path, 'JournalSpider').open()) == 4
+    finally:
+        shutil.rmtree(path)
+
+
+if __name__ == '__main__':
+    print("=" * 80)
+    print("🧪 Request Journal Testing")
+    print("=" * 80)
+
+    failed = 0
+    for name, func in list(globals().items()):
+        if name.startswith('test_') and callable(func):
+            try:
+                func()
+                print(f"✅ PASS | {name}")
+            except Exception as e:
+                failed += 1
+                print(f"❌ FAIL | {name} | {e!r}")
+
+    sys.exit(0 if failed == 0 else 1)
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Scheduler / Request Queue Testing
+Tests MemoryDB sharding by ads_id, ads_id binding, TaskCounter completion,
+when AirSpider considers a run finished and the queue of processing requests shown in the UI
+"""
+
+import os
+import sys
+import threading
+import time
+
+# Set up paths
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+from autoads.config import config
+config.name = 'config.ini'
+
+from autoads.air_spider import AirSpider
+from autoads.item import Item
+from autoads.memory_db import MemoryDB
+from autoads.pipelines import BasePipeline
+from autoads.task_counter import TaskCounter
+
+
+class FakeRequest:
+    def __init__(self, url, ads_id=None, priority=300):
+        self.url = url
+        self.ads_id = ads_id
+        self.priority = priority
+
+    def __lt__(self, other):
+        return self.priority < other.priority
+
+
+class MemberLinkItem(Item):
+    __table_name__ = './test_scheduler_queue/members.txt'
+
+    def __init__(self, link):
+        self.member_link = link
+        self.unique_key = ('member_link',)
+
+
+class RecordingPipeline(BasePipeline):
+    def __init__(self):
+        self.saved = []
+
+    def save_items(self, table, items):
+        self.saved.extend(item['member_link'] for item in items)
+        return True
+
+
+def test_get_by_key_only_returns_that_key():
+    db = MemoryDB()
+    db.add(FakeRequest('a1', 'A', 10))
+    db.add(FakeRequest('b1', 'B', 1))
+    db.add(FakeRequest('a2', 'A', 5))
+
+    assert db.get('A').url == 'a2'
+    assert db.get('A').url == 'a1'
+    assert db.get('A') is None
+    assert db.size() == 1
+
+
+def test_unbound_get_binds_key():
+    db = MemoryDB()
+    db.add(FakeRequest('a1', 'A', 1))
+    db.add(FakeRequest('a2', 'A', 2))
+    db.add(FakeRequest('b1', 'B', 3))
+
+    first = db.get()
+    assert first.ads_id == 'A'
+    # A 已被绑定，其他线程只能拿到 B
+    second = db.get()
+    assert second.ads_id == 'B'
+    assert db.get() is None
+
+    db.unbind('A')
+    assert db.get().url == 'a2'
+
+
+def test_shared_queue_for_unbound_items():
+    db = MemoryDB()
+    db.add([0, 0, 100, 100])
+    db.add([100, 0, 100, 100])
+    assert db.get() == [0, 0, 100, 100]
+    assert not db.empty()
+    assert db.get() == [100, 0, 100, 100]
+    assert db.empty()
+
+
+def test_blocking_get_wakes_on_add():
+    db = MemoryDB()
+    result = {}
+
+    def worker():
+        result['request'] = db.get(timeout=5)
+
+    thread = threading.Thread(target=worker)
+    thread.start()
+    time.sleep(0.05)
+    started = time.monotonic()
+    db.add(FakeRequest('a1', 'A'))
+    thread.join()
+
+    assert result['request'].url == 'a1'
+    assert time.monotonic() - started < 1
+
+
+def test_blocking_get_timeout():
+    db = MemoryDB()
+    started = time.monotonic()
+    assert db.get(timeout=0.1) is None
+    assert time.monotonic() - started >= 0.1
+
+
+def test_task_counter_tracks_queue():
+    counter = TaskCounter()
+    db = MemoryDB(task_counter=counter)
+    db.add(FakeRequest('a1', 'A'))
+    db.add(FakeRequest('b1', 'B'))
+    assert not counter.is_done()
+
+    db.get()
+    db.task_done()
+    assert counter.count == 1
+
+    db.clear()
+    assert counter.is_done()
+    assert counter.wait_done(timeout=0)
+
+
+def test_task_counter_wait_done():
+    counter = TaskCounter()
+    assert counter.is_done() and counter.wait_done(timeout=0)
+
+    counter.add(2)
+    counter.add(0)
+    assert counter.count == 2 and not counter.wait_done(timeout=0.01)
+
+    timer = threading.Timer(0.05, counter.done, args=(2,))
+    timer.start()
+    started = time.monotonic()
+    assert counter.wait_done(timeout=5)  # 归零时立即唤醒
+    assert time.monotonic() - started < 1
+
+    counter.done(3)  # 多减的部分不会变成负数
+    assert counter.count == 0
+    counter.add()
+    counter.reset()
+    assert counter.is_done() and counter.count == 0
+
+
+def test_memory_db_task_done_after_processing():
+    counter = TaskCounter()
+    db = MemoryDB(task_counter=counter)
+    db.add(FakeRequest('a1', 'A'))
+    db.add(FakeRequest('a2'))
+
+    # 取出后还在处理中，计数不变
+    db.get('A')
+    db.get()
+    assert db.empty() and counter.count == 2 and not counter.is_done()
+
+    db.task_done()
+    db.task_done()
+    assert counter.is_done()
+
+
+def test_air_spider_done_with_empty_queue():
+    spider = AirSpider()
+    assert spider.all_thread_is_done()
+
+
+def test_air_spider_not_done_while_request_in_flight():
+    spider = AirSpider()
+    spider._memory_db.add(FakeRequest('a1', 'A'))
+    assert not spider.all_thread_is_done()
+
+    request = spider._memory_db.get()
+    assert request.url == 'a1' and not spider.all_thread_is_done()
+    spider._memory_db.task_done()
+    assert spider.all_thread_is_done()
+
+
+def test_air_spider_not_done_while_items_buffered():
+    spider = AirSpider()
+    pipeline = RecordingPipeline()
+    spider._item_buffer._pipelines = [pipeline]
+
+    # 请求处理完成，但解析出的数据还在ItemBuffer中没有入库
+    spider._memory_db.add(FakeRequest('a1', 'A'))
+    spider._memory_db.get()
+    spider._item_buffer.put_item(MemberLinkItem('https://fb.com/1'))
+    spider._memory_db.task_done()
+    assert not spider.all_thread_is_done()
+
+    spider._item_buffer.flush()
+    assert pipeline.saved == ['https://fb.com/1'] and spider.all_thread_is_done()
+
+
+def test_air_spider_done_after_stop_event():
+    stop_event = threading.Event()
+    spider = AirSpider(stop_event=stop_event)
+    spider._memory_db.add(FakeRequest('a1', 'A'))
+    spider._memory_db.add(FakeRequest('a2', 'B'))
+    assert not spider.all_thread_is_done()
+
+    # 停止后等采集线程都退出，剩下没处理的请求不再等待
+    stop_event.set()
+    release = threading.Event()
+    parser_control = threading.Thread(target=release.wait, args=(5,))
+    parser_control.start()
+    spider._parser_controls.append(parser_control)
+    try:
+        assert not spider.all_thread_is_done()
+    finally:
+        release.set()
+        parser_control.join()
+    assert spider.all_thread_is_done() and spider._task_counter.is_done()
+
+
+def test_processing_requests_shown_for_every_request():
+    shown = []
+    spider = AirSpider(request_to_str=lambda request: shown.append(request.url) or request.url)
+    # 同一个浏览器的请求依次开始处理，每个都要显示，不能因为ads_id绑定只显示第一个
+    for url in ('a1', 'a2', 'a3'):
+        spider._processing_requests.put(FakeRequest(url, 'A'))
+    spider.show_processing_requests()
+    assert shown == ['a1', 'a2', 'a3']
+
+    spider._processing_requests.put(FakeRequest('a4', 'A'))
+    spider.show_processing_requests()
+    assert shown == ['a1', 'a2', 'a3', 'a4'] and spider._processing_count == 4
+    assert spider._task_counter.is_done()  # 显示用的队列不计入任务数
+
+
+if __name__ == '__main__':
+    print("=" * 80)
+    print("🧪 Scheduler / Request Queue Testing")
+    print("=" * 80)
+
+    failed = 0
+    for name, func in list(globals().items()):
+        if name.startswith('test_') and callable(func):
+            try:
+                func()
+                print(f"✅ PASS | {name}")
+            except Exception as e:
+                failed += 1
+                print(f"❌ FAIL | {name} | {e!r}")
+
+    sys.exit(0 if failed == 0 else 1)
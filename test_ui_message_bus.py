@@ -0,0 +1,126 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+UI Message Bus Testing
+Tests the cached QTextBrowser lookup, coalescing, frame-rate limited flushes and the capped backlog
+"""
+
+import os
+import sys
+import threading
+import time
+
+# Set up paths
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+from autoads.ui_message_bus import UiMessageBus
+
+
+class FakeSignal:
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, browser, text):
+        self.emitted.append((browser, text))
+
+
+class FakeMs:
+    def __init__(self):
+        self.text_print = FakeSignal()
+
+
+class FakeUi:
+    """按objectName查找，记录查找次数"""
+
+    def __init__(self, names):
+        self.browsers = {name: f'browser:{name}' for name in names}
+        self.lookups = 0
+
+    def findChildren(self, cls, name):
+        self.lookups += 1
+        return [self.browsers[name]] if name in self.browsers else []
+
+
+def run_in_thread(name, func):
+    thread = threading.Thread(target=func, name=name)
+    thread.start()
+    thread.join()
+
+
+def test_lookup_cached_per_thread():
+    bus = UiMessageBus(frame_interval=0.01)
+    ui, ms = FakeUi(['worker1', 'worker2']), FakeMs()
+
+    for name in ('worker1', 'worker2'):
+        run_in_thread(name, lambda: [bus.send(ms, ui, f'请求{i}') for i in range(100)])
+    run_in_thread('unknown', lambda: [bus.send(ms, ui, '没有对应的窗口') for i in range(3)])
+    assert bus.flush()
+
+    # 找到的线程只查找一次；没找到的线程每次都重新查找（两种名字各一次）
+    assert ui.lookups == 2 + 3 * 2
+    browsers = {browser for browser, _ in ms.text_print.emitted}
+    assert browsers == {'browser:worker1', 'browser:worker2'}
+    texts = ''.join(text for _, text in ms.text_print.emitted)
+    assert all(f'请求{i}' in texts for i in range(100))
+    assert bus.get_stats()['messages'] == 200
+
+
+def test_coalesce_and_frame_rate():
+    bus = UiMessageBus(frame_interval=0.2)
+    ui, ms = FakeUi(['worker1']), FakeMs()
+
+    def work():
+        bus.send(ms, ui, '第一条')  # 立即发送
+        time.sleep(0.05)
+        for i in range(500):
+            bus.send(ms, ui, '采集中...')
+        bus.send(ms, ui, '最后一条')
+
+    run_in_thread('worker1', work)
+    assert bus.flush()
+
+    # 第一帧之后的消息在下一帧合并成一个信号
+    assert [text for _, text in ms.text_print.emitted][0] == '第一条'
+    assert len(ms.text_print.emitted) == 2
+    second = ms.text_print.emitted[1][1]
+    assert second.startswith('采集中... <font color="#999999">(×500)</font><br>') and second.endswith('最后一条')
+    stats = bus.get_stats()
+    assert stats['merged'] == 499 and stats['signals'] == 2 and stats['pending'] == 0
+
+
+def test_backlog_capped():
+    bus = UiMessageBus(frame_interval=0.3, max_backlog=10)
+    ui, ms = FakeUi(['worker1']), FakeMs()
+
+    def work():
+        bus.send(ms, ui, 'start')
+        time.sleep(0.05)
+        for i in range(50):
+            bus.send(ms, ui, f'消息{i}')
+
+    run_in_thread('worker1', work)
+    assert bus.flush()
+
+    text = ms.text_print.emitted[-1][1]
+    assert text.startswith('<font color="#999999">界面消息过多，省略了40条</font>')
+    assert '消息39' not in text and '消息40' in text and text.endswith('消息49')
+    assert bus.get_stats()['dropped'] == 40
+
+
+if __name__ == '__main__':
+    print("=" * 80)
+    print("🧪 UI Message Bus Testing")
+    print("=" * 80)
+
+    failed = 0
+    for name, func in list(globals().items()):
+        if name.startswith('test_') and callable(func):
+            try:
+                func()
+                print(f"✅ PASS | {name}")
+            except Exception as e:
+                failed += 1
+                print(f"❌ FAIL | {name} | {e!r}")
+
+    sys.exit(0 if failed == 0 else 1)